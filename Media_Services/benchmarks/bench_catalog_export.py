@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录导出格式基准测试
+对比 /media JSON（预编码片段拼接） 与 /media.bin 二进制列式格式 的大小与编解码耗时
+
+用法: python benchmarks/bench_catalog_export.py [--sizes 10000 100000]
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_catalog import MediaEntry, CatalogExporter, build_list_body, decode_catalog_bin, encode_fragments
+
+ROOT = os.path.join(os.sep, "data", "Downloads")
+
+
+def make_entries(count):
+    """生成模拟媒体条目"""
+    return [
+        MediaEntry(ROOT, f"收藏/dir_{i % 500:03d}/sub_{i % 7}/媒体文件_{i:07d}.{'png' if i % 3 else 'webm'}",
+                   1024 + i * 37 % 5_000_000, "video" if i % 3 == 0 else "image", 1_700_000_000.0 + i * 1.5)
+        for i in range(count)
+    ]
+
+
+def timed(func, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="目录导出格式基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'条目数':>9} | {'格式':<6} | {'大小(KB)':>10} | {'gzip(KB)':>9} | {'编码(ms)':>9} | {'解码(ms)':>9}")
+    print("-" * 70)
+    for size in args.sizes:
+        entries = make_entries(size)
+        meta = {"total_count": size, "filtered_count": size}
+
+        json_time, json_body = timed(lambda: build_list_body(encode_fragments(entries), meta), args.repeat)
+        json_decode, _ = timed(lambda: json.loads(json_body), args.repeat)
+
+        exporter = CatalogExporter()
+        bin_time, bin_body = timed(lambda: exporter.encode(entries, 1, ROOT), args.repeat)
+        bin_decode, _ = timed(lambda: decode_catalog_bin(bin_body), args.repeat)
+
+        for label, body, enc, dec in (("json", json_body, json_time, json_decode),
+                                      ("bin", bin_body, bin_time, bin_decode)):
+            print(f"{size:>9} | {label:<6} | {len(body) / 1024:>10.1f} | "
+                  f"{len(gzip.compress(body, 6)) / 1024:>9.1f} | {enc * 1000:>9.1f} | {dec * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/file 请求延迟基准测试
+对比三条路径的单请求延迟：热缓存命中、目录索引命中（一次fstat）、未入库文件的完整检查
+
+用法: python benchmarks/bench_file_serving.py [--files 2000 --requests 20000 --size 65536]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(client, paths, requests):
+    """逐个请求并记录延迟（微秒）"""
+    samples = []
+    for _ in range(requests):
+        url = "/file/" + random.choice(paths)
+        start = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} 状态码 {response.status_code}")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/file 请求延迟基准测试")
+    parser.add_argument("--files", type=int, default=2000, help="文件数")
+    parser.add_argument("--requests", type=int, default=20000, help="每种路径的请求数")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="单个文件大小（字节）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="st_file_bench_")
+    media_dir = os.path.join(workdir, "media")
+    paths = []
+    payload = os.urandom(args.size)
+    for i in range(args.files):
+        rel_path = f"dir_{i % 40:02d}/图片_{i:06d}.png"
+        os.makedirs(os.path.join(media_dir, os.path.dirname(rel_path)), exist_ok=True)
+        with open(os.path.join(media_dir, rel_path), "wb") as f:
+            f.write(payload)
+        paths.append(rel_path)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with open("local_image_service_config.json", "w", encoding="utf-8") as f:
+            json.dump({"scan_directory": media_dir}, f)
+
+        import logging
+        from image_service_optimized import MediaService
+        logging.getLogger().setLevel(logging.WARNING)
+
+        service = MediaService()
+        client = service.app.test_client()
+        results = []
+
+        # 未入库：目录为空，每个请求走完整的路径检查
+        service.file_cache.max_bytes = 0
+        results.append(("完整检查", measure(client, paths, args.requests)))
+
+        # 目录索引命中：热缓存关闭
+        service.update_db_incremental()
+        results.append(("目录索引", measure(client, paths, args.requests)))
+
+        # 热缓存命中：先预热
+        service.file_cache.max_bytes = max(args.files * args.size * 2, 1)
+        for rel_path in paths:
+            client.get("/file/" + rel_path)
+        results.append(("热缓存", measure(client, paths, args.requests)))
+
+        print(f"文件数: {args.files} | 文件大小: {args.size} 字节 | 每种路径请求数: {args.requests}")
+        print(f"{'路径':<8} | {'p50(µs)':>9} | {'p99(µs)':>9} | {'平均(µs)':>9}")
+        print("-" * 46)
+        for label, samples in results:
+            print(f"{label:<8} | {percentile(samples, 50):>9.1f} | {percentile(samples, 99):>9.1f} | "
+                  f"{sum(samples) / len(samples):>9.1f}")
+        print(f"热缓存统计: {service.file_cache.get_metrics()}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/media 响应构建基准测试
+对比 jsonify 全量编码 与 当前实现（条目保存预编码尾部，生成列表时拼接路径/文件名前缀再合并）的耗时；
+"预编码一次" 为插入时生成全部条目（含尾部）的耗时
+
+用法: python benchmarks/bench_json_serialization.py [--sizes 10000 100000 1000000]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from media_catalog import MediaEntry, build_list_body, encode_fragments, orjson
+
+
+def make_entries(count):
+    """生成模拟媒体条目"""
+    entries = []
+    for i in range(count):
+        rel_path = f"dir_{i % 500:03d}/sub_{i % 7}/媒体文件_{i:07d}.{'png' if i % 3 else 'webm'}"
+        entries.append({
+            "path": "/data/Downloads/" + rel_path,
+            "rel_path": rel_path,
+            "name": rel_path.rsplit("/", 1)[-1],
+            "size": 1024 + i * 37 % 5_000_000,
+            "media_type": "video" if i % 3 == 0 else "image",
+            "last_modified": 1_700_000_000.0 + i * 1.5,
+            "width": None,
+            "height": None,
+            "duration": None,
+            "codec": None
+        })
+    return entries
+
+
+def meta_for(entries):
+    return {
+        "total_count": len(entries),
+        "filtered_count": len(entries),
+        "image_count": sum(1 for m in entries if m["media_type"] == "image"),
+        "video_count": sum(1 for m in entries if m["media_type"] == "video"),
+        "last_updated": "2024-01-01 00:00:00"
+    }
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/media 响应构建基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    print(f"编码器: {'orjson' if orjson is not None else 'json (标准库)'}")
+    print(f"{'条目数':>10} | {'jsonify(s)':>11} | {'片段生成+拼接(s)':>11} | {'加速比':>7} | {'预编码一次(s)':>13} | {'响应大小(MB)':>12}")
+    print("-" * 84)
+
+    for size in args.sizes:
+        entries = make_entries(size)
+        meta = meta_for(entries)
+
+        def current_path():
+            with app.test_request_context():
+                return jsonify({"media": entries, **meta}).get_data()
+
+        encode_time, catalog_entries = best_of(lambda: [
+            MediaEntry("/data/Downloads", m["rel_path"], m["size"], m["media_type"], m["last_modified"])
+            for m in entries], 1)
+
+        def fragment_path():
+            return build_list_body(encode_fragments(catalog_entries), meta)
+
+        old_time, _ = best_of(current_path, args.repeat)
+        new_time, body = best_of(fragment_path, args.repeat)
+        print(f"{size:>10} | {old_time:>11.4f} | {new_time:>11.4f} | {old_time / new_time:>6.1f}x | "
+              f"{encode_time:>13.4f} | {len(body) / 1024 / 1024:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
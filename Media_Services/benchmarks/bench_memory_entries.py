@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体条目内存占用基准测试
+对比 原6字段字典条目 与 MediaEntry 紧凑条目 的每条目字节数
+
+用法: python benchmarks/bench_memory_entries.py [--count 200000]
+"""
+
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_catalog import MediaEntry, encode_entry
+
+ROOT = os.path.join(os.sep, "data", "Downloads")
+
+
+def iter_files(count):
+    """模拟 os.walk 产出：每次返回新分配的 (目录, 文件名) 字符串"""
+    for i in range(count):
+        rel_dir = f"收藏/dir_{i % 500:03d}/sub_{i % 7}"
+        name = f"媒体文件_{i:07d}.{'png' if i % 3 else 'webm'}"
+        yield os.path.join(ROOT, *rel_dir.split("/")), name, i
+
+
+def build_dicts(count, with_fragments):
+    """优化前：每条目一个字典（path / rel_path / name 各自独立存储）"""
+    db = []
+    fragments = {}
+    for root, name, i in iter_files(count):
+        full_path = os.path.join(root, name)
+        info = {
+            "path": full_path,
+            "rel_path": os.path.relpath(full_path, ROOT).replace("\\", "/"),
+            "name": os.path.basename(full_path),
+            "size": 1024 + i * 37 % 5_000_000,
+            "media_type": "video" if i % 3 == 0 else "image",
+            "last_modified": 1_700_000_000.0 + i * 1.5
+        }
+        db.append(info)
+        if with_fragments:
+            fragments[full_path] = encode_entry(info)
+    return db, fragments
+
+
+def build_entries(count):
+    """优化后：MediaEntry 紧凑条目（含预编码尾部，路径与文件名在生成列表时拼接）"""
+    db = []
+    for root, name, i in iter_files(count):
+        full_path = os.path.join(root, name)
+        rel_path = os.path.relpath(full_path, ROOT).replace("\\", "/")
+        db.append(MediaEntry(ROOT, rel_path, 1024 + i * 37 % 5_000_000,
+                             "video" if i % 3 == 0 else "image", 1_700_000_000.0 + i * 1.5))
+    return db
+
+
+def measure(builder, count):
+    tracemalloc.start()
+    result = builder()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="媒体条目内存占用基准测试")
+    parser.add_argument("--count", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rows = [
+        ("字典条目（无片段）", lambda: build_dicts(args.count, False)),
+        ("字典条目 + 片段字典", lambda: build_dicts(args.count, True)),
+        ("MediaEntry（含预编码尾部）", lambda: build_entries(args.count)),
+    ]
+    print(f"条目数: {args.count}")
+    for label, builder in rows:
+        per_entry = measure(builder, args.count)
+        print(f"{label:<20} {per_entry:>8.1f} 字节/条目  "
+              f"（100万条目约 {per_entry * 1_000_000 / 1024 / 1024:,.0f} MB）")
+
+
+if __name__ == "__main__":
+    main()
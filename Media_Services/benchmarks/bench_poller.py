@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轮询文件变化检测基准测试
+在临时目录生成合成媒体树（见 synthetic_media.py），测量 DirectoryPoller：
+  基线建立耗时；无变化时每轮的墙钟/CPU耗时（含与不含原地修改复查）；
+  新建/删除/原地修改文件后，需要几轮、多少时间才上报
+
+用法: python benchmarks/bench_poller.py [--files 100000 --depth 3 --fanout 8 --cycles 20 --verify-batch 2000]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_media import STUBS, generate_tree, make_directories
+from media_poller import COARSE_MTIME_NS, DirectoryPoller
+
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.apng',
+              '.webm', '.mp4', '.ogv', '.mov', '.avi', '.mkv')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def idle_cycles(poller, cycles):
+    """连续执行无变化的轮询，返回 (墙钟ms列表, CPU ms列表)"""
+    wall, cpu = [], []
+    for _ in range(cycles):
+        poller.poll()
+        wall.append(poller.metrics["last_cycle_ms"])
+        cpu.append(poller.metrics["last_cycle_cpu_ms"])
+    return wall, cpu
+
+
+def poll_until(poller, expected, max_cycles):
+    """轮询直到累计上报 expected 个变化，返回 (轮数, 总耗时ms)"""
+    reported = 0
+    start = time.perf_counter()
+    for cycle in range(1, max_cycles + 1):
+        created, modified, deleted = poller.poll()
+        reported += len(created) + len(modified) + len(deleted)
+        if reported >= expected:
+            return cycle, (time.perf_counter() - start) * 1000
+    return None, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="轮询文件变化检测基准测试")
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=3, help="目录层数")
+    parser.add_argument("--fanout", type=int, default=8, help="每层子目录数")
+    parser.add_argument("--cycles", type=int, default=20, help="无变化轮询的测量轮数")
+    parser.add_argument("--verify-batch", type=int, default=2000, help="每轮复查的已知文件数")
+    parser.add_argument("--changes", type=int, default=50, help="每类变化的文件数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="st_bench_poller_")
+    try:
+        start = time.perf_counter()
+        rel_paths = generate_tree(workdir, args.files, args.depth, args.fanout, seed=args.seed)
+        directories = make_directories(args.depth, args.fanout)
+        print(f"合成目录: {len(rel_paths)} 个文件 / {len(directories)} 个目录（{time.perf_counter() - start:.1f}s）")
+        # 目录mtime过新时每轮都会重新列举：等过粗粒度时间窗口，测的是稳定状态
+        time.sleep(COARSE_MTIME_NS / 1e9)
+
+        poller = DirectoryPoller(workdir, EXTENSIONS, lambda *changes: None, verify_batch=args.verify_batch)
+        poller.build_baseline()
+        print(f"基线建立: {poller.metrics['baseline_ms']:.0f}ms")
+
+        print(f"{'场景':<28}{'墙钟p50':>10}{'墙钟max':>10}{'CPU p50':>10}{'CPU max':>10}")
+        for label, batch in ((f"无变化（复查{args.verify_batch}个/轮）", args.verify_batch), ("无变化（仅目录stat）", 0)):
+            poller.verify_batch = batch
+            wall, cpu = idle_cycles(poller, args.cycles)
+            print(f"{label:<24}{percentile(wall, 50):>9.1f}ms{max(wall):>8.1f}ms"
+                  f"{percentile(cpu, 50):>8.1f}ms{max(cpu):>8.1f}ms")
+        poller.verify_batch = args.verify_batch
+
+        # 新建：分散到多个目录
+        for i in range(args.changes):
+            rel_dir = directories[i * 7 % len(directories)]
+            with open(os.path.join(workdir, rel_dir, f"poll_new_{i:05d}.png"), "wb") as f:
+                f.write(STUBS[".png"])
+        cycles, elapsed = poll_until(poller, args.changes, 10)
+        print(f"新建{args.changes}个: {cycles}轮 / {elapsed:.1f}ms")
+
+        # 删除
+        for rel_path in rel_paths[:args.changes]:
+            os.remove(os.path.join(workdir, rel_path))
+        cycles, elapsed = poll_until(poller, args.changes, 10)
+        print(f"删除{args.changes}个: {cycles}轮 / {elapsed:.1f}ms")
+
+        # 原地修改：目录mtime不变，只能由轮换复查发现，最坏需要 文件数/复查批量 轮
+        for rel_path in rel_paths[args.changes:args.changes * 2]:
+            with open(os.path.join(workdir, rel_path), "ab") as f:
+                f.write(b"\0")
+        max_cycles = len(rel_paths) // max(1, args.verify_batch) + 3
+        cycles, elapsed = poll_until(poller, args.changes, max_cycles)
+        print(f"原地修改{args.changes}个: {cycles}轮 / {elapsed:.1f}ms（最坏 {max_cycles} 轮）")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名搜索索引基准测试
+生成模拟文件名，测量索引构建耗时、增量更新速度，以及各类查询（单词/多词/短前缀/错字/编号）的延迟分布
+
+用法: python benchmarks/bench_search.py [--entries 1000000 --queries 200]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_catalog import MediaEntry
+from media_search import SearchIndex
+
+ROOT = os.path.join(os.sep, "data", "Downloads")
+SYLLABLES = ["ka", "ri", "mo", "na", "shi", "to", "ya", "ze", "lu", "bel", "sun", "set", "cat", "ion",
+             "ar", "vel", "dor", "pix", "mar", "tes"]
+
+
+def make_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_entries(count, vocabulary, rng):
+    entries = []
+    for i in range(count):
+        w1, w2 = rng.choice(vocabulary), rng.choice(vocabulary)
+        ext, media_type = (".mp4", "video") if i % 5 == 0 else (".jpg", "image")
+        rel_path = (f"album_{i % 997:03d}/{rng.choice(vocabulary)}/"
+                    f"{w1}_{w2}_{2015 + i % 10}{i % 12 + 1:02d}{i % 28 + 1:02d}_{i:07d}{ext}")
+        entries.append(MediaEntry(ROOT, rel_path, 1024 + i, media_type, 1_700_000_000.0 + i))
+    return entries
+
+
+def make_typo(word, rng):
+    """交换相邻两个字母"""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件名搜索索引基准测试")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=5000, help="模拟词汇量")
+    parser.add_argument("--queries", type=int, default=200, help="每类查询数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    start = time.perf_counter()
+    entries = make_entries(args.entries, vocabulary, rng)
+    print(f"生成条目: {len(entries)} 个（{time.perf_counter() - start:.1f}s）")
+
+    start = time.perf_counter()
+    index = SearchIndex(entries)
+    print(f"索引构建: {time.perf_counter() - start:.1f}s | 词表: {len(index._vocabulary)} 个")
+
+    # 增量更新：删除并重新加入（模拟watchdog事件）
+    sample = rng.sample(entries, min(20000, len(entries)))
+    start = time.perf_counter()
+    for entry in sample:
+        index.remove(entry)
+    for entry in sample:
+        index.add(entry)
+    elapsed = time.perf_counter() - start
+    print(f"增量更新: {len(sample) * 2 / elapsed:,.0f} 次/秒")
+
+    query_sets = {
+        "单词": lambda: rng.choice(vocabulary),
+        "两个词": lambda: f"{rng.choice(vocabulary)} {rng.choice(vocabulary)[:4]}",
+        "短前缀": lambda: rng.choice(vocabulary)[:2],
+        "错字": lambda: make_typo(rng.choice(vocabulary), rng),
+        "编号": lambda: f"{rng.randrange(args.entries):07d}",
+        "目录+词": lambda: f"album_{rng.randrange(997):03d} {rng.choice(vocabulary)}",
+    }
+
+    print(f"\n{'查询类型':<8} | {'平均结果数':>9} | {'p50(ms)':>8} | {'p99(ms)':>8} | {'最大(ms)':>8}")
+    print("-" * 56)
+    for label, make_query in query_sets.items():
+        samples, totals = [], []
+        for _ in range(args.queries):
+            query = make_query()
+            start = time.perf_counter()
+            total, _, _ = index.search(query, limit=50)
+            samples.append((time.perf_counter() - start) * 1000)
+            totals.append(total)
+        print(f"{label:<8} | {sum(totals) / len(totals):>9.1f} | {percentile(samples, 50):>8.2f} | "
+              f"{percentile(samples, 99):>8.2f} | {max(samples):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
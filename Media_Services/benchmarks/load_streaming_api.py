@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式传输负载测试
+在子进程中启动服务（gevent pywsgi），同时用多个客户端持续下载大视频，
+测量 /media 与 /status 的API延迟（p50/p99），并与无下载时对比
+
+用法: python benchmarks/load_streaming_api.py [--streams 10 --video-mb 200 --duration 15]
+      加 --no-streaming 可对比关闭线程池流式传输（直接文件迭代）时的表现
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+def serve(workdir, port):
+    """子进程：在工作目录中启动服务"""
+    os.chdir(workdir)
+    import logging
+    from gevent import pywsgi
+    from geventwebsocket.handler import WebSocketHandler
+    from image_service_optimized import MediaService
+    logging.getLogger().setLevel(logging.WARNING)
+
+    service = MediaService()
+    service.update_db_incremental()
+    server = pywsgi.WSGIServer(("127.0.0.1", port), service.app, handler_class=WebSocketHandler, log=None)
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/status")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("服务启动超时")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def api_client(port, stop, samples):
+    """API客户端：交替请求 /media 与 /status 并记录延迟（毫秒）"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    paths = ("/media", "/status")
+    count = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.request("GET", paths[count % 2])
+        conn.getresponse().read()
+        samples.append((time.perf_counter() - start) * 1000)
+        count += 1
+        time.sleep(0.01)
+
+
+def stream_client(port, path, stop, totals):
+    """下载客户端：循环完整下载视频"""
+    received = 0
+    while not stop.is_set():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        conn.request("GET", path)
+        response = conn.getresponse()
+        while not stop.is_set():
+            chunk = response.read(256 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+        conn.close()
+    totals.append(received)
+
+
+def run_phase(port, streams, duration, video_paths):
+    stop = threading.Event()
+    samples, totals = [], []
+    threads = [threading.Thread(target=api_client, args=(port, stop, samples))]
+    threads += [threading.Thread(target=stream_client, args=(port, video_paths[i % len(video_paths)], stop, totals))
+                for i in range(streams)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return samples, sum(totals) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式传输负载测试")
+    parser.add_argument("--streams", type=int, default=10, help="并发下载数")
+    parser.add_argument("--video-mb", type=int, default=200, help="每个测试视频大小（MB）")
+    parser.add_argument("--videos", type=int, default=4, help="测试视频数量")
+    parser.add_argument("--entries", type=int, default=2000, help="目录中的图片条目数（影响 /media 响应大小）")
+    parser.add_argument("--duration", type=float, default=15.0, help="每个阶段时长（秒）")
+    parser.add_argument("--client-limit-mb", type=float, default=0, help="每客户端带宽上限（MB/s）")
+    parser.add_argument("--no-streaming", action="store_true", help="关闭线程池流式传输作为对照")
+    parser.add_argument("--serve", nargs=2, metavar=("WORKDIR", "PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]))
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="st_stream_load_")
+    media_dir = os.path.join(workdir, "media")
+    os.makedirs(os.path.join(media_dir, "images"))
+    os.makedirs(os.path.join(media_dir, "videos"))
+    for i in range(args.entries):
+        with open(os.path.join(media_dir, "images", f"img_{i:06d}.png"), "wb") as f:
+            f.write(b"\0" * 64)
+    video_paths = []
+    block = os.urandom(1024 * 1024)
+    for i in range(args.videos):
+        with open(os.path.join(media_dir, "videos", f"video_{i}.mp4"), "wb") as f:
+            for _ in range(args.video_mb):
+                f.write(block)
+        video_paths.append(f"/file/videos/video_{i}.mp4")
+
+    config = {
+        "scan_directory": media_dir,
+        "video_max_size_mb": args.video_mb + 1,
+        "stream_client_limit_mb": args.client_limit_mb
+    }
+    if args.no_streaming:
+        config["stream_min_size_kb"] = (args.video_mb + 1) * 1024
+    with open(os.path.join(workdir, "local_image_service_config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", workdir, str(port)],
+                              cwd=SERVICE_DIR)
+    try:
+        wait_ready(port)
+        mode = "直接文件迭代" if args.no_streaming else "线程池流式传输"
+        print(f"模式: {mode} | 并发下载: {args.streams} | 视频: {args.videos}×{args.video_mb}MB | "
+              f"目录条目: {args.entries + args.videos}")
+        print(f"{'阶段':<10} | {'请求数':>6} | {'p50(ms)':>8} | {'p99(ms)':>8} | {'最大(ms)':>8} | {'下载(MB/s)':>10}")
+        print("-" * 68)
+        for label, streams in (("仅API", 0), (f"API+{args.streams}流", args.streams)):
+            samples, throughput = run_phase(port, streams, args.duration, video_paths)
+            print(f"{label:<10} | {len(samples):>6} | {percentile(samples, 50):>8.1f} | "
+                  f"{percentile(samples, 99):>8.1f} | {max(samples):>8.1f} | {throughput / 1024 / 1024:>10.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
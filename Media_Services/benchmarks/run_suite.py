@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可复现的基准测试套件
+在临时目录生成合成媒体树（见 synthetic_media.py），依次测量：
+  scan      全量扫描 _scan_full_directory 的耗时与速度
+  watchdog  真实文件监控下新建N个文件到全部入库的耗时（含写入完成等待），以及不经监控的单文件增量入库耗时
+  api       /media、/random-media、/status 的请求延迟（Flask测试客户端）
+  range     大视频分段Range请求的吞吐
+  history   MediaFileManager 观看历史的记录/统计/查询/导出/导入
+结果写入JSON；--compare 与保存的基线对比，超过阈值的退化以退出码1报告
+
+用法: python benchmarks/run_suite.py [--files 5000 --depth 3 --fanout 6] [--cases scan,api] [--output 结果.json]
+      python benchmarks/run_suite.py --compare 基线.json            # 运行并与基线对比
+      python benchmarks/run_suite.py --input 新结果.json --compare 基线.json  # 只对比两个已保存的结果
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_media import STUBS, generate_tree, make_directories, make_webm
+
+ALL_CASES = ("scan", "watchdog", "api", "range", "history")
+API_PATHS = ("/media", "/random-media", "/status")
+
+# 这些后缀的指标越大越好，其余（耗时/延迟）越小越好
+HIGHER_IS_BETTER = ("_per_sec", "_mb_s")
+# 计数类参数不参与对比；尾延迟受机器负载影响大，只显示不判定退化
+NOT_COMPARED = ("files", "ops", "requests", "chunk_kb")
+INFORMATIONAL = ("p99_us",)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize_us(samples):
+    """延迟样本（秒）→ 微秒统计"""
+    return {
+        "p50_us": round(percentile(samples, 50) * 1_000_000, 1),
+        "p99_us": round(percentile(samples, 99) * 1_000_000, 1),
+        "mean_us": round(sum(samples) / len(samples) * 1_000_000, 1),
+    }
+
+
+class Workspace:
+    """临时工作目录：合成媒体树 + 服务实例（配置文件写在工作目录中，不影响真实配置）"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="st_bench_suite_")
+        self.media_dir = os.path.join(self.workdir, "media")
+        self._cwd = os.getcwd()
+        self.service = None
+        self.client = None
+
+    def __enter__(self):
+        args = self.args
+        start = time.perf_counter()
+        self.rel_paths = generate_tree(self.media_dir, args.files, args.depth, args.fanout,
+                                       args.video_ratio, args.seed)
+        self.range_path = "range/large_sample.webm"
+        os.makedirs(os.path.join(self.media_dir, "range"), exist_ok=True)
+        with open(os.path.join(self.media_dir, self.range_path), "wb") as f:
+            f.write(make_webm(padding=args.range_mb * 1024 * 1024))
+        print(f"合成目录: {len(self.rel_paths)} 个文件 / {len(make_directories(args.depth, args.fanout))} 个目录"
+              f"（{time.perf_counter() - start:.1f}s）-> {self.media_dir}")
+
+        os.chdir(self.workdir)
+        with open("local_image_service_config.json", "w", encoding="utf-8") as f:
+            json.dump({"scan_directory": self.media_dir, "metadata_workers": 1, "watch_backend": "watchdog"}, f)
+        from image_service_optimized import MediaService
+        self.service = MediaService()
+        self.client = self.service.app.test_client()
+        return self
+
+    def ensure_scanned(self, timeout=300):
+        """目录为空时先扫描一次，并等待后台元数据提取完成，避免其与计时争抢CPU"""
+        if self.service.catalog.snapshot.total_count == 0:
+            self.service._scan_full_directory()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            metrics = self.service.metadata.get_metrics()
+            if metrics["extracted"] + metrics["failed"] >= metrics["queued"]:
+                break
+            time.sleep(0.1)
+        time.sleep(self.service.metadata.flush_interval * 2)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.service is not None and self.service.observer is not None:
+            self.service.observer.stop()
+            self.service.observer.join()
+        os.chdir(self._cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        return False
+
+
+def bench_scan(ws, args):
+    ws.ensure_scanned()  # 预热：元数据已持久化，计时的是稳定状态下的重新扫描
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        ws.service._scan_full_directory()
+        samples.append(time.perf_counter() - start)
+    count = ws.service.catalog.snapshot.total_count
+    return {"scan": {
+        "files": count,
+        "seconds_min": round(min(samples), 4),
+        "seconds_p50": round(percentile(samples, 50), 4),
+        "files_per_sec": round(count / min(samples), 1),
+    }}
+
+
+def bench_watchdog(ws, args):
+    service = ws.service
+    ws.ensure_scanned()
+    results = {}
+
+    # 不经监控：逐个文件增量入库（watchdog事件处理在等待写入完成之后的实际开销）
+    direct_dir = os.path.join(ws.media_dir, "direct_in")
+    os.makedirs(direct_dir)
+    paths = []
+    for i in range(args.watch_files * 10):
+        path = os.path.join(direct_dir, f"direct_{i:05d}.png")
+        with open(path, "wb") as f:
+            f.write(STUBS[".png"])
+        paths.append(path)
+    samples = []
+    for path in paths:
+        start = time.perf_counter()
+        service.update_db_incremental([path])
+        samples.append(time.perf_counter() - start)
+    results["watchdog incremental_update"] = summarize_us(samples)
+
+    # 真实监控：批量新建文件，等待全部入库
+    watch_dir = os.path.join(ws.media_dir, "watch_in")
+    os.makedirs(watch_dir)
+    service._setup_watchdog()
+    time.sleep(0.5)
+    expected = service.catalog.snapshot.total_count + args.watch_files
+    start = time.perf_counter()
+    for i in range(args.watch_files):
+        with open(os.path.join(watch_dir, f"watch_{i:05d}.jpg"), "wb") as f:
+            f.write(STUBS[".jpg"])
+    deadline = start + args.watch_timeout
+    while service.catalog.snapshot.total_count < expected and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    ingested = args.watch_files - (expected - service.catalog.snapshot.total_count)
+    service.observer.stop()
+    service.observer.join()
+    service.observer = None
+    if ingested < args.watch_files:
+        print(f"  watchdog: 超时，仅入库 {ingested}/{args.watch_files}")
+    results["watchdog ingest"] = {
+        "files": ingested,
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(ingested / elapsed, 2),
+    }
+    return results
+
+
+def bench_api(ws, args):
+    ws.ensure_scanned()
+    results = {}
+    for path in API_PATHS:
+        ws.client.get(path)  # 预热（首个请求生成响应缓存）
+        samples = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = ws.client.get(path)
+            response.get_data()
+            samples.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} 状态码 {response.status_code}")
+        results[f"api {path}"] = summarize_us(samples)
+    return results
+
+
+def bench_range(ws, args):
+    ws.ensure_scanned()
+    url = "/file/" + ws.range_path
+    size = os.path.getsize(os.path.join(ws.media_dir, ws.range_path))
+    chunk = args.range_chunk_kb * 1024
+    rng = random.Random(args.seed)
+    samples = []
+    total = 0
+    start = time.perf_counter()
+    while total < size * 2:
+        offset = rng.randrange(0, max(1, size - chunk))
+        t0 = time.perf_counter()
+        response = ws.client.get(url, headers={"Range": f"bytes={offset}-{offset + chunk - 1}"})
+        data = response.get_data()
+        samples.append(time.perf_counter() - t0)
+        if response.status_code != 206 or len(data) != chunk:
+            raise RuntimeError(f"Range请求异常: 状态码 {response.status_code}，长度 {len(data)}")
+        total += len(data)
+    elapsed = time.perf_counter() - start
+    return {"range": {
+        "chunk_kb": args.range_chunk_kb,
+        "requests": len(samples),
+        "throughput_mb_s": round(total / elapsed / 1024 / 1024, 1),
+        **summarize_us(samples),
+    }}
+
+
+def bench_history(ws, args):
+    from media_manager import MediaFileManager
+    manager = MediaFileManager(ws.media_dir, db_path=os.path.join(ws.workdir, "bench_history.db"))
+    rel_paths = ws.rel_paths[:args.history_files]
+    results = {}
+
+    for label in ("record_watch_new", "record_watch_repeat"):
+        start = time.perf_counter()
+        for rel_path in rel_paths:
+            manager.record_watch(rel_path)
+        elapsed = time.perf_counter() - start
+        results[label] = {"ops": len(rel_paths), "ops_per_sec": round(len(rel_paths) / elapsed, 1)}
+
+    operations = {
+        "watch_statistics": lambda: manager.get_watch_statistics(),
+        "find_for_deletion": lambda: manager.find_files_for_deletion({"min_watch_count": 1}),
+        "export_history": lambda: manager.export_watch_history(os.path.join(ws.workdir, "history_export.ndjson")),
+        # 导入刚导出的文件：每条记录都与已有记录合并
+        "import_history": lambda: manager.import_watch_history(os.path.join(ws.workdir, "history_export.ndjson")),
+    }
+    for label, operation in operations.items():
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            operation()
+            samples.append(time.perf_counter() - start)
+        results[label] = summarize_us(samples)
+    return {f"history {label}": metrics for label, metrics in results.items()}
+
+
+CASE_FUNCTIONS = {
+    "scan": bench_scan,
+    "watchdog": bench_watchdog,
+    "api": bench_api,
+    "range": bench_range,
+    "history": bench_history,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_cases(args, cases):
+    results = {}
+    with Workspace(args) as ws:
+        for case in cases:
+            print(f"运行: {case} ...")
+            start = time.perf_counter()
+            results.update(CASE_FUNCTIONS[case](ws, args))
+            print(f"  完成（{time.perf_counter() - start:.1f}s）")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cases": list(cases),
+            "params": {key: value for key, value in vars(args).items()
+                       if key not in ("output", "compare", "input", "cases", "threshold")},
+        },
+        "results": results,
+    }
+
+
+def print_results(report):
+    print(f"\n{'测试项':<32} | {'指标':<16} | {'数值':>12}")
+    print("-" * 66)
+    for name, metrics in report["results"].items():
+        for key, value in metrics.items():
+            print(f"{name:<32} | {key:<16} | {value:>12}")
+
+
+def compare(baseline, current, threshold):
+    """逐项对比，返回退化项列表；只比较两边都有的耗时/速度指标（尾延迟仅显示）"""
+    if baseline["meta"].get("params") != current["meta"].get("params"):
+        print("注意: 基线与本次的测试参数不同，结果可能不可比")
+    regressions = []
+    print(f"\n{'测试项':<32} | {'指标':<16} | {'基线':>12} | {'本次':>12} | {'变化':>8}")
+    print("-" * 92)
+    for name, metrics in current["results"].items():
+        base_metrics = baseline["results"].get(name, {})
+        for key, value in metrics.items():
+            base = base_metrics.get(key)
+            if not isinstance(base, (int, float)) or not base or key in NOT_COMPARED:
+                continue
+            change = (value - base) / base
+            worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+            mark = "  ← 退化" if worse > threshold else ("  ↑" if worse < -threshold else "")
+            if key in INFORMATIONAL:
+                mark = "  (仅参考)" if mark else ""
+            elif worse > threshold:
+                regressions.append((name, key, base, value))
+            print(f"{name:<32} | {key:<16} | {base:>12} | {value:>12} | {change:>+7.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Media_Services 基准测试套件")
+    parser.add_argument("--cases", default=",".join(ALL_CASES), help=f"逗号分隔，可选: {','.join(ALL_CASES)}")
+    parser.add_argument("--files", type=int, default=5000, help="合成文件数")
+    parser.add_argument("--depth", type=int, default=3, help="目录层数")
+    parser.add_argument("--fanout", type=int, default=6, help="每层子目录数")
+    parser.add_argument("--video-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="扫描/历史查询的重复次数")
+    parser.add_argument("--requests", type=int, default=2000, help="每个API的请求数")
+    parser.add_argument("--watch-files", type=int, default=10,
+                        help="监控测试新建的文件数（每个事件含约1.5秒写入完成等待）")
+    parser.add_argument("--watch-timeout", type=float, default=120)
+    parser.add_argument("--range-mb", type=int, default=64, help="Range测试视频大小（MB）")
+    parser.add_argument("--range-chunk-kb", type=int, default=1024, help="每个Range请求的长度（KB）")
+    parser.add_argument("--history-files", type=int, default=500, help="写入观看历史的文件数")
+    parser.add_argument("--output", help="结果JSON路径（默认 bench_results_时间.json）")
+    parser.add_argument("--input", help="不运行测试，读取已保存的结果（配合 --compare）")
+    parser.add_argument("--compare", help="基线结果JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定退化的相对变化（默认10%%）")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    else:
+        cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+        unknown = [case for case in cases if case not in CASE_FUNCTIONS]
+        if unknown:
+            parser.error(f"未知测试项: {', '.join(unknown)}")
+        logging.getLogger().setLevel(logging.WARNING)
+        report = run_cases(args, cases)
+        output = args.output or f"bench_results_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print_results(report)
+        print(f"\n结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项退化超过 {args.threshold:.0%}")
+            return 1
+        print("\n未发现超过阈值的退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
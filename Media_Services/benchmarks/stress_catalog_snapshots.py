@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录快照并发压力测试
+写线程持续入库/删除文件（经由watchdog处理路径），多个读线程同时请求 /media 与 /random-media，
+校验每个响应内部一致（无撕裂读取），并对比有无写入时的读吞吐
+
+用法: python benchmarks/stress_catalog_snapshots.py [--base 5000 --churn 10000 --readers 4]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeEvent:
+    """模拟watchdog事件"""
+    def __init__(self, src_path):
+        self.src_path = src_path
+        self.is_directory = False
+
+
+def write_file(path, size=64):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+
+
+def check_media_body(body, full, errors):
+    """校验 /media 响应体内部一致
+
+    常规请求只解析尾部统计字段并统计条目数（避免读线程长时间占用GIL），
+    full=True 时完整解析并检查重复条目
+    """
+    tail = body.rfind(b'],"')
+    meta = json.loads(b"{" + body[tail + 2:])
+    entry_count = body.count(b'{"path"')
+    if meta["filtered_count"] != entry_count:
+        errors.append(f"filtered_count={meta['filtered_count']} 实际={entry_count}")
+    if meta["image_count"] + meta["video_count"] != meta["total_count"]:
+        errors.append(f"计数不一致: {meta['image_count']}+{meta['video_count']}!={meta['total_count']}")
+    if full:
+        media = json.loads(body)["media"]
+        if len({m["rel_path"] for m in media}) != len(media):
+            errors.append("重复条目")
+
+
+def reader(client, stop, stats, errors):
+    """读线程：交替请求 /media 与 /random-media 并校验一致性"""
+    count = 0
+    while not stop.is_set():
+        check_media_body(client.get("/media").data, count % 100 == 0, errors)
+
+        response = client.get("/random-media")
+        if response.status_code not in (200, 404):
+            errors.append(f"/random-media 状态码 {response.status_code}")
+        count += 2
+    stats.append(count)
+
+
+def run_readers(service, readers, duration, writer=None):
+    stop = threading.Event()
+    stats, errors = [], []
+    threads = [threading.Thread(target=reader, args=(service.app.test_client(), stop, stats, errors))
+               for _ in range(readers)]
+    for t in threads:
+        t.start()
+
+    start = time.perf_counter()
+    if writer is not None:
+        writer()
+    else:
+        time.sleep(duration)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(stats) / elapsed, elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="目录快照并发压力测试")
+    parser.add_argument("--base", type=int, default=5000, help="初始文件数")
+    parser.add_argument("--churn", type=int, default=10000, help="写线程创建并删除的文件数")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0, help="纯读阶段时长（秒）")
+    args = parser.parse_args()
+
+    # 缩短GIL切换间隔，避免写线程每次系统调用后长时间等待读线程释放GIL
+    sys.setswitchinterval(0.001)
+
+    workdir = tempfile.mkdtemp(prefix="st_stress_")
+    media_dir = os.path.join(workdir, "media")
+    os.makedirs(media_dir)
+    for i in range(args.base):
+        sub = os.path.join(media_dir, f"dir_{i % 50:02d}")
+        os.makedirs(sub, exist_ok=True)
+        write_file(os.path.join(sub, f"base_{i:06d}.{'png' if i % 3 else 'webm'}"))
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with open("local_image_service_config.json", "w", encoding="utf-8") as f:
+            json.dump({"scan_directory": media_dir}, f)
+
+        import logging
+        from image_service_optimized import MediaService, MediaDBHandler
+        logging.getLogger().setLevel(logging.WARNING)
+
+        service = MediaService()
+        service.update_db_incremental()
+        handler = MediaDBHandler(service)
+        # 预先在磁盘上创建变动文件（不计入写入阶段），写线程只负责入库与删除事件
+        churn_dir = os.path.join(media_dir, "churn")
+        os.makedirs(churn_dir)
+        churn_paths = [os.path.join(churn_dir, f"churn_{i:06d}.{'jpg' if i % 2 else 'mp4'}")
+                       for i in range(args.churn)]
+        for path in churn_paths:
+            write_file(path)
+
+        def writer():
+            """写入阶段：逐个入库，保持最多100个变动文件，其余逐个触发删除"""
+            live = []
+            for path in churn_paths:
+                service.update_db_incremental([path])
+                live.append(path)
+                if len(live) > 100:
+                    handler.on_deleted(FakeEvent(live.pop(0)))
+            for path in live:
+                handler.on_deleted(FakeEvent(path))
+
+        print(f"初始条目: {service.catalog.snapshot.total_count} | 读线程: {args.readers}")
+        idle_rate, _, idle_errors = run_readers(service, args.readers, args.duration)
+        print(f"纯读:     {idle_rate:>9.1f} 请求/秒")
+
+        busy_rate, elapsed, busy_errors = run_readers(service, args.readers, args.duration, writer)
+        writes_per_sec = args.churn * 2 / elapsed
+        print(f"读+写:    {busy_rate:>9.1f} 请求/秒（写入 {writes_per_sec:.0f} 次/秒，"
+              f"最终版本号 {service.catalog.revision}）")
+        if idle_rate:
+            print(f"读吞吐保持: {busy_rate / idle_rate:.0%}")
+
+        errors = idle_errors + busy_errors
+        final = service.catalog.snapshot.total_count
+        if final != args.base:
+            errors.append(f"最终条目数 {final} != {args.base}")
+        if errors:
+            print(f"✗ 发现 {len(errors)} 处不一致，例如: {errors[:5]}")
+            return 1
+        print("✓ 未发现撕裂读取")
+        return 0
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
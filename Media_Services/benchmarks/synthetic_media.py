@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成媒体目录生成器（基准测试用）
+在指定目录下按 深度 × 每层子目录数 生成目录树，写入极小但格式合法的 PNG / JPEG / WebM 文件：
+PNG 为1×1像素；JPEG 为Pillow生成的1×1灰度图；WebM 为单帧VP8容器（ffprobe可读出尺寸与时长，帧数据仅为占位）
+
+用法: python benchmarks/synthetic_media.py 目标目录 [--files 10000 --depth 3 --fanout 6]
+"""
+
+import os
+import sys
+import zlib
+import struct
+import random
+import argparse
+
+# 1×1 灰度JPEG（Pillow生成，quality=50, optimize=True）
+JPEG_STUB = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300100b0c0e0c0a100e0d0e1211101318281a18161618"
+    "3123251d283a333d3c3933383740485c4e404457453738506d51575f626768673e4d71797064785c656763ffc000"
+    "0b080001000101011100ffc40014000100000000000000000000000000000000ffc4001410010000000000000000"
+    "0000000000000000ffda0008010100003f003fffd9"
+)
+
+NAME_WORDS = ["sunset", "beach", "cat", "portrait", "clip", "travel", "night", "city", "snow", "forest",
+              "图片", "视频", "风景", "合集"]
+
+
+def make_png(width=1, height=1, rgb=(255, 0, 0)):
+    """最小PNG：8位RGB，单色像素"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    raw = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+def _ebml(element_id, payload):
+    """EBML元素：ID + 8字节长度 + 内容"""
+    return element_id + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def _uint(value):
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+
+
+def make_webm(width=16, height=16, duration_ms=40.0, padding=0):
+    """单帧VP8 WebM；padding>0 时在末尾追加Void元素把文件撑到约 padding 字节（Range测试用大文件）"""
+    header = _ebml(b"\x1a\x45\xdf\xa3", b"".join([
+        _ebml(b"\x42\x86", _uint(1)),       # EBMLVersion
+        _ebml(b"\x42\xf7", _uint(1)),       # EBMLReadVersion
+        _ebml(b"\x42\xf2", _uint(4)),       # EBMLMaxIDLength
+        _ebml(b"\x42\xf3", _uint(8)),       # EBMLMaxSizeLength
+        _ebml(b"\x42\x82", b"webm"),        # DocType
+        _ebml(b"\x42\x87", _uint(2)),       # DocTypeVersion
+        _ebml(b"\x42\x85", _uint(2)),       # DocTypeReadVersion
+    ]))
+    info = _ebml(b"\x15\x49\xa9\x66", b"".join([
+        _ebml(b"\x2a\xd7\xb1", _uint(1_000_000)),           # TimecodeScale（1ms）
+        _ebml(b"\x44\x89", struct.pack(">d", duration_ms)),  # Duration
+        _ebml(b"\x4d\x80", b"synthetic_media"),              # MuxingApp
+        _ebml(b"\x57\x41", b"synthetic_media"),              # WritingApp
+    ]))
+    tracks = _ebml(b"\x16\x54\xae\x6b", _ebml(b"\xae", b"".join([
+        _ebml(b"\xd7", _uint(1)),           # TrackNumber
+        _ebml(b"\x73\xc5", _uint(1)),       # TrackUID
+        _ebml(b"\x83", _uint(1)),           # TrackType: video
+        _ebml(b"\x86", b"V_VP8"),           # CodecID
+        _ebml(b"\xe0", _ebml(b"\xb0", _uint(width)) + _ebml(b"\xba", _uint(height))),
+    ])))
+    # VP8关键帧：帧标记(3字节) + 起始码 + 宽高；其余分区数据为占位
+    partition = bytes(16)
+    tag = (len(partition) << 5) | 0x10  # key_frame=0, version=0, show_frame=1
+    frame = tag.to_bytes(3, "little") + b"\x9d\x01\x2a" + struct.pack("<HH", width, height) + partition
+    block = b"\x81" + struct.pack(">hB", 0, 0x80) + frame  # 轨道1，时间码0，关键帧
+    cluster = _ebml(b"\x1f\x43\xb6\x75", _ebml(b"\xe7", _uint(0)) + _ebml(b"\xa3", block))
+    body = info + tracks + cluster
+    filler = padding - len(header) - len(body) - 21
+    if filler > 0:
+        body += _ebml(b"\xec", bytes(filler))  # Void
+    return header + _ebml(b"\x18\x53\x80\x67", body)
+
+
+STUBS = {".png": make_png(), ".jpg": JPEG_STUB, ".webm": make_webm()}
+
+
+def make_directories(depth, fanout):
+    """生成目录相对路径列表（含根目录 ""），每层 fanout 个子目录"""
+    directories = [""]
+    level = [""]
+    for d in range(depth):
+        level = [f"{parent}/d{d}_{i:02d}".lstrip("/") for parent in level for i in range(fanout)]
+        directories.extend(level)
+    return directories
+
+
+def generate_tree(root, files=10000, depth=3, fanout=6, video_ratio=0.2, seed=42):
+    """在 root 下生成合成媒体目录树，返回文件相对路径列表（"/"分隔）
+
+    文件随机分布到所有目录，约 video_ratio 比例为WebM，其余PNG/JPEG各半；同一seed结果可复现
+    """
+    rng = random.Random(seed)
+    directories = make_directories(depth, fanout)
+    for rel_dir in directories:
+        os.makedirs(os.path.join(root, rel_dir), exist_ok=True)
+    rel_paths = []
+    for i in range(files):
+        roll = rng.random()
+        ext = ".webm" if roll < video_ratio else (".png" if roll < (1 + video_ratio) / 2 else ".jpg")
+        name = f"{rng.choice(NAME_WORDS)}_{rng.choice(NAME_WORDS)}_{i:07d}{ext}"
+        rel_path = f"{rng.choice(directories)}/{name}".lstrip("/")
+        with open(os.path.join(root, rel_path), "wb") as f:
+            f.write(STUBS[ext])
+        rel_paths.append(rel_path)
+    return rel_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成媒体目录树")
+    parser.add_argument("root", help="目标目录（不存在时创建）")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--depth", type=int, default=3, help="目录层数")
+    parser.add_argument("--fanout", type=int, default=6, help="每层子目录数")
+    parser.add_argument("--video-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rel_paths = generate_tree(args.root, args.files, args.depth, args.fanout, args.video_ratio, args.seed)
+    print(f"已生成: {len(rel_paths)} 个文件，{len(make_directories(args.depth, args.fanout))} 个目录 -> {args.root}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
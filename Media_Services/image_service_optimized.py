@@ -6,29 +6,42 @@ import logging
 import threading
 import urllib.parse
 import functools
+import gzip
+import heapq
+import collections
+import stat
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, send_file
-from watchdog.observers import Observer
+from flask import Flask, Response, jsonify, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import wrap_file
 from watchdog.events import FileSystemEventHandler
 from flask_cors import CORS
 import mimetypes
+import gevent
+import gevent.event
 from gevent import pywsgi
 from geventwebsocket.handler import WebSocketHandler
+from media_catalog import (MediaEntry, MediaCatalog, CatalogExporter, build_list_body, dumps_bytes, encode_fragments,
+                           normalize_folder)
+from media_file_cache import CachedFile, HotFileCache, file_etag
+from media_streaming import FileStreamer
+from media_derivatives import DERIVATIVE_KINDS, DerivativeCache, DerivativeExtractor, find_ffmpeg
+from media_metadata import EMPTY_METADATA, MetadataPipeline, MetadataStore, find_ffprobe
+from media_search import CatalogSearch
+from media_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from media_logging import configure_logging, configure_stdio, get_logging_stats
+from media_profiler import MAX_DURATION as PROFILE_MAX_SECONDS, RequestTrace, SamplingProfiler, StartupReport
+from media_poller import DirectoryPoller, filesystem_type, needs_polling
+from media_moves import MoveTracker
+from media_manager import MediaFileManager
+from media_retention import RetentionEngine, RetentionPolicy
+from media_playlists import PLAYLIST_MODES, PlaylistManager
 
-# 设置文件系统编码为UTF-8
-sys.stdout.reconfigure(encoding='utf-8')
-sys.stderr.reconfigure(encoding='utf-8')
-sys.getfilesystemencoding = lambda: 'utf-8'
-
-# 配置日志 - 优化：INFO级别 + 日志轮转
-logging.basicConfig(
-    level=logging.INFO,  # 从DEBUG改为INFO
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("image_service.log", encoding='utf-8')
-    ]
-)
+# 可选依赖：brotli（存在时优先使用br压缩）
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # MIME类型映射
 MIME_MAP = {
@@ -38,6 +51,77 @@ MIME_MAP = {
     '.avi': 'video/x-msvideo', '.mkv': 'video/x-matroska'
 }
 
+@functools.lru_cache(maxsize=256)
+def mime_type_for(file_ext, is_image):
+    """按扩展名确定MIME类型（结果缓存）"""
+    mime_type = MIME_MAP.get(file_ext) or mimetypes.guess_type("media" + file_ext)[0]
+    if not mime_type:
+        mime_type = ("image/" if is_image else "video/") + file_ext[1:]
+    return mime_type
+
+# 请求派生文件（封面/预览）时等待提取完成的上限（秒），超时返回202
+DERIVATIVE_WAIT = 10
+
+# /media 元数据筛选参数 -> (字段, 上/下限位置, 类型)
+MEDIA_RANGE_FILTERS = {
+    "min_width": ("width", 0, int), "max_width": ("width", 1, int),
+    "min_height": ("height", 0, int), "max_height": ("height", 1, int),
+    "min_duration": ("duration", 0, float), "max_duration": ("duration", 1, float),
+}
+MEDIA_ORIENTATIONS = ("portrait", "landscape", "square")
+
+# /search 单页结果数上限
+SEARCH_MAX_LIMIT = 200
+
+# /files/stat 单次查询的文件数上限
+FILES_STAT_MAX = 5000
+
+# /tree 单次展开的最大层数
+TREE_MAX_DEPTH = 4
+
+# 扫描耗时、watchdog延迟的直方图分桶（秒）
+SCAN_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+WATCHDOG_BUCKETS = (0.01, 0.1, 0.5, 1, 1.5, 2, 3, 5, 10, 30)
+
+# 慢请求记录保留条数（/admin/slow-requests）
+SLOW_REQUEST_LOG_SIZE = 200
+
+# 响应压缩：仅压缩超过阈值的JSON（/file/ 媒体文件不压缩）
+COMPRESS_MIN_SIZE = 4 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def negotiate_encoding(accept_encoding):
+    """根据Accept-Encoding选择压缩方式（br优先，其次gzip），不支持则返回None"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+    
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+def compress_body(body, encoding):
+    """按指定方式压缩响应体"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
 # 缓存装饰器 - 优化：添加元数据缓存
 class MediaCache:
     def __init__(self, ttl=300):  # 5分钟缓存
@@ -64,7 +148,43 @@ class ConfigManager:
         self.default_config = {
             "scan_directory": "F:\\Download" if os.name == 'nt' else os.path.expanduser("~/Downloads"),
             "image_max_size_mb": 5,
-            "video_max_size_mb": 100
+            "video_max_size_mb": 100,
+            "hot_cache_mb": 64,             # 小图片热缓存总容量，0为关闭
+            "hot_cache_max_file_kb": 1024,  # 单个文件不超过该大小才进入热缓存
+            "serve_catalog_only": False,    # 为True时 /file 只提供已入库的媒体文件
+            "stream_min_size_kb": 1024,     # 超过该大小的文件经线程池分块流式传输
+            "stream_chunk_kb": 256,
+            "stream_client_limit_mb": 0,    # 每个客户端的传输带宽上限（MB/s），0为不限速
+            "stream_read_slots": 4,         # 同时进行的流读取数上限，为API请求保留线程池容量
+            "ffmpeg_path": "",              # 留空则从PATH查找，找不到时不生成封面/预览
+            "derivative_cache_dir": "media_derivatives",
+            "derivative_cache_mb": 1024,
+            "derivative_workers": 2,        # 同时运行的ffmpeg进程数
+            "derivatives_on_ingest": True,  # 新视频入库时预先生成封面
+            "metadata_db": "media_metadata.db",
+            "metadata_workers": 2,          # 元数据（尺寸/时长/编码）提取线程数
+            "search_index": True,           # 维护文件名搜索索引（/search）
+            "playlist_limit": 64,           # 服务端播放列表（/playlists）数量上限，超出时淘汰最久未使用的
+            "slow_request_ms": 500,         # 处理耗时超过该值的请求记录分阶段耗时，0为关闭
+            "log_file": "image_service.log",
+            "log_max_mb": 10,               # 日志文件轮转大小
+            "log_backups": 5,
+            "log_json": False,              # 日志文件使用JSON行格式（控制台仍为文本）
+            "log_rate_per_second": 5,       # 同一位置的日志每秒最多输出条数，超出后采样，0为不限速
+            "log_sample_every": 100,        # 超出限速后每多少条放行一条（附带抑制条数）
+            "watch_backend": "auto",        # 文件监控方式：auto / watchdog / polling（auto在网络共享等无inotify的挂载上轮询）
+            "poll_interval_min": 2,         # 轮询间隔（秒）：有变化时回到最小值，无变化时逐步放大到最大值
+            "poll_interval_max": 30,
+            "move_match_seconds": 10,       # 监控漏报移动时，间隔不超过该值、大小与修改时间相同的删除+新建视为同一文件移动
+            "watch_history_db": "media_watch_history.db",  # 观看历史数据库（media_manager），文件改名/移动时迁移记录，不存在则跳过
+            "retention_enabled": False,     # 按保留策略定时删除已观看的媒体（只删除观看历史中有记录的文件）
+            "retention_interval_minutes": 60,
+            "retention_max_age_days": 0,    # 最后观看超过N天的文件删除，0为不限
+            "retention_max_total_gb": 0,    # 媒体总大小上限，超出时从最久未观看的文件开始删除，0为不限
+            "retention_min_watch_count": 1, # 观看次数不足的文件不删除
+            "retention_protect_favorites": True,  # 收藏的文件不删除
+            "retention_backup_dir": "media_retention_backup",  # 删除前移入的备份目录（应在扫描目录之外），为空则直接删除
+            "retention_batch_size": 20      # 每个时间片最多删除的文件数
         }
     
     def load_config(self):
@@ -86,64 +206,185 @@ class ConfigManager:
             logging.error(f"配置保存失败: {e}")
             return False
 
-# WebSocket连接管理器 - 优化：连接管理
+# WebSocket连接管理器 - 优化：单一空闲回收协程 + 每连接有界发送队列
 class WebSocketManager:
-    def __init__(self, timeout=300):  # 5分钟超时
+    def __init__(self, timeout=300, queue_size=64, registry=None):  # 5分钟超时
         self.active_connections = {}
         self.timeout = timeout
+        self.queue_size = queue_size
+        
+        # 空闲回收：按截止时间排序的堆 (deadline, connection_id)，由单个协程处理
+        self._reap_heap = []
+        self._reap_wakeup = gevent.event.Event()
+        self._reaper = None
+        
+        # 跨线程广播：watchdog线程写入待发队列，通过hub的async watcher唤醒分发
+        self._hub_thread = None
+        self._async_watcher = None
+        self._pending = collections.deque()
+        
+        self.metrics = {"sent": 0, "dropped": 0, "coalesced": 0, "reaped": 0, "send_errors": 0}
+        self._fanout_time = registry.histogram(
+            "websocket_fanout_seconds", "单条广播分发到全部连接队列的耗时") if registry is not None else None
+    
+    def _ensure_hub_workers(self):
+        """在hub线程中初始化回收协程与跨线程唤醒器（首个连接时调用）"""
+        if self._hub_thread is None:
+            self._hub_thread = threading.get_ident()
+            self._async_watcher = gevent.get_hub().loop.async_(ref=False)
+            self._async_watcher.start(self._dispatch_pending)
+        if self._reaper is None or self._reaper.dead:
+            self._reaper = gevent.spawn(self._reap_idle_connections)
     
     def add_connection(self, ws):
+        self._ensure_hub_workers()
         connection_id = id(ws)
-        self.active_connections[connection_id] = {
+        conn = {
             'ws': ws,
             'last_activity': time.time(),
-            'thread': threading.Thread(target=self._monitor_connection, args=(connection_id,), daemon=True)
+            'queue': collections.deque(),
+            'wakeup': gevent.event.Event(),
+            'closed': False
         }
-        self.active_connections[connection_id]['thread'].start()
+        self.active_connections[connection_id] = conn
+        conn['sender'] = gevent.spawn(self._drain_queue, connection_id, conn)
+        heapq.heappush(self._reap_heap, (conn['last_activity'] + self.timeout, connection_id))
+        self._reap_wakeup.set()
         logging.info(f"WebSocket连接: 当前{len(self.active_connections)}个")
     
     def remove_connection(self, connection_id):
-        if connection_id in self.active_connections:
-            del self.active_connections[connection_id]
+        conn = self.active_connections.pop(connection_id, None)
+        if conn is not None:
+            conn['closed'] = True
+            conn['wakeup'].set()
             logging.info(f"WebSocket关闭: 剩余{len(self.active_connections)}个")
     
     def update_activity(self, connection_id):
         if connection_id in self.active_connections:
             self.active_connections[connection_id]['last_activity'] = time.time()
     
-    def _monitor_connection(self, connection_id):
-        while connection_id in self.active_connections:
-            conn = self.active_connections[connection_id]
-            if time.time() - conn['last_activity'] > self.timeout:
-                self.remove_connection(connection_id)
-                break
-            time.sleep(60)  # 每分钟检查一次
+    def _reap_idle_connections(self):
+        """单一回收协程：按最早截止时间休眠，过期条目重新核对最后活动时间"""
+        while True:
+            self._reap_wakeup.clear()
+            delay = self._reap_heap[0][0] - time.time() if self._reap_heap else self.timeout
+            if delay > 0:
+                self._reap_wakeup.wait(timeout=delay)
+                continue
+            
+            _, connection_id = heapq.heappop(self._reap_heap)
+            conn = self.active_connections.get(connection_id)
+            if conn is None:
+                continue
+            deadline = conn['last_activity'] + self.timeout
+            if deadline > time.time():
+                heapq.heappush(self._reap_heap, (deadline, connection_id))
+                continue
+            
+            self.metrics["reaped"] += 1
+            self.remove_connection(connection_id)
+            try:
+                conn['ws'].close()
+            except Exception:
+                pass
     
-    def broadcast(self, message):
-        disconnected = []
-        for connection_id, conn in list(self.active_connections.items()):
+    def _drain_queue(self, connection_id, conn):
+        """每连接发送协程：慢客户端只阻塞自身，不影响其他连接与调用方"""
+        queue = conn['queue']
+        while not conn['closed']:
+            if not queue:
+                conn['wakeup'].clear()
+                conn['wakeup'].wait()
+                continue
+            _, message = queue.popleft()
             try:
                 conn['ws'].send(message)
+                self.metrics["sent"] += 1
                 self.update_activity(connection_id)
             except Exception as e:
                 logging.error(f"WebSocket发送失败: {str(e)}")
-                disconnected.append(connection_id)
-        
-        for connection_id in disconnected:
-            self.remove_connection(connection_id)
+                self.metrics["send_errors"] += 1
+                self.remove_connection(connection_id)
+    
+    def _enqueue(self, conn, message, key):
+        """写入连接队列：同key消息合并为最新一条，队列满时丢弃最旧消息"""
+        queue = conn['queue']
+        if key is not None:
+            for i, (queued_key, _) in enumerate(queue):
+                if queued_key == key:
+                    del queue[i]
+                    self.metrics["coalesced"] += 1
+                    break
+        if len(queue) >= self.queue_size:
+            queue.popleft()
+            self.metrics["dropped"] += 1
+        queue.append((key, message))
+        conn['wakeup'].set()
+    
+    def _dispatch_pending(self):
+        """在hub线程中将待发消息分发到各连接队列"""
+        while self._pending:
+            start = time.perf_counter()
+            message, key = self._pending.popleft()
+            for conn in list(self.active_connections.values()):
+                self._enqueue(conn, message, key)
+            if self._fanout_time is not None:
+                self._fanout_time.observe_since(start)
+    
+    def send_to(self, connection_id, message):
+        """向单个连接发送消息（经由其发送队列，避免与广播并发写同一socket）"""
+        conn = self.active_connections.get(connection_id)
+        if conn is not None:
+            self._enqueue(conn, message, None)
+    
+    def broadcast(self, message, key=None):
+        """广播消息（任意线程可调用，立即返回）
+
+        key: 合并键，同一连接队列中相同key的未发送消息只保留最新一条
+        """
+        if not self.active_connections:
+            return
+        self._pending.append((message, key))
+        if threading.get_ident() == self._hub_thread:
+            self._dispatch_pending()
+        else:
+            self._async_watcher.send()
     
     def get_connection_count(self):
         return len(self.active_connections)
+    
+    def get_metrics(self):
+        """连接与队列指标"""
+        depths = [len(conn['queue']) for conn in self.active_connections.values()]
+        return {
+            "connections": len(depths),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            **self.metrics
+        }
 
 # 主服务类 - 优化：类封装全局变量
 class MediaService:
-    def __init__(self):
+    def __init__(self, startup=None):
+        # 启动阶段计时（由启动脚本传入以包含导入耗时）；warming 为True时目录仍在后台加载
+        self.startup = startup if startup is not None else StartupReport()
+        self.warming = False
         self.app = Flask(__name__)
         CORS(self.app)
         
         # 配置
         self.config_manager = ConfigManager()
         self.config = self.config_manager.load_config()
+        # 日志 - 优化：INFO级别 + 异步写入（队列）+ 按大小轮转 + 限速（导入模块时不配置，由创建服务时按配置文件进行）
+        configure_logging(
+            self.config["log_file"],
+            level=logging.INFO,
+            max_bytes=int(self.config["log_max_mb"] * 1024 * 1024),
+            backup_count=self.config["log_backups"],
+            json_format=self.config["log_json"],
+            rate_per_second=self.config["log_rate_per_second"],
+            sample_every=self.config["log_sample_every"]
+        )
         
         # 媒体配置
         self.media_config = {
@@ -157,18 +398,106 @@ class MediaService:
             }
         }
         
-        # 数据存储
-        self.media_db = []
+        # 数据存储（写时复制快照：请求处理读取 self.catalog.snapshot，无需加锁）
+        self.catalog = MediaCatalog()
         self.scan_directory = self.config["scan_directory"]
         self.observer = None
+        self.poller = None  # 轮询检测（watch_backend 为 polling，或 auto 且目录所在文件系统不产生事件时替代 observer）
+        self.moves = MoveTracker(self.config["move_match_seconds"])  # 漏报移动的删除/新建配对
+        self.retention = RetentionEngine(
+            self.catalog, self.config["watch_history_db"], RetentionPolicy.from_config(self.config),
+            self.scan_directory,
+            backup_dir=self.config["retention_backup_dir"] or None,
+            interval=self.config["retention_interval_minutes"] * 60,
+            batch_size=self.config["retention_batch_size"],
+            on_removed=self._apply_retention
+        )
+        
+        # 多进程模式：工作进程只读（不写配置文件），变更命令转发给目录所有者进程
+        self.read_only = False
+        self.command_forwarder = None
         
-        # 缓存和连接管理
+        # 运行指标（/metrics，Prometheus文本格式）与诊断（采样分析、慢请求记录）
+        self.registry = MetricsRegistry()
+        self.profiler = SamplingProfiler()
+        self.slow_requests = collections.deque(maxlen=SLOW_REQUEST_LOG_SIZE)
+        
+        # 缓存和连接管理（cache：按目录版本号缓存序列化响应）
         self.cache = MediaCache()
-        self.ws_manager = WebSocketManager()
+        self.exporter = CatalogExporter()
+        self.ws_manager = WebSocketManager(registry=self.registry)
+        self.file_cache = HotFileCache(
+            max_bytes=int(self.config["hot_cache_mb"] * 1024 * 1024),
+            max_file_size=int(self.config["hot_cache_max_file_kb"] * 1024)
+        )
+        self.streamer = FileStreamer(
+            min_size=int(self.config["stream_min_size_kb"] * 1024),
+            chunk_size=int(self.config["stream_chunk_kb"] * 1024),
+            client_rate=int(self.config["stream_client_limit_mb"] * 1024 * 1024),
+            read_slots=self.config["stream_read_slots"]
+        )
+        self.derivatives = DerivativeExtractor(
+            find_ffmpeg(self.config["ffmpeg_path"]),
+            DerivativeCache(self.config["derivative_cache_dir"],
+                            max_bytes=int(self.config["derivative_cache_mb"] * 1024 * 1024)),
+            workers=self.config["derivative_workers"]
+        )
+        self.metadata = MetadataPipeline(
+            MetadataStore(self.config["metadata_db"]),
+            ffprobe=find_ffprobe(self.derivatives.ffmpeg),
+            workers=self.config["metadata_workers"],
+            on_results=self._apply_metadata
+        )
+        self.catalog.add_listener(self._on_catalog_changed)
+        self.search = CatalogSearch(self.catalog) if self.config["search_index"] else None
+        if self.search is not None:
+            self.catalog.add_listener(self.search.on_catalog_changed)
+        self.playlists = PlaylistManager(self.catalog, max_playlists=self.config["playlist_limit"])
+        self.catalog.add_listener(self.playlists.on_catalog_changed)
+        self._setup_metrics()
         
         # 注册路由
         self._register_routes()
     
+    def _setup_metrics(self):
+        """注册运行指标：请求/扫描/watchdog 在热路径上计时计数，目录与各组件状态在采集时读取"""
+        registry = self.registry
+        self.request_time = registry.histogram(
+            "http_request_duration_seconds", "请求处理耗时（流式响应为开始发送前）", ("route", "method"))
+        self.request_count = registry.counter("http_requests_total", "请求数", ("route", "method", "status"))
+        self.response_bytes = registry.counter("http_response_bytes_total", "响应体字节数（压缩后）", ("route",))
+        self.range_requests = registry.counter("http_range_requests_total", "Range请求数", ("route", "status"))
+        self.scan_time = registry.histogram("media_scan_duration_seconds", "全量扫描耗时", buckets=SCAN_BUCKETS)
+        self.scan_files = registry.counter("media_scan_files_total", "全量扫描处理的文件数")
+        self.scan_rate = registry.gauge("media_scan_files_per_second", "最近一次全量扫描的速度（文件/秒）")
+        self.watchdog_events = registry.counter("media_watchdog_events_total", "处理的文件系统事件数", ("event",))
+        self.move_count = registry.counter("media_moves_total", "原位改键的改名/移动文件数（event=监控事件，paired=删除与新建配对）",
+                                           ("source",))
+        self.watchdog_lag = registry.histogram(
+            "media_watchdog_lag_seconds", "文件系统事件从开始处理到入库的耗时（含写入完成等待）", ("event",),
+            buckets=WATCHDOG_BUCKETS)
+        
+        registry.function("media_watchdog_queue_depth", "watchdog待处理事件数",
+                          lambda: self.observer.event_queue.qsize() if self.observer else 0)
+        registry.function("media_poller_cycle_cpu_seconds", "最近一轮轮询检测的CPU耗时",
+                          lambda: self.poller.metrics["last_cycle_cpu_ms"] / 1000 if self.poller else 0)
+        registry.function("media_retention_deleted_total", "保留策略删除的文件数",
+                          lambda: self.retention.metrics["deleted"], kind="counter")
+        registry.function("media_retention_deleted_bytes_total", "保留策略删除的字节数",
+                          lambda: self.retention.metrics["deleted_bytes"], kind="counter")
+        registry.function("media_catalog_entries", "目录条目数", lambda: {
+            ("image",): self.catalog.snapshot.image_count, ("video",): self.catalog.snapshot.video_count
+        }, ("type",))
+        registry.function("media_catalog_bytes", "目录内文件总字节数", lambda: self.catalog.snapshot.tree.total_bytes)
+        registry.function("media_catalog_revision", "目录快照版本号", lambda: self.catalog.snapshot.revision)
+        registry.function("websocket_connections", "WebSocket连接数", self.ws_manager.get_connection_count)
+        registry.function("media_file_cache_requests_total", "热缓存查询数", lambda: {
+            ("hit",): self.file_cache.get_metrics()["hits"], ("miss",): self.file_cache.get_metrics()["misses"]
+        }, ("result",), kind="counter")
+        registry.function("media_stream_active", "进行中的流式传输数", lambda: self.streamer.get_metrics()["active"])
+        registry.function("media_stream_bytes_total", "流式传输实际发送的字节数",
+                          lambda: self.streamer.get_metrics()["bytes_sent"], kind="counter")
+    
     def _register_routes(self):
         @self.app.route("/scan", methods=["POST"])
         def scan_endpoint():
@@ -178,14 +507,50 @@ class MediaService:
         def get_media():
             return self._get_media()
         
+        @self.app.route("/media.bin", methods=["GET"])
+        def get_media_bin():
+            return self._get_media_bin()
+        
+        @self.app.route("/search", methods=["GET"])
+        def search_media():
+            return self._search_media()
+        
+        @self.app.route("/tree", methods=["GET"])
+        def get_tree():
+            return self._get_tree()
+        
         @self.app.route("/random-media", methods=["GET"])
         def get_random_media():
             return self._get_random_media()
         
+        @self.app.route("/playlists", methods=["POST"])
+        def create_playlist():
+            return self._playlist_endpoint("create")
+        
+        @self.app.route("/playlists/<playlist_id>", methods=["GET", "PATCH", "DELETE"])
+        def playlist(playlist_id):
+            return self._playlist_endpoint(request.method.lower(), playlist_id)
+        
+        @self.app.route("/playlists/<playlist_id>/<any(next, prev, current):direction>", methods=["POST"])
+        def playlist_step(playlist_id, direction):
+            return self._playlist_endpoint(direction, playlist_id)
+        
         @self.app.route("/file/<path:filename>", methods=["GET"])
         def serve_file(filename):
             return self._serve_file(filename)
         
+        @self.app.route("/files/stat", methods=["POST"])
+        def stat_files():
+            return self._stat_files()
+        
+        @self.app.route("/poster/<path:filename>", methods=["GET"])
+        def serve_poster(filename):
+            return self._serve_derivative("poster", filename)
+        
+        @self.app.route("/preview/<path:filename>", methods=["GET"])
+        def serve_preview(filename):
+            return self._serve_derivative("preview", filename)
+        
         @self.app.route("/cleanup", methods=["POST"])
         def cleanup():
             return self._cleanup()
@@ -197,6 +562,122 @@ class MediaService:
         @self.app.route("/socket.io")
         def handle_websocket():
             return self._handle_websocket()
+        
+        @self.app.route("/metrics", methods=["GET"])
+        def metrics():
+            return Response(self.registry.render(), content_type=METRICS_CONTENT_TYPE)
+        
+        @self.app.route("/admin/profile", methods=["GET", "POST"])
+        def profile():
+            return self._profile()
+        
+        @self.app.route("/admin/retention", methods=["GET"])
+        @self.app.route("/admin/retention/run", methods=["POST"])
+        def retention():
+            return self._retention()
+        
+        @self.app.route("/admin/slow-requests", methods=["GET"])
+        def slow_requests():
+            return jsonify({"threshold_ms": self.config["slow_request_ms"], "requests": list(self.slow_requests)})
+        
+        @self.app.before_request
+        def start_trace():
+            request.environ["media.trace"] = RequestTrace()
+        
+        # after_request 按注册的逆序执行：指标记录先注册，在压缩之后执行
+        @self.app.after_request
+        def record_metrics(response):
+            return self._record_request(response)
+        
+        @self.app.after_request
+        def compress_response(response):
+            return self._compress_response(response)
+    
+    def _phase(self, name):
+        """标记当前请求的一个处理阶段结束（慢请求日志按阶段列出耗时）"""
+        trace = request.environ.get("media.trace")
+        if trace is not None:
+            trace.mark(name)
+    
+    def _record_request(self, response):
+        """记录请求耗时、状态、响应字节数与Range请求（WebSocket长连接不计）；超过阈值的记入慢请求日志"""
+        trace = request.environ.get("media.trace")
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        if trace is None or route == "/socket.io":
+            return response
+        self.request_time.labels(route, request.method).observe_since(trace.start)
+        threshold = self.config["slow_request_ms"]
+        if threshold and not route.startswith("/admin/"):  # 采样窗口本身会持续数秒
+            total_ms, phases = trace.summary()
+            if total_ms >= threshold:
+                self._log_slow_request(response, total_ms, phases)
+        status = str(response.status_code)
+        self.request_count.labels(route, request.method, status).inc()
+        if response.content_length:
+            self.response_bytes.labels(route).inc(response.content_length)
+        if "Range" in request.headers:
+            self.range_requests.labels(route, status).inc()
+        return response
+    
+    def _log_slow_request(self, response, total_ms, phases):
+        path = request.full_path.rstrip("?")
+        self.slow_requests.append({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "method": request.method,
+            "path": path,
+            "status": response.status_code,
+            "total_ms": total_ms,
+            "phases": dict(phases)
+        })
+        detail = " | ".join(f"{name} {ms:.1f}ms" for name, ms in phases)
+        logging.warning(f"慢请求 {total_ms:.1f}ms: {request.method} {path} [{detail}]")
+    
+    def _profile(self):
+        """采样分析：POST 开始一个窗口（默认等待结束后返回折叠栈，wait=0 时立即返回）；GET 取最近一次结果"""
+        try:
+            if request.method == "GET":
+                if request.args.get("format") == "json" or self.profiler.running:
+                    return jsonify(self.profiler.get_status())
+                return Response(self.profiler.collapsed(), mimetype="text/plain")
+            
+            try:
+                seconds = min(PROFILE_MAX_SECONDS, max(0.1, float(request.args.get("seconds", 10))))
+                interval = min(1000.0, max(1.0, float(request.args.get("interval_ms", 10)))) / 1000
+            except ValueError:
+                return jsonify({"status": "error", "message": "无效的参数: seconds/interval_ms"}), 400
+            include_idle = request.args.get("idle", "0").lower() in ("1", "true", "yes")
+            if not self.profiler.start(seconds, interval, include_idle):
+                return jsonify({"status": "error", "message": "采样已在进行中"}), 409
+            logging.info(f"采样分析开始: {seconds:g}秒，间隔{interval * 1000:g}ms")
+            
+            if request.args.get("wait", "1").lower() in ("0", "false", "no"):
+                return jsonify({"status": "started", **self.profiler.get_status()}), 202
+            # 采样在独立线程中进行，这里只让出协程等待
+            while self.profiler.running:
+                gevent.sleep(0.1)
+            status = self.profiler.get_status()
+            return Response(self.profiler.collapsed(), mimetype="text/plain",
+                            headers={"X-Profile-Samples": str(status["samples"])})
+        except Exception as e:
+            logging.error(f"采样分析失败: {str(e)}")
+            return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+    
+    def _retention(self):
+        """保留策略：GET 查看策略与最近一轮结果；POST 立即执行一轮（dry_run=1 只列出将删除的文件）"""
+        try:
+            params = {
+                "run": request.method == "POST",
+                "dry_run": request.args.get("dry_run", "0").lower() in ("1", "true", "yes")
+            }
+            if self.command_forwarder is not None:
+                payload, status = self.command_forwarder("retention", params)
+            else:
+                # 删除分时间片进行（片间暂停），在线程池中执行，不阻塞事件循环
+                payload, status = gevent.get_hub().threadpool.apply(self.run_command, ("retention", params))
+            return jsonify(payload), status
+        except Exception as e:
+            logging.error(f"保留策略执行失败: {str(e)}")
+            return jsonify({"status": "error", "message": "服务器内部错误"}), 500
     
     # 文件扫描优化：增量扫描
     def update_db_incremental(self, changed_files=None):
@@ -209,39 +690,84 @@ class MediaService:
             # 首次扫描才全量
             self._scan_full_directory()
     
+    def _on_catalog_changed(self, snapshot, changes):
+        """目录发布新快照：清空序列化响应缓存（缓存键含版本号），失效变更文件的热缓存"""
+        self.cache.clear()
+        if changes is None:
+            self.file_cache.clear()
+        else:
+            for old, new in changes:
+                if old is not None and new is not None \
+                        and (old.size, old.last_modified) == (new.size, new.last_modified):
+                    continue  # 仅元数据更新，文件内容未变
+                self.file_cache.invalidate((old or new).rel_path)
+                # 新入库/变化的视频：后台预先生成封面
+                if new is not None and new.media_type == "video" and self.config["derivatives_on_ingest"] \
+                        and not self.read_only:
+                    self.derivatives.submit("poster", (new.rel_path, new.last_modified, new.size), new.path)
+    
     def _scan_full_directory(self):
-        """全量扫描目录"""
-        self.media_db = []
+        """全量扫描目录 - 优化：扫描期间读者仍看到旧快照，完成后一次性替换"""
+        self.exporter.reset()
         
         if not self.scan_directory or not os.path.exists(self.scan_directory):
             logging.warning(f"目录不存在: {self.scan_directory}")
+            self.catalog.replace_all([])
             return
         
         if not os.access(self.scan_directory, os.R_OK):
             logging.error(f"无目录读权限: {self.scan_directory}")
+            self.catalog.replace_all([])
             return
 
         logging.info(f"开始扫描目录: {self.scan_directory}")
+        scan_start = time.perf_counter()
         all_extensions = self.media_config["image"]["extensions"] + self.media_config["video"]["extensions"]
         
+        entries = []
         for root, _, files in os.walk(self.scan_directory):
             for file in files:
                 file_lower = file.lower()
                 if any(file_lower.endswith(ext) for ext in all_extensions):
                     full_path = os.path.join(root, file)
-                    self._process_single_file(full_path)
+                    entry = self._build_entry(full_path)
+                    if entry is not None:
+                        entries.append(entry)
         
         # 按修改时间排序（最新在前）
-        self.media_db.sort(key=lambda x: x["last_modified"], reverse=True)
-        image_count = len([x for x in self.media_db if x["media_type"] == "image"])
-        video_count = len([x for x in self.media_db if x["media_type"] == "video"])
-        logging.info(f"扫描完成: 总计{len(self.media_db)}个（图片{image_count} | 视频{video_count}）")
+        entries.sort(key=lambda x: x.last_modified, reverse=True)
+        self.catalog.replace_all(entries)
+        self.metadata.submit_missing(entries)
+        elapsed = time.perf_counter() - scan_start
+        self.scan_time.observe(elapsed)
+        self.scan_files.inc(len(entries))
+        self.scan_rate.set(round(len(entries) / elapsed, 1) if elapsed > 0 else 0)
+        snapshot = self.catalog.snapshot
+        logging.info(f"扫描完成: 总计{snapshot.total_count}个（图片{snapshot.image_count} | 视频{snapshot.video_count}）"
+                     f"，耗时{elapsed:.1f}秒")
         
         self._save_config()
         self._send_update_event()
     
     def _process_single_file(self, full_path):
         """处理单个文件"""
+        entry = self._build_entry(full_path)
+        if entry is not None:
+            self.catalog.upsert(entry)
+            self.metadata.submit_missing([entry])
+    
+    def _apply_metadata(self, results):
+        """元数据提取完成：写回仍未变化的条目（一批只发布一次快照）"""
+        with self.catalog.batch():
+            for entry, metadata in results:
+                current = self.catalog.get(entry.rel_path)
+                if current is None or metadata == EMPTY_METADATA or current.root != entry.root \
+                        or (current.size, current.last_modified) != (entry.size, entry.last_modified):
+                    continue
+                self.catalog.upsert(current.with_metadata(*metadata))
+    
+    def _build_entry(self, full_path):
+        """构建媒体条目，不符合条件（超大小/读取失败）时返回None"""
         try:
             file_lower = os.path.basename(full_path).lower()
             rel_path = os.path.relpath(full_path, self.scan_directory).replace("\\", "/")
@@ -256,118 +782,422 @@ class MediaService:
                 max_size = self.media_config["video"]["max_size"]
             
             if file_size <= max_size:
-                # 检查是否已存在
-                existing_index = next((i for i, m in enumerate(self.media_db) if m["path"] == full_path), -1)
-                
-                media_info = {
-                    "path": full_path,
-                    "rel_path": rel_path,
-                    "name": os.path.basename(full_path),
-                    "size": file_size,
-                    "media_type": media_type,
-                    "last_modified": os.path.getmtime(full_path)
-                }
-                
-                if existing_index >= 0:
-                    # 更新现有记录
-                    self.media_db[existing_index] = media_info
-                else:
-                    # 添加新记录
-                    self.media_db.append(media_info)
+                # 紧凑条目（创建时预编码JSON片段，列表响应直接拼接），附带已持久化的元数据
+                mtime = os.path.getmtime(full_path)
+                metadata = self.metadata.lookup(full_path, file_size, mtime) or EMPTY_METADATA
+                return MediaEntry(self.scan_directory, rel_path, file_size, media_type, mtime, *metadata)
         except Exception as e:
             logging.error(f"处理媒体文件错误: {full_path} - {str(e)}")
+        return None
+    
+    def _rel_path(self, full_path):
+        return os.path.relpath(os.path.normpath(full_path), self.scan_directory).replace("\\", "/")
+    
+    def _media_type_for(self, name):
+        """按扩展名判断媒体类型，非媒体文件返回None"""
+        name = name.lower()
+        if name.endswith(self.media_config["image"]["extensions"]):
+            return "image"
+        if name.endswith(self.media_config["video"]["extensions"]):
+            return "video"
+        return None
+    
+    def move_media(self, src_path, dest_path):
+        """文件改名/移动（监控的moved事件）：条目连同元数据、派生缓存、观看历史原位改键，不重新读取文件
+
+        返回目录是否有变化
+        """
+        old_rel, new_rel = self._rel_path(src_path), self._rel_path(dest_path)
+        old = self.catalog.get(old_rel)
+        media_type = self._media_type_for(new_rel)
+        if new_rel == ".." or new_rel.startswith("../") or media_type is None:
+            # 移出监控目录，或改为非媒体扩展名
+            return self.catalog.remove(old_rel)
+        if old is None:
+            if self.catalog.get(new_rel) is not None:
+                return False  # 已随所在目录一起改键
+            # 未入库的文件改名为媒体文件（如下载完成时去掉临时扩展名）：移动是原子的，直接入库
+            self.update_db_incremental([dest_path])
+            return self.catalog.get(new_rel) is not None
+        try:
+            st = os.stat(dest_path)
+        except OSError:
+            return self.catalog.remove(old_rel)
+        if (st.st_size, st.st_mtime) != (old.size, old.last_modified) or media_type != old.media_type:
+            # 移动的同时内容已变化：按删除旧条目 + 新文件入库处理
+            with self.catalog.batch():
+                self.catalog.remove(old_rel)
+                self.update_db_incremental([dest_path])
+            return True
+        self._rekey([(old, old.with_path(new_rel))], "event")
+        return True
+    
+    def move_directory(self, src_dir, dest_dir):
+        """目录改名/移动：子树内全部条目一次改键（随后逐个文件的moved事件发现条目已在新路径，不再处理）"""
+        old_dir, new_dir = self._rel_path(src_dir), self._rel_path(dest_dir)
+        if old_dir in (".", "..") or old_dir.startswith("../"):
+            return 0
+        node = self.catalog.snapshot.folder(old_dir)
+        if node is None:
+            return 0
+        entries = list(node.iter_entries())
+        if new_dir == ".." or new_dir.startswith("../"):
+            return self.catalog.remove_many([entry.rel_path for entry in entries])
+        self._rekey([(entry, entry.with_path(new_dir + entry.rel_path[len(old_dir):])) for entry in entries], "event")
+        return len(entries)
+    
+    def _forget_media(self, rel_path):
+        """文件已删除：移出目录，并与窗口期内指纹相同的新入库文件配对（先复制后删除的移动），返回条目是否存在"""
+        old = self.catalog.get(rel_path)
+        if old is None or not self.catalog.remove(rel_path):
+            return False
+        logging.info(f"删除媒体: {old.name}")
+        created = self.moves.deleted(old)
+        if created is not None:
+            current = self.catalog.get(created.rel_path)
+            if current is not None and (current.size, current.last_modified) == (old.size, old.last_modified):
+                self._rekey([(old, self._moved_entry(old, current))], "paired")
+        return True
+    
+    def _pair_created(self, full_path):
+        """新文件与窗口期内删除的条目指纹相同：视为漏报的移动直接改键（内容已完整，无需等待写入完成、不重新提取）"""
+        media_type = self._media_type_for(full_path)
+        if media_type is None:
+            return False
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return False
+        old = self.moves.take_deleted(st.st_size, st.st_mtime, media_type, os.path.basename(full_path))
+        if old is None:
+            return False
+        self._rekey([(old, old.with_path(self._rel_path(full_path)))], "paired")
+        return True
+    
+    def _track_created(self, rel_path):
+        """新文件入库后记录指纹；窗口期内已删除过相同指纹的文件（新建事件晚于删除事件到达）时补做改键"""
+        entry = self.catalog.get(rel_path)
+        if entry is None:
+            return
+        old = self.moves.created(entry)
+        if old is not None and self.catalog.get(old.rel_path) is None:
+            self._rekey([(old, self._moved_entry(old, entry))], "paired")
+    
+    @staticmethod
+    def _moved_entry(old, current):
+        """配对后的新条目：新文件已提取过元数据时沿用，否则继承旧条目的元数据"""
+        if (current.width, current.height, current.duration, current.codec) == EMPTY_METADATA:
+            return old.with_path(current.rel_path)
+        return current
+    
+    def _rekey(self, pairs, source):
+        """改名/移动：派生缓存、已持久化元数据、目录条目与观看历史改到新路径
+
+        pairs: [(旧条目, 新条目), ...]。派生缓存先改键，新条目发布时封面已就位，不会触发重新生成
+        """
+        for old, new in pairs:
+            if old.media_type == "video":
+                self.derivatives.cache.move((old.rel_path, old.last_modified, old.size),
+                                            (new.rel_path, new.last_modified, new.size))
+        try:
+            self.metadata.store.move_many([(old.path, new.path) for old, new in pairs])
+        except Exception as e:
+            logging.error(f"元数据改键失败: {str(e)}")
+        with self.catalog.batch():
+            for old, new in pairs:
+                self.catalog.remove(old.rel_path)
+                self.catalog.upsert(new)
+        self._move_history([(old.rel_path, new.rel_path) for old, new in pairs])
+        self.move_count.labels(source).inc(len(pairs))
+        if len(pairs) == 1:
+            logging.info(f"移动媒体: {pairs[0][0].rel_path} -> {pairs[0][1].rel_path}")
+        else:
+            logging.info(f"移动媒体: {len(pairs)}个文件 {pairs[0][0].rel_dir} -> {pairs[0][1].rel_dir}")
+    
+    def _move_history(self, moves):
+        """观看历史随文件迁移（数据库不存在时跳过）"""
+        db_path = self.config["watch_history_db"]
+        if self.read_only or not db_path or not os.path.exists(db_path):
+            return
+        try:
+            MediaFileManager(self.scan_directory, db_path).move_history(moves)
+        except Exception as e:
+            logging.error(f"观看历史迁移失败: {str(e)}")
+    
+    def _apply_retention(self, rel_paths):
+        """保留策略删除文件后：移出目录并通知客户端"""
+        self.catalog.remove_many(rel_paths)
+        self._save_config()
+        self._send_update_event()
+    
+    def _run_retention(self, run, dry_run):
+        if run and self.retention.run_once(dry_run) is None:
+            return {"status": "error", "message": "保留策略正在执行"}, 409
+        return {"status": "success", **self.retention.get_status()}, 200
     
     def _send_update_event(self):
         """发送更新事件"""
+        snapshot = self.catalog.snapshot
         message = json.dumps({
             'type': 'media_updated',
-            'total_count': len(self.media_db),
-            'image_count': len([x for x in self.media_db if x["media_type"] == "image"]),
-            'video_count': len([x for x in self.media_db if x["media_type"] == "video"])
+            'total_count': snapshot.total_count,
+            'image_count': snapshot.image_count,
+            'video_count': snapshot.video_count
         })
-        self.ws_manager.broadcast(message)
+        self.ws_manager.broadcast(message, key='media_updated')
     
     def _save_config(self):
         """保存配置"""
+        snapshot = self.catalog.snapshot
         config = {
+            **self.config,
             "scan_directory": self.scan_directory,
-            "total_count": len(self.media_db),
-            "image_count": len([x for x in self.media_db if x["media_type"] == "image"]),
-            "video_count": len([x for x in self.media_db if x["media_type"] == "video"]),
+            "total_count": snapshot.total_count,
+            "image_count": snapshot.image_count,
+            "video_count": snapshot.video_count,
             "last_updated": time.strftime("%Y-%m-%d %H:%M:%S"),
             "image_max_size_mb": self.media_config["image"]["max_size"] / 1024 / 1024,
             "video_max_size_mb": self.media_config["video"]["max_size"] / 1024 / 1024
         }
-        self.config_manager.save_config(config)
+        if not self.read_only:
+            self.config_manager.save_config(config)
         return config
     
     # API端点实现 - 优化：错误处理
+    def run_command(self, method, params):
+        """执行目录变更命令，返回 (响应数据, 状态码)（多进程模式下只在目录所有者进程执行）"""
+        if method == "scan":
+            return self._rescan(**params)
+        if method == "cleanup":
+            return self._cleanup_invalid()
+        if method == "retention":
+            return self._run_retention(**params)
+        if method == "playlist":
+            return self._run_playlist(**params)
+        raise ValueError(f"未知命令: {method}")
+    
+    def _dispatch_command(self, method, params):
+        """本地执行，或转发给目录所有者进程"""
+        if self.command_forwarder is not None:
+            return self.command_forwarder(method, params)
+        return self.run_command(method, params)
+    
     def _scan_endpoint(self):
         """扫描目录端点"""
         try:
             data = request.get_json()
-            new_dir = data.get("path", "").strip()
-            image_max_mb = data.get("image_max_mb", self.media_config["image"]["max_size"] / 1024 / 1024)
-            video_max_mb = data.get("video_max_mb", self.media_config["video"]["max_size"] / 1024 / 1024)
-            
-            if not new_dir or not os.path.isdir(new_dir):
-                return jsonify({"status": "error", "message": "目录无效"}), 400
-            
-            # 更新配置
-            self.scan_directory = os.path.normpath(new_dir)
-            self.media_config["image"]["max_size"] = int(image_max_mb * 1024 * 1024)
-            self.media_config["video"]["max_size"] = int(video_max_mb * 1024 * 1024)
-            
-            # 重新扫描
-            self.update_db_incremental()
-            self._setup_watchdog()
-            
-            return jsonify({
-                "status": "success",
-                "path": self.scan_directory,
-                "total_count": len(self.media_db),
-                "image_count": len([x for x in self.media_db if x["media_type"] == "image"]),
-                "video_count": len([x for x in self.media_db if x["media_type"] == "video"]),
-                "media_config": {"image_max_size_mb": image_max_mb, "video_max_size_mb": video_max_mb}
+            payload, status = self._dispatch_command("scan", {
+                "new_dir": data.get("path", "").strip(),
+                "image_max_mb": data.get("image_max_mb", self.media_config["image"]["max_size"] / 1024 / 1024),
+                "video_max_mb": data.get("video_max_mb", self.media_config["video"]["max_size"] / 1024 / 1024)
             })
+            return jsonify(payload), status
         except Exception as e:
             logging.error(f"扫描失败: {str(e)}")
             return jsonify({"status": "error", "message": str(e)}), 500
     
+    def _rescan(self, new_dir, image_max_mb, video_max_mb):
+        """切换扫描目录并全量重扫"""
+        if not new_dir or not os.path.isdir(new_dir):
+            return {"status": "error", "message": "目录无效"}, 400
+        
+        # 更新配置
+        self.scan_directory = os.path.normpath(new_dir)
+        self.retention.root = self.scan_directory
+        self.media_config["image"]["max_size"] = int(image_max_mb * 1024 * 1024)
+        self.media_config["video"]["max_size"] = int(video_max_mb * 1024 * 1024)
+        
+        # 重新扫描
+        self.update_db_incremental()
+        self._setup_watchdog()
+        
+        snapshot = self.catalog.snapshot
+        return {
+            "status": "success",
+            "path": self.scan_directory,
+            "total_count": snapshot.total_count,
+            "image_count": snapshot.image_count,
+            "video_count": snapshot.video_count,
+            "media_config": {"image_max_size_mb": image_max_mb, "video_max_size_mb": video_max_mb}
+        }, 200
+    
     def _get_media(self):
-        """获取媒体列表"""
+        """获取媒体列表 - 优化：拼接预编码片段，按目录版本号缓存响应体"""
         try:
             media_type = request.args.get("type", "all").lower()
-            if media_type == "image":
-                filtered = [m for m in self.media_db if m["media_type"] == "image"]
-            elif media_type == "video":
-                filtered = [m for m in self.media_db if m["media_type"] == "video"]
-            else:
-                filtered = self.media_db
+            if media_type not in ("image", "video"):
+                media_type = "all"
             
-            config = self._save_config()
-            return jsonify({
-                "media": filtered,
-                "total_count": len(self.media_db),
-                "filtered_count": len(filtered),
-                "image_count": len([x for x in self.media_db if x["media_type"] == "image"]),
-                "video_count": len([x for x in self.media_db if x["media_type"] == "video"]),
-                "last_updated": config.get("last_updated", "")
-            })
+            # 元数据筛选（由快照上的有序索引支持）
+            ranges = {}
+            try:
+                for param, (attr, bound, cast) in MEDIA_RANGE_FILTERS.items():
+                    value = request.args.get(param)
+                    if value not in (None, ""):
+                        limits = ranges.setdefault(attr, [None, None])
+                        limits[bound] = cast(value)
+            except ValueError:
+                return jsonify({"status": "error", "message": f"无效的筛选参数: {param}"}), 400
+            orientation = request.args.get("orientation", "").lower() or None
+            if orientation is not None and orientation not in MEDIA_ORIENTATIONS:
+                return jsonify({"status": "error", "message": "无效的筛选参数: orientation"}), 400
+            # 子目录范围（由目录树支持，只遍历该子树）
+            folder = normalize_folder(request.args.get("folder"))
+            if folder is None:
+                return jsonify({"status": "error", "message": "无效的筛选参数: folder"}), 400
+            
+            snapshot = self.catalog.snapshot
+            cache_key = ("media", snapshot.revision, media_type,
+                         tuple(sorted((attr, *limits) for attr, limits in ranges.items())), orientation, folder)
+            body = self.cache.get(cache_key)
+            if body is None:
+                filtered = snapshot.query(media_type, {attr: tuple(limits) for attr, limits in ranges.items()},
+                                          orientation, folder)
+                self._phase("query")
+                body = build_list_body(encode_fragments(filtered), {
+                    "total_count": snapshot.total_count,
+                    "filtered_count": len(filtered),
+                    "image_count": snapshot.image_count,
+                    "video_count": snapshot.video_count,
+                    "last_updated": snapshot.last_updated
+                })
+                self.cache.set(cache_key, body)
+                self._phase("serialize")
+            return self._json_response(body, cache_key)
         except Exception as e:
             logging.error(f"获取媒体列表失败: {str(e)}")
             return jsonify({"status": "error", "message": "服务器内部错误"}), 500
     
+    def _search_media(self):
+        """按文件名/路径搜索（前缀、词内子串、模糊匹配，按相关度排序并分页）"""
+        if self.search is None:
+            return jsonify({"status": "error", "message": "搜索索引未启用"}), 404
+        try:
+            query = request.args.get("q", "").strip()
+            media_type = request.args.get("type", "all").lower()
+            try:
+                offset = max(0, int(request.args.get("offset", 0)))
+                limit = min(SEARCH_MAX_LIMIT, max(1, int(request.args.get("limit", 50))))
+            except ValueError:
+                return jsonify({"status": "error", "message": "无效的分页参数"}), 400
+            fuzzy = request.args.get("fuzzy", "1").lower() not in ("0", "false", "no")
+            
+            # 索引由后台线程持OS锁更新：在线程池中查询，等锁时不阻塞事件循环
+            total, results, approximate = gevent.get_hub().threadpool.apply(
+                self.search.search, (query, media_type, offset, limit, fuzzy))
+            self._phase("search")
+            body = build_list_body(encode_fragments(results), {
+                "query": query,
+                "total": total,
+                "total_approximate": approximate,
+                "offset": offset,
+                "limit": limit
+            }, key=b'"results":[')
+            self._phase("serialize")
+            return self._json_response(body)
+        except Exception as e:
+            logging.error(f"搜索失败: {str(e)}")
+            return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+    
+    def _get_tree(self):
+        """目录树汇总：返回 path 节点（各类型数量、总字节数、最新修改时间）并展开 depth 层子目录"""
+        try:
+            path = normalize_folder(request.args.get("path"))
+            if path is None:
+                return jsonify({"status": "error", "message": "无效的目录路径"}), 400
+            try:
+                depth = min(TREE_MAX_DEPTH, max(0, int(request.args.get("depth", 1))))
+            except ValueError:
+                return jsonify({"status": "error", "message": "无效的参数: depth"}), 400
+            
+            snapshot = self.catalog.snapshot
+            cache_key = ("tree", snapshot.revision, path, depth)
+            body = self.cache.get(cache_key)
+            if body is None:
+                node = snapshot.folder(path)
+                if node is None:
+                    return jsonify({"status": "error", "message": "目录不存在"}), 404
+                body = dumps_bytes({"revision": snapshot.revision, **node.to_dict(path, depth)})
+                self.cache.set(cache_key, body)
+            return self._json_response(body, cache_key)
+        except Exception as e:
+            logging.error(f"获取目录树失败: {str(e)}")
+            return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+    
+    def _get_media_bin(self):
+        """获取二进制列式媒体列表 - 优化：客户端快速启动，按目录版本号缓存"""
+        try:
+            media_type = request.args.get("type", "all").lower()
+            if media_type not in ("image", "video"):
+                media_type = "all"
+            
+            snapshot = self.catalog.snapshot
+            revision = snapshot.revision
+            etag = f'"{revision}-{media_type}"'
+            if etag in request.headers.get("If-None-Match", ""):
+                return Response(status=304, headers={"ETag": etag})
+            
+            cache_key = ("media.bin", revision, media_type)
+            body = self.cache.get(cache_key)
+            if body is None:
+                body = self.exporter.encode(snapshot.filter(media_type), revision, self.scan_directory)
+                self.cache.set(cache_key, body)
+            
+            return Response(body, mimetype="application/octet-stream", headers={
+                "ETag": etag,
+                "X-Catalog-Revision": str(revision)
+            })
+        except Exception as e:
+            logging.error(f"获取二进制媒体列表失败: {str(e)}")
+            return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+    
+    def _json_response(self, body, cache_key=None):
+        """构建JSON响应 - 优化：协商压缩，压缩结果与序列化响应一同按版本号缓存"""
+        encoding = None
+        if len(body) >= COMPRESS_MIN_SIZE:
+            encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+        
+        if encoding:
+            compressed = self.cache.get(cache_key + (encoding,)) if cache_key else None
+            if compressed is None:
+                compressed = compress_body(body, encoding)
+                if cache_key:
+                    self.cache.set(cache_key + (encoding,), compressed)
+                self._phase("compress")
+            response = Response(compressed, mimetype="application/json")
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = Response(body, mimetype="application/json")
+        response.vary.add("Accept-Encoding")
+        return response
+    
+    def _compress_response(self, response):
+        """压缩其他较大的JSON响应（不缓存；媒体文件与已压缩响应跳过）"""
+        if (request.path.startswith("/file/") or response.direct_passthrough
+                or response.mimetype != "application/json"
+                or "Content-Encoding" in response.headers):
+            return response
+        
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+        if encoding:
+            response.set_data(compress_body(body, encoding))
+            response.headers["Content-Encoding"] = encoding
+            self._phase("compress")
+        response.vary.add("Accept-Encoding")
+        return response
+    
     def _get_random_media(self):
         """获取随机媒体"""
         try:
             media_type = request.args.get("type", "all").lower()
-            if media_type == "image":
-                candidates = [m for m in self.media_db if m["media_type"] == "image"]
-            elif media_type == "video":
-                candidates = [m for m in self.media_db if m["media_type"] == "video"]
-            else:
-                candidates = self.media_db
+            folder = normalize_folder(request.args.get("folder"))
+            if folder is None:
+                return jsonify({"status": "error", "message": "无效的筛选参数: folder"}), 400
+            candidates = self.catalog.snapshot.folder_entries(folder, media_type)
             
             if not candidates:
                 return jsonify({"status": "error", "message": f"无{media_type}媒体"}), 404
@@ -375,22 +1205,104 @@ class MediaService:
             import random
             media = random.choice(candidates)
             return jsonify({
-                "url": f"/file/{media['rel_path']}",
-                "name": media["name"],
-                "size": media["size"],
-                "media_type": media["media_type"],
-                "last_modified": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(media["last_modified"]))
+                "url": f"/file/{media.rel_path}",
+                "name": media.name,
+                "size": media.size,
+                "media_type": media.media_type,
+                "last_modified": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(media.last_modified))
             })
         except Exception as e:
             logging.error(f"获取随机媒体失败: {str(e)}")
             return jsonify({"status": "error", "message": "服务器内部错误"}), 500
     
+    def _playlist_endpoint(self, action, playlist_id=None):
+        """服务端播放列表：创建（POST /playlists，JSON: mode/type/folder/seed）、查看/修改/删除，
+        以及 next/prev/current 移动游标并返回条目"""
+        try:
+            params = {"action": action, "playlist_id": playlist_id}
+            if action in ("create", "patch"):
+                data = request.get_json(silent=True) or {}
+                mode, media_type, folder = data.get("mode"), data.get("type"), data.get("folder")
+                if action == "create":
+                    mode, media_type, folder = mode or "random", media_type or "all", folder or ""
+                if mode is not None and mode not in PLAYLIST_MODES:
+                    return jsonify({"status": "error", "message": "无效的参数: mode"}), 400
+                if media_type is not None:
+                    media_type = str(media_type).lower()
+                    if media_type not in ("all", "image", "video"):
+                        return jsonify({"status": "error", "message": "无效的参数: type"}), 400
+                if folder is not None:
+                    folder = normalize_folder(folder)
+                    if folder is None:
+                        return jsonify({"status": "error", "message": "无效的筛选参数: folder"}), 400
+                params.update(mode=mode, media_type=media_type, folder=folder)
+                if action == "create":
+                    seed = data.get("seed")
+                    if seed is not None and not isinstance(seed, int):
+                        return jsonify({"status": "error", "message": "无效的参数: seed"}), 400
+                    params["seed"] = seed
+            # 播放列表状态只保存在目录所有者进程中（多进程模式下转发）
+            payload, status = self._dispatch_command("playlist", params)
+            return jsonify(payload), status
+        except Exception as e:
+            logging.error(f"播放列表操作失败: {str(e)}")
+            return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+    
+    def _run_playlist(self, action, playlist_id=None, mode=None, media_type=None, folder=None, seed=None):
+        if action == "create":
+            playlist = self.playlists.create(mode, media_type, folder, seed)
+            return {"status": "success", "playlist": playlist}, 201
+        if action == "delete":
+            if not self.playlists.delete(playlist_id):
+                return {"status": "error", "message": "播放列表不存在"}, 404
+            return {"status": "success"}, 200
+        if action == "get":
+            playlist = self.playlists.get(playlist_id)
+        elif action == "patch":
+            playlist = self.playlists.update(playlist_id, mode, media_type, folder)
+        else:
+            result = self.playlists.step(playlist_id, action)
+            if result is None:
+                return {"status": "error", "message": "播放列表不存在"}, 404
+            entry, playlist = result
+            if entry is None:
+                return {"status": "error", "message": "播放列表为空", "playlist": playlist}, 404
+            return {
+                "status": "success",
+                "media": {**entry.to_dict(), "url": f"/file/{entry.rel_path}"},
+                "playlist": playlist
+            }, 200
+        if playlist is None:
+            return {"status": "error", "message": "播放列表不存在"}, 404
+        return {"status": "success", "playlist": playlist}, 200
+    
     def _serve_file(self, filename):
         """提供媒体文件 - 优化：错误处理"""
         try:
-            # 解码URL
-            decoded_filename = urllib.parse.unquote(filename)
-            file_path = os.path.join(self.scan_directory, decoded_filename)
+            # 解码URL并规范化为目录键（统一 / 分隔；含 .. 等片段的路径直接拒绝）
+            decoded_filename = normalize_folder(urllib.parse.unquote(filename))
+            if not decoded_filename:
+                logging.warning(f"非法访问: {filename}")
+                return jsonify({"error": "禁止访问"}), 403
+            
+            # 热缓存命中：直接返回内存中的内容，无需文件系统调用
+            cached = self.file_cache.get(decoded_filename)
+            if cached is not None:
+                self._phase("resolve")
+                return self._cached_file_response(cached)
+            
+            # 目录索引命中：使用已入库条目的路径与MIME，只需一次stat
+            entry = self.catalog.get(decoded_filename)
+            self._phase("resolve")
+            if entry is not None:
+                response = self._serve_catalog_entry(entry, entry.rel_path)
+                if response is not None:
+                    return response
+            elif self.config["serve_catalog_only"]:
+                return jsonify({"error": "文件不存在"}), 404
+            
+            # 未入库（或入库后已变化）的文件：完整检查
+            file_path = os.path.join(self.scan_directory, decoded_filename.replace("/", os.sep))
             abs_path = os.path.abspath(file_path)
             
             # 安全检查（防止路径穿越）
@@ -420,40 +1332,17 @@ class MediaService:
             
             # 确定MIME类型
             file_ext = os.path.splitext(abs_path)[1].lower()
-            mime_type = MIME_MAP.get(file_ext) or mimetypes.guess_type(abs_path)[0]
-            if not mime_type:
-                mime_type = "image/" + file_ext[1:] if file_ext in self.media_config["image"]["extensions"] else "video/" + file_ext[1:]
-            
-            # 视频断点续传处理
-            range_header = request.headers.get("Range")
-            if range_header and mime_type.startswith("video/"):
-                file_size = os.path.getsize(abs_path)
-                start, end = range_header.split("=")[1].split("-")
-                start = int(start)
-                end = int(end) if end else file_size - 1
-                length = end - start + 1
-                
-                with open(abs_path, "rb") as f:
-                    f.seek(start)
-                    data = f.read(length)
-                
-                headers = {
-                    "Content-Range": f"bytes {start}-{end}/{file_size}",
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": length,
-                    "Content-Type": mime_type
-                }
-                return data, 206, headers
+            mime_type = mime_type_for(file_ext, file_ext in self.media_config["image"]["extensions"])
             
-            # 普通文件传输
+            # 文件传输（断点续传由条件响应统一处理）
             logging.debug(f"服务媒体: {abs_path} (MIME: {mime_type})")
-            return send_file(
-                abs_path,
-                mimetype=mime_type,
-                as_attachment=False,
-                conditional=True,
-                last_modified=os.path.getmtime(abs_path)
-            )
+            f = open(abs_path, "rb")
+            st = os.fstat(f.fileno())
+            self._phase("stat")
+            # 未入库的文件不进热缓存：其变化不经目录变更通知，缓存无法失效
+            return self._file_response(f, st, mime_type, None)
+        except HTTPException as e:
+            return e  # 如 416 Range无法满足
         except PermissionError as e:
             logging.error(f"权限错误: {str(e)}")
             return jsonify({"error": "权限不足"}), 403
@@ -464,54 +1353,227 @@ class MediaService:
             logging.error(f"文件服务错误: {str(e)}")
             return jsonify({"error": "服务器内部错误"}), 500
     
-    def _cleanup(self):
-        """清理无效媒体"""
+    def _stat_files(self):
+        """批量查询文件状态（是否存在、大小、修改时间、ETag），代替逐个HEAD请求
+
+        JSON: {"paths": [rel_path, ...], "verify": false}；已入库的文件直接由目录回答，
+        未入库的文件（verify 为true时包括已入库的）在线程池中一次批量stat
+        """
         try:
-            initial_count = len(self.media_db)
+            data = request.get_json(silent=True) or {}
+            paths = data.get("paths")
+            if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+                return jsonify({"status": "error", "message": "无效的参数: paths"}), 400
+            if len(paths) > FILES_STAT_MAX:
+                return jsonify({"status": "error", "message": f"单次最多查询{FILES_STAT_MAX}个文件"}), 413
+            verify = str(data.get("verify", False)).lower() in ("1", "true", "yes")
             
-            # 移除不存在/超大小的媒体
-            valid_media = []
-            for media in self.media_db:
-                if os.path.exists(media["path"]):
-                    max_size = self.media_config[media["media_type"]]["max_size"]
-                    if os.path.getsize(media["path"]) <= max_size:
-                        valid_media.append(media)
-                        continue
-                    logging.info(f"超大小清理: {media['name']}")
+            files, misses = {}, []
+            for rel_path in paths:
+                normalized = normalize_folder(rel_path)  # 含 .. 等非法片段时为None，不会解析到扫描目录之外
+                entry = self.catalog.get(normalized) if normalized else None
+                if entry is not None and not verify:
+                    files[rel_path] = {
+                        "exists": True,
+                        "size": entry.size,
+                        "last_modified": entry.last_modified,
+                        "etag": f'"{file_etag(entry.last_modified, entry.size)}"',
+                        "media_type": entry.media_type
+                    }
+                elif not normalized or (entry is None and self.config["serve_catalog_only"]):
+                    files[rel_path] = {"exists": False}
                 else:
-                    logging.info(f"不存在清理: {media['name']}")
+                    misses.append((rel_path, normalized, entry))
+            self._phase("resolve")
             
-            self.media_db = valid_media
-            removed = initial_count - len(self.media_db)
-            self._save_config()
+            if misses:
+                files.update(gevent.get_hub().threadpool.apply(self._stat_paths, (misses,)))
+                self._phase("stat")
+            return jsonify({"status": "success", "files": files, "stat_count": len(misses)})
+        except Exception as e:
+            logging.error(f"批量查询文件状态失败: {str(e)}")
+            return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+    
+    def _stat_paths(self, misses):
+        """逐个stat（在线程池中运行，不阻塞事件循环）：只有普通文件视为存在"""
+        result = {}
+        for rel_path, normalized, entry in misses:
+            path = entry.path if entry is not None else os.path.join(self.scan_directory, normalized.replace("/", os.sep))
+            try:
+                st = os.stat(path)
+            except OSError:
+                result[rel_path] = {"exists": False}
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                result[rel_path] = {"exists": False}
+                continue
+            info = {
+                "exists": True,
+                "size": st.st_size,
+                "last_modified": st.st_mtime,
+                "etag": f'"{file_etag(st.st_mtime, st.st_size)}"'
+            }
+            if entry is not None:
+                info["media_type"] = entry.media_type
+            result[rel_path] = info
+        return result
+    
+    def _serve_catalog_entry(self, entry, rel_path):
+        """提供已入库的文件：打开后fstat一次；文件已不可用或超出限制时返回None，交由完整检查给出具体错误"""
+        try:
+            f = open(entry.path, "rb")
+        except OSError:
+            return None
+        try:
+            st = os.fstat(f.fileno())
+        except OSError:
+            f.close()
+            return None
+        if not stat.S_ISREG(st.st_mode) or st.st_size > self.media_config["video"]["max_size"]:
+            f.close()
+            return None
+        self._phase("stat")
+        mime_type = mime_type_for(os.path.splitext(entry.name)[1].lower(), entry.media_type == "image")
+        return self._file_response(f, st, mime_type, rel_path)
+    
+    def _file_response(self, f, st, mime_type, rel_path):
+        """由已打开的文件构造响应（接管f的关闭）：小图片进入热缓存（rel_path为None时不缓存），大文件经线程池流式传输"""
+        try:
+            if rel_path is not None and self.file_cache.accepts(mime_type, st.st_size):
+                with f:
+                    cached = CachedFile(f.read(), mime_type, st.st_mtime, st.st_size)
+                self._phase("read")
+                self.file_cache.put(rel_path, cached)
+                return self._cached_file_response(cached)
             
-            return jsonify({
-                "status": "success",
-                "removed": removed,
-                "remaining_total": len(self.media_db),
-                "remaining_image": len([x for x in self.media_db if x["media_type"] == "image"]),
-                "remaining_video": len([x for x in self.media_db if x["media_type"] == "video"])
-            })
+            if self.streamer.accepts(st.st_size):
+                body = self.streamer.open(f, request.remote_addr)
+            else:
+                body = wrap_file(request.environ, f)
+            self._phase("open_stream")
+        except BaseException:
+            f.close()
+            raise
+        
+        response = Response(body, mimetype=mime_type, direct_passthrough=True)
+        response.content_length = st.st_size
+        response.headers["ETag"] = f'"{file_etag(st.st_mtime, st.st_size)}"'
+        response.last_modified = st.st_mtime
+        try:
+            return response.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+        except BaseException:
+            response.close()
+            raise
+    
+    def _serve_derivative(self, kind, filename):
+        """提供视频封面帧/预览片段（首次请求时提取，结果进入派生缓存）"""
+        try:
+            entry = self.catalog.get(urllib.parse.unquote(filename))
+            if entry is None or entry.media_type != "video":
+                return jsonify({"error": "视频不存在"}), 404
+            
+            key = (entry.rel_path, entry.last_modified, entry.size)
+            path = self.derivatives.lookup(kind, key)
+            if path is None:
+                future = self.derivatives.submit(kind, key, entry.path)
+                if future is None:
+                    message = "ffmpeg不可用" if not self.derivatives.available else "提取失败"
+                    return jsonify({"error": message}), 404
+                # 提取在独立线程中进行，这里只让出协程等待
+                deadline = time.time() + DERIVATIVE_WAIT
+                while not future.done() and time.time() < deadline:
+                    gevent.sleep(0.05)
+                if not future.done():
+                    return jsonify({"status": "pending"}), 202, {"Retry-After": "2"}
+                path = future.result()
+                if path is None:
+                    return jsonify({"error": "提取失败"}), 404
+            
+            f = open(path, "rb")
+            return self._file_response(f, os.fstat(f.fileno()), DERIVATIVE_KINDS[kind][1], None)
+        except HTTPException as e:
+            return e
+        except OSError as e:
+            logging.error(f"派生文件服务错误: {str(e)}")
+            return jsonify({"error": "系统错误"}), 500
+        except Exception as e:
+            logging.error(f"派生文件服务错误: {str(e)}")
+            return jsonify({"error": "服务器内部错误"}), 500
+    
+    def _cached_file_response(self, cached):
+        """由热缓存构造响应（支持条件请求与Range）"""
+        response = Response(cached.content, mimetype=cached.mime_type)
+        response.headers["ETag"] = f'"{cached.etag}"'
+        response.headers["Last-Modified"] = cached.last_modified
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(cached.content))
+    
+    def _cleanup(self):
+        """清理无效媒体"""
+        try:
+            payload, status = self._dispatch_command("cleanup", {})
+            return jsonify(payload), status
         except Exception as e:
             logging.error(f"清理失败: {str(e)}")
             return jsonify({"status": "error", "message": "服务器内部错误"}), 500
     
+    def _cleanup_invalid(self):
+        """移除不存在/超大小的媒体"""
+        # 基于快照检查文件，不阻塞读者与写者
+        invalid = []
+        for media in self.catalog.snapshot.entries:
+            if os.path.exists(media.path):
+                max_size = self.media_config[media.media_type]["max_size"]
+                if os.path.getsize(media.path) <= max_size:
+                    continue
+                logging.info(f"超大小清理: {media.name}")
+            else:
+                logging.info(f"不存在清理: {media.name}")
+            invalid.append(media.rel_path)
+        
+        removed = self.catalog.remove_many(invalid)
+        self._save_config()
+        
+        snapshot = self.catalog.snapshot
+        return {
+            "status": "success",
+            "removed": removed,
+            "remaining_total": snapshot.total_count,
+            "remaining_image": snapshot.image_count,
+            "remaining_video": snapshot.video_count
+        }, 200
+    
     def _service_status(self):
         """服务状态"""
         try:
             config = self._save_config()
+            snapshot = self.catalog.snapshot
+            watcher = self.poller or self.observer
             return jsonify({
                 "active": True,
-                "observer_active": self.observer.is_alive() if self.observer else False,
+                "warming": self.warming,
+                "observer_active": watcher.is_alive() if watcher else False,
+                "watch_backend": "polling" if self.poller else ("watchdog" if self.observer else None),
+                "poller": self.poller.get_metrics() if self.poller else None,
                 "directory": self.scan_directory,
-                "total_count": len(self.media_db),
-                "image_count": len([x for x in self.media_db if x["media_type"] == "image"]),
-                "video_count": len([x for x in self.media_db if x["media_type"] == "video"]),
+                "total_count": snapshot.total_count,
+                "image_count": snapshot.image_count,
+                "video_count": snapshot.video_count,
+                "catalog_revision": snapshot.revision,
                 "last_updated": config.get("last_updated", "未知"),
+                "websocket": self.ws_manager.get_metrics(),
+                "file_cache": self.file_cache.get_metrics(),
+                "streaming": self.streamer.get_metrics(),
+                "derivatives": self.derivatives.get_metrics(),
+                "metadata": self.metadata.get_metrics(),
+                "search": self.search.get_metrics() if self.search is not None else None,
+                "logging": get_logging_stats(),
+                "moves": self.moves.get_metrics(),
+                "playlists": self.playlists.get_metrics(),
                 "media_config": {
                     "image_max_size_mb": self.media_config["image"]["max_size"] / 1024 / 1024,
                     "video_max_size_mb": self.media_config["video"]["max_size"] / 1024 / 1024
-                }
+                },
+                "startup": self.startup.to_dict()
             })
         except Exception as e:
             logging.error(f"状态检查错误: {str(e)}")
@@ -521,44 +1583,66 @@ class MediaService:
         """WebSocket处理"""
         if request.environ.get("wsgi.websocket"):
             ws = request.environ["wsgi.websocket"]
+            connection_id = id(ws)
             self.ws_manager.add_connection(ws)
             
             try:
                 # 初始化消息
+                snapshot = self.catalog.snapshot
                 init_msg = json.dumps({
                     "type": "init",
-                    "total_count": len(self.media_db),
-                    "image_count": len([x for x in self.media_db if x["media_type"] == "image"]),
-                    "video_count": len([x for x in self.media_db if x["media_type"] == "video"])
+                    "total_count": snapshot.total_count,
+                    "image_count": snapshot.image_count,
+                    "video_count": snapshot.video_count
                 })
-                ws.send(init_msg)
+                self.ws_manager.send_to(connection_id, init_msg)
                 
                 # 心跳与筛选处理
                 while True:
                     message = ws.receive()
                     if not message:
                         break
+                    self.ws_manager.update_activity(connection_id)
                     msg = json.loads(message)
                     if msg.get("type") == "ping":
-                        ws.send(json.dumps({"type": "pong", "timestamp": time.time()}))
+                        self.ws_manager.send_to(connection_id, json.dumps({"type": "pong", "timestamp": time.time()}))
                     elif msg.get("type") == "filter_media":
                         media_type = msg.get("media_type", "all")
-                        filtered = len([x for x in self.media_db if x["media_type"] == media_type]) if media_type != "all" else len(self.media_db)
-                        ws.send(json.dumps({"type": "filtered_media", "count": filtered}))
+                        filtered = self.catalog.snapshot.count(media_type)
+                        self.ws_manager.send_to(connection_id, json.dumps({"type": "filtered_media", "count": filtered}))
             except Exception as e:
                 logging.error(f"WebSocket错误: {str(e)}")
             finally:
-                connection_id = id(ws)
                 self.ws_manager.remove_connection(connection_id)
         return ""
     
     def _setup_watchdog(self):
-        """设置文件监控"""
+        """设置文件监控（watchdog事件，或目录签名轮询）"""
         if self.observer and self.observer.is_alive():
             self.observer.stop()
             self.observer.join()
+        if self.poller is not None:
+            self.poller.stop()
+        self.observer = self.poller = None
         
         if self.scan_directory and os.path.exists(self.scan_directory):
+            backend = self.config["watch_backend"]
+            if backend == "auto":
+                backend = "polling" if needs_polling(self.scan_directory) else "watchdog"
+            if backend == "polling":
+                self.poller = DirectoryPoller(
+                    self.scan_directory,
+                    self.media_config["image"]["extensions"] + self.media_config["video"]["extensions"],
+                    self._apply_polled_changes,
+                    interval_min=self.config["poll_interval_min"],
+                    interval_max=self.config["poll_interval_max"],
+                    known=self._known_files
+                )
+                self.poller.start()
+                logging.info(f"文件监控启用（轮询，文件系统: {filesystem_type(self.scan_directory) or '未知'}）: "
+                             f"{self.scan_directory}")
+                return
+            from watchdog.observers import Observer  # 延迟导入平台监控后端，不拖慢启动
             event_handler = MediaDBHandler(self)
             self.observer = Observer()
             self.observer.schedule(event_handler, self.scan_directory, recursive=True)
@@ -567,8 +1651,38 @@ class MediaService:
         else:
             logging.warning("监控未启动: 目录无效")
     
-    def init_service(self):
-        """初始化服务"""
+    def _known_files(self):
+        """已入库文件的 (大小, 修改时间)，轮询建立基线时免去逐个stat"""
+        return {entry.rel_path: (entry.size, entry.last_modified) for entry in self.catalog.snapshot.entries}
+    
+    def _apply_polled_changes(self, created, modified, deleted):
+        """轮询检测到的变化（文件已写入完成）：一批只发布一次快照"""
+        with self.catalog.batch():
+            # 先处理删除：同一轮内出现的改名（删除+新建）直接配对改键
+            for full_path in deleted:
+                rel_path = self._rel_path(full_path)
+                self.file_cache.invalidate(rel_path)
+                self._forget_media(rel_path)
+            for full_path in created:
+                rel_path = self._rel_path(full_path)
+                self.file_cache.invalidate(rel_path)
+                if not self._pair_created(full_path):
+                    self._process_single_file(full_path)
+                    self._track_created(rel_path)
+            for full_path in modified:
+                self.file_cache.invalidate(self._rel_path(full_path))
+                self._process_single_file(full_path)
+        for event_name, paths in (("created", created), ("modified", modified), ("deleted", deleted)):
+            if paths:
+                self.watchdog_events.labels(event_name).inc(len(paths))
+        self._save_config()
+        self._send_update_event()
+    
+    def init_service(self, background=False):
+        """初始化服务
+
+        background=True 时立即返回（服务可先绑定端口，/status 报告 warming），目录扫描与文件监控在后台线程进行
+        """
         logging.info("=" * 80)
         logging.info("优化版本地媒体服务启动（支持图片+视频）")
         logging.info("服务地址: http://127.0.0.1:9000")
@@ -577,11 +1691,39 @@ class MediaService:
         logging.info(f"视频格式: {', '.join([ext[1:].upper() for ext in self.media_config['video']['extensions']])}")
         logging.info("=" * 80)
         
-        self.update_db_incremental()
-        self._setup_watchdog()
+        if background:
+            self.warming = True
+            threading.Thread(target=self._warm_up, name="catalog-warmup", daemon=True).start()
+        else:
+            self._warm_up()
+    
+    def _warm_up(self):
+        """加载目录并启动文件监控（后台启动时在独立线程中运行，期间请求看到的是空目录）"""
+        try:
+            with self.startup.phase("catalog_scan"):
+                self.update_db_incremental()
+            with self.startup.phase("file_watcher"):
+                self._setup_watchdog()
+            if self.config["retention_enabled"] and not self.read_only:
+                self.retention.start()
+                logging.info(f"保留策略: 每{self.config['retention_interval_minutes']}分钟执行一次 "
+                             f"{self.retention.policy.to_dict()}")
+        except Exception as e:
+            logging.error(f"目录加载失败: {str(e)}")
+        finally:
+            self.warming = False
+        
+        if self.derivatives.available:
+            logging.info(f"ffmpeg: {self.derivatives.ffmpeg}（封面/预览已启用）")
+            threading.Thread(target=self.derivatives.cache.prune, name="derivative-prune", daemon=True).start()
+        else:
+            logging.info("未找到ffmpeg，跳过视频封面/预览生成")
         
         logging.info(f"当前目录: {self.scan_directory}")
-        logging.info(f"媒体统计: 总计{len(self.media_db)} | 图片{len([x for x in self.media_db if x['media_type']=='image'])} | 视频{len([x for x in self.media_db if x['media_type']=='video'])}")
+        snapshot = self.catalog.snapshot
+        logging.info(f"媒体统计: 总计{snapshot.total_count} | 图片{snapshot.image_count} | 视频{snapshot.video_count}")
+        self.startup.mark("ready")
+        self.startup.log()
         logging.info("优化版服务就绪 | Ctrl+C终止")
 
 # 优化的文件系统事件处理器
@@ -589,9 +1731,24 @@ class MediaDBHandler(FileSystemEventHandler):
     def __init__(self, media_service):
         self.media_service = media_service
     
+    def _rel_path(self, path):
+        return os.path.relpath(os.path.normpath(path), self.media_service.scan_directory).replace("\\", "/")
+    
+    def _record(self, event_name, start):
+        self.media_service.watchdog_events.labels(event_name).inc()
+        self.media_service.watchdog_lag.labels(event_name).observe_since(start)
+    
     def on_created(self, event):
         if not event.is_directory and any(event.src_path.lower().endswith(ext) for ext in 
             self.media_service.media_config["image"]["extensions"] + self.media_service.media_config["video"]["extensions"]):
+            start = time.perf_counter()
+            self.media_service.file_cache.invalidate(self._rel_path(event.src_path))
+            if self.media_service._pair_created(event.src_path):
+                # 与刚删除的文件配对（漏报的移动）：内容已完整，不必等待
+                self.media_service._save_config()
+                self.media_service._send_update_event()
+                self._record("moved", start)
+                return
             LARGE_FILE_THRESHOLD = 200 * 1024 * 1024  # 200MB阈值
             # 若为大文件，延长等待时间
             if os.path.exists(event.src_path) and os.path.getsize(event.src_path) > LARGE_FILE_THRESHOLD:
@@ -599,37 +1756,56 @@ class MediaDBHandler(FileSystemEventHandler):
             else:
                 time.sleep(1.5)  # 普通文件等待1.5秒
             self.media_service.update_db_incremental([event.src_path])
+            self.media_service._track_created(self._rel_path(event.src_path))
+            self._record("created", start)
 
     def on_deleted(self, event):
         if not event.is_directory:
+            start = time.perf_counter()
             deleted_path = os.path.normpath(event.src_path)
-            self.media_service.media_db = [m for m in self.media_service.media_db if os.path.normpath(m["path"]) != deleted_path]
-            logging.info(f"删除媒体: {os.path.basename(deleted_path)}")
-            self.media_service._save_config()
-            self.media_service._send_update_event()
+            rel_path = self._rel_path(deleted_path)
+            self.media_service.file_cache.invalidate(rel_path)
+            if self.media_service._forget_media(rel_path):
+                self.media_service._save_config()
+                self.media_service._send_update_event()
+            self._record("deleted", start)
 
     def on_modified(self, event):
         if not event.is_directory and any(event.src_path.lower().endswith(ext) for ext in 
             self.media_service.media_config["image"]["extensions"] + self.media_service.media_config["video"]["extensions"]):
+            # 内容已变化：立即失效热缓存，不等待入库
+            start = time.perf_counter()
+            self.media_service.file_cache.invalidate(self._rel_path(event.src_path))
             LARGE_FILE_THRESHOLD = 200 * 1024 * 1024
             if os.path.exists(event.src_path) and os.path.getsize(event.src_path) > LARGE_FILE_THRESHOLD:
                 time.sleep(3)  # 大文件修改等待3秒
             else:
                 time.sleep(1)   # 普通文件修改等待1秒
             self.media_service.update_db_incremental([event.src_path])
+            self._record("modified", start)
+
+    def on_moved(self, event):
+        start = time.perf_counter()
+        if event.is_directory:
+            changed = self.media_service.move_directory(event.src_path, event.dest_path)
+        else:
+            changed = self.media_service.move_media(event.src_path, event.dest_path)
+        if changed:
+            self.media_service._save_config()
+            self.media_service._send_update_event()
+        self._record("moved", start)
 
 if __name__ == "__main__":
     # 确保编码正确
-    if not sys.stdout.encoding or sys.stdout.encoding.lower() != 'utf-8':
-        sys.stdout = open(sys.stdout.fileno(), mode='w', encoding='utf-8', buffering=1)
-    if not sys.stderr.encoding or sys.stderr.encoding.lower() != 'utf-8':
-        sys.stderr = open(sys.stderr.fileno(), mode='w', encoding='utf-8', buffering=1)
+    configure_stdio()
     
-    # 创建并启动服务
+    # 创建并启动服务（先绑定端口，目录在后台加载）
     media_service = MediaService()
-    media_service.init_service()
+    media_service.init_service(background=True)
     
     # 启动服务器
     server = pywsgi.WSGIServer(('127.0.0.1', 9000), media_service.app, handler_class=WebSocketHandler)
+    server.start()
+    media_service.startup.mark("listening")
     logging.info("服务器启动成功，监听端口 9000")
     server.serve_forever()
\ No newline at end of file
@@ -0,0 +1,867 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体目录数据结构与序列化工具
+为本地媒体服务提供条目预编码、列表响应拼接、二进制列式导出、写时复制目录快照、目录树汇总等功能
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import bisect
+import struct
+import logging
+import itertools
+import threading
+import contextlib
+from array import array
+
+# 可选依赖：orjson（存在时使用更快的编码器）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 标准库编码器：紧凑输出 + 保留非ASCII字符（UTF-8）
+_std_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+# JSON字符串中需要转义的字符（非ASCII字符按UTF-8原样输出）
+_NEEDS_ESCAPE = re.compile(r'["\\\x00-\x1f]')
+
+# 列表响应中条目数组的字段名
+MEDIA_LIST_KEY = b'"media":['
+
+
+def dumps_bytes(obj):
+    """将对象编码为UTF-8 JSON字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _std_encoder.encode(obj).encode('utf-8')
+
+
+def encode_entry(media_info):
+    """预编码单个媒体条目（MediaEntry 插入或修改时以此生成 size 之后各字段的尾部）"""
+    if orjson is not None:
+        # orjson输出缓冲区有预留空间，长期保存的片段复制为精确大小
+        return bytes(memoryview(orjson.dumps(media_info)))
+    return dumps_bytes(media_info)
+
+
+def _escape(text):
+    """JSON字符串的内容部分（不含两侧引号）：逐字符转义，可与其他片段直接拼接"""
+    if _NEEDS_ESCAPE.search(text) is None:
+        return text.encode('utf-8')  # 常见情况：无需转义，直接编码
+    return dumps_bytes(text)[1:-1]
+
+
+def encode_fragments(entries):
+    """生成条目的JSON片段（与 encode_entry(entry.to_dict()) 相同）
+
+    条目只保存 size 之后各字段的预编码尾部；path / rel_path / name 在此拼接，
+    目录前缀每次调用每个目录只编码一次，文件名每个条目编码一次
+    """
+    prefixes = {}
+    fragments = []
+    append = fragments.append
+    join = b"".join
+    last_root = last_dir = path_prefix = rel_prefix = None
+    for entry in entries:
+        # 同一目录的条目通常相邻（rel_dir 已驻留，可按引用比较）
+        if entry.rel_dir is not last_dir or entry.root is not last_root:
+            last_root, last_dir = entry.root, entry.rel_dir
+            prefix = prefixes.get((last_root, last_dir))
+            if prefix is None:
+                directory = os.path.join(last_root, last_dir.replace("/", os.sep)) if last_dir else last_root
+                prefix = prefixes[(last_root, last_dir)] = (
+                    b'{"path":"' + _escape(os.path.join(directory, "")),
+                    b'","rel_path":"' + _escape(f"{last_dir}/" if last_dir else "")
+                )
+            path_prefix, rel_prefix = prefix
+        name = _escape(entry.name)
+        append(join((path_prefix, name, rel_prefix, name, b'","name":"', name, b'",', entry.tail)))
+    return fragments
+
+
+def build_list_body(fragments, meta, key=MEDIA_LIST_KEY):
+    """拼接预编码片段生成列表响应体
+
+    fragments: 已编码的条目字节串序列
+    meta: 其他顶层字段（total_count等），与条目数组合并到同一对象
+    """
+    meta_bytes = dumps_bytes(meta)
+    parts = [b'{', key, b','.join(fragments), b']']
+    if meta_bytes != b'{}':
+        parts.append(b',')
+        parts.append(meta_bytes[1:-1])
+    parts.append(b'}')
+    return b''.join(parts)
+
+
+class MediaEntry:
+    """紧凑媒体条目 - 优化：__slots__ + 驻留目录前缀
+
+    只保存根目录引用、相对目录（驻留共享）与文件名，path / rel_path 按需拼接；
+    width / height / duration / codec 为元数据（未提取或无法识别时为None）
+    """
+    __slots__ = ("root", "rel_dir", "name", "size", "media_type", "last_modified",
+                 "width", "height", "duration", "codec", "tail")
+
+    def __init__(self, root, rel_path, size, media_type, last_modified,
+                 width=None, height=None, duration=None, codec=None):
+        rel_dir, _, name = rel_path.rpartition("/")
+        self.root = root
+        self.rel_dir = sys.intern(rel_dir)
+        self.name = name
+        self.size = size
+        self.media_type = sys.intern(media_type)
+        self.last_modified = last_modified
+        self.width = width
+        self.height = height
+        self.duration = duration
+        self.codec = sys.intern(codec) if codec else None
+        # 预编码 size 之后各字段（插入或修改时生成一次）；路径与文件名在生成列表时拼接，不重复存储
+        self.tail = encode_entry({
+            "size": size,
+            "media_type": self.media_type,
+            "last_modified": last_modified,
+            "width": width,
+            "height": height,
+            "duration": duration,
+            "codec": self.codec
+        })[1:]
+
+    def with_metadata(self, width, height, duration, codec):
+        """返回附带元数据的新条目（条目本身不可变，快照中的旧条目不受影响）"""
+        return MediaEntry(self.root, self.rel_path, self.size, self.media_type, self.last_modified,
+                          width, height, duration, codec)
+
+    def with_path(self, rel_path):
+        """返回改名/移动后的新条目（大小、修改时间与元数据不变）"""
+        return MediaEntry(self.root, rel_path, self.size, self.media_type, self.last_modified,
+                          self.width, self.height, self.duration, self.codec)
+
+    @property
+    def fragment(self):
+        """单个条目的完整JSON片段"""
+        return encode_fragments((self,))[0]
+
+    @property
+    def orientation(self):
+        if not self.width or not self.height:
+            return None
+        if self.width == self.height:
+            return "square"
+        return "landscape" if self.width > self.height else "portrait"
+
+    @property
+    def rel_path(self):
+        return f"{self.rel_dir}/{self.name}" if self.rel_dir else self.name
+
+    @property
+    def path(self):
+        if self.rel_dir:
+            return os.path.join(self.root, self.rel_dir.replace("/", os.sep), self.name)
+        return os.path.join(self.root, self.name)
+
+    def to_dict(self):
+        """还原为原有的字典格式（wire format）"""
+        return {
+            "path": self.path,
+            "rel_path": self.rel_path,
+            "name": self.name,
+            "size": self.size,
+            "media_type": self.media_type,
+            "last_modified": self.last_modified,
+            "width": self.width,
+            "height": self.height,
+            "duration": self.duration,
+            "codec": self.codec
+        }
+
+    def __repr__(self):
+        return f"MediaEntry({self.rel_path!r}, {self.media_type}, {self.size})"
+
+
+
+def normalize_folder(folder):
+    """规范化子目录参数：统一为 / 分隔、去除首尾斜杠，"" 表示根目录；含 .. 等非法片段时返回None"""
+    parts = [part for part in (folder or "").replace("\\", "/").split("/") if part]
+    if any(part in (".", "..") for part in parts):
+        return None
+    return "/".join(parts)
+
+
+class DirectoryNode:
+    """目录树节点 - 优化：持久化结构，修改时沿路径复制节点，旧快照持有的树不受影响
+
+    files 为本目录下的直接条目（文件名 -> MediaEntry）；
+    image_count / video_count / total_bytes / newest_mtime 为整个子树的汇总，随增删增量维护
+    """
+    __slots__ = ("name", "children", "files", "image_count", "video_count", "total_bytes",
+                 "newest_mtime", "generation")
+
+    def __init__(self, name="", generation=0):
+        self.name = name
+        self.children = {}  # 子目录名 -> DirectoryNode
+        self.files = {}
+        self.image_count = 0
+        self.video_count = 0
+        self.total_bytes = 0
+        self.newest_mtime = None
+        self.generation = generation  # 创建（复制）该节点的发布批次，同一批次内可原地修改
+
+    def copy(self, generation):
+        node = DirectoryNode(self.name, generation)
+        node.children = dict(self.children)
+        node.files = dict(self.files)
+        node.image_count = self.image_count
+        node.video_count = self.video_count
+        node.total_bytes = self.total_bytes
+        node.newest_mtime = self.newest_mtime
+        return node
+
+    @property
+    def total_count(self):
+        return self.image_count + self.video_count
+
+    def count(self, media_type):
+        if media_type == "image":
+            return self.image_count
+        if media_type == "video":
+            return self.video_count
+        return self.total_count
+
+    def _added(self, entry):
+        if entry.media_type == "image":
+            self.image_count += 1
+        else:
+            self.video_count += 1
+        self.total_bytes += entry.size
+        if self.newest_mtime is None or entry.last_modified > self.newest_mtime:
+            self.newest_mtime = entry.last_modified
+
+    def _removed(self, entry):
+        if entry.media_type == "image":
+            self.image_count -= 1
+        else:
+            self.video_count -= 1
+        self.total_bytes -= entry.size
+        if self.newest_mtime is not None and entry.last_modified >= self.newest_mtime:
+            # 删除的可能是最新文件：由直接条目与子目录（已先行更新）重新汇总
+            self.newest_mtime = max(
+                itertools.chain((m.last_modified for m in self.files.values()),
+                                (child.newest_mtime for child in self.children.values()
+                                 if child.newest_mtime is not None)),
+                default=None
+            )
+
+    def _aggregate(self):
+        """自底向上把子目录汇总并入本节点（批量构建时使用，节点原先只汇总了直接条目）"""
+        for child in self.children.values():
+            child._aggregate()
+            self.image_count += child.image_count
+            self.video_count += child.video_count
+            self.total_bytes += child.total_bytes
+            if self.newest_mtime is None or child.newest_mtime > self.newest_mtime:
+                self.newest_mtime = child.newest_mtime
+
+    def iter_entries(self):
+        """遍历子树内的全部条目（先本目录，再各子目录）"""
+        yield from self.files.values()
+        for child in self.children.values():
+            yield from child.iter_entries()
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "image_count": self.image_count,
+            "video_count": self.video_count,
+            "total_count": self.total_count,
+            "total_bytes": self.total_bytes,
+            "newest_mtime": self.newest_mtime,
+            "file_count": len(self.files),
+            "folder_count": len(self.children)
+        }
+
+    def to_dict(self, path, depth):
+        """节点汇总，并按名称展开 depth 层子目录（depth=0 只返回本节点）"""
+        info = {"path": path, **self.summary()}
+        if depth > 0:
+            info["children"] = [
+                child.to_dict(f"{path}/{name}" if path else name, depth - 1)
+                for name, child in sorted(self.children.items())
+            ]
+        return info
+
+
+def _replay(base, log, count):
+    """在条目元组 base 上按顺序应用变更 log[:count]，得到新的条目元组（与目录字典的插入顺序一致）"""
+    changes = log[:count]
+    olds = {old for old, _ in changes if old is not None}
+    entries = list(base)
+    position = {entry: i for i, entry in enumerate(entries) if entry in olds} if olds else {}
+    for old, new in changes:
+        if old is None:
+            position[new] = len(entries)
+            entries.append(new)
+            continue
+        i = position.pop(old)
+        entries[i] = new
+        if new is not None:
+            position[new] = i
+    return tuple(entry for entry in entries if entry is not None)
+
+
+# 快照变更日志的最小重放长度（超过该值且超过目录1/8时发布即生成条目元组）
+LOG_MIN = 1024
+
+
+class CatalogSnapshot:
+    """不可变目录快照：读者无锁获取引用，写者构建新版本后原子替换
+
+    条目元组按需生成：增量发布时只记录 (基准元组, 变更日志, 日志长度)，
+    首次读取 entries 时才在基准元组上重放变更，单个文件的变更不必复制整个目录
+    """
+    __slots__ = ("revision", "_entries", "_base", "_log", "_log_len", "image_count", "video_count",
+                 "last_updated", "tree", "_views")
+
+    def __init__(self, revision, entries, image_count, video_count, last_updated, tree=None, base=None, log=None):
+        self.revision = revision
+        self._entries = entries  # tuple[MediaEntry]，为None时由 base + log 重放生成
+        self._base = base
+        self._log = log
+        self._log_len = len(log) if log is not None else 0
+        self.image_count = image_count
+        self.video_count = video_count
+        self.last_updated = last_updated
+        self.tree = tree if tree is not None else DirectoryNode()  # 目录树根节点（与快照同版本）
+        self._views = {}
+
+    @property
+    def entries(self):
+        entries = self._entries
+        if entries is None:
+            # 并发读取时可能重复生成，结果相同
+            entries = self._entries = _replay(self._base, self._log, self._log_len)
+        return entries
+
+    @property
+    def materialized(self):
+        return self._entries is not None
+
+    @property
+    def total_count(self):
+        return self.image_count + self.video_count
+
+    def filter(self, media_type):
+        """按类型筛选条目（结果缓存在快照上，快照不变则无需重复筛选）"""
+        if media_type not in ("image", "video"):
+            return self.entries
+        view = self._views.get(media_type)
+        if view is None:
+            view = self._views[media_type] = tuple(m for m in self.entries if m.media_type == media_type)
+        return view
+
+    def _sorted_index(self, attr):
+        """按元数据字段排序的索引：(有序取值列表, 对应条目位置列表)，未知值不入索引"""
+        key = ("index", attr)
+        index = self._views.get(key)
+        if index is None:
+            pairs = sorted((getattr(m, attr), i) for i, m in enumerate(self.entries)
+                           if getattr(m, attr) is not None)
+            index = self._views[key] = ([v for v, _ in pairs], [i for _, i in pairs])
+        return index
+
+    def _orientation_index(self):
+        index = self._views.get("orientation")
+        if index is None:
+            index = {"portrait": [], "landscape": [], "square": []}
+            for i, m in enumerate(self.entries):
+                orientation = m.orientation
+                if orientation is not None:
+                    index[orientation].append(i)
+            self._views["orientation"] = index
+        return index
+
+    def folder(self, rel_dir):
+        """按相对路径查找目录节点（"" 为根目录），不存在时返回None"""
+        node = self.tree
+        for part in rel_dir.split("/") if rel_dir else ():
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def folder_entries(self, rel_dir, media_type="all"):
+        """子目录（含下级目录）内的条目，只遍历该子树（结果缓存在快照上）"""
+        if not rel_dir:
+            return self.filter(media_type)
+        key = ("folder", rel_dir, media_type)
+        view = self._views.get(key)
+        if view is None:
+            node = self.folder(rel_dir)
+            entries = node.iter_entries() if node is not None else ()
+            if media_type in ("image", "video"):
+                entries = (m for m in entries if m.media_type == media_type)
+            view = self._views[key] = tuple(entries)
+        return view
+
+    def query(self, media_type="all", ranges=None, orientation=None, folder=""):
+        """按类型、子目录与元数据筛选条目，保持快照原有顺序（限定子目录时为目录树顺序）
+
+        ranges: {字段: (下限, 上限)}，字段为 width / height / duration，上下限可为None；
+        有元数据条件时，元数据未知的条目不出现在结果中
+        """
+        if folder:
+            # 限定子目录：只遍历该子树，元数据条件逐条判断
+            result = self.folder_entries(folder, media_type)
+            if ranges or orientation:
+                result = tuple(m for m in result if _matches_metadata(m, ranges, orientation))
+            return result
+        if not ranges and not orientation:
+            return self.filter(media_type)
+        positions = None
+        for attr, (low, high) in (ranges or {}).items():
+            values, order = self._sorted_index(attr)
+            start = 0 if low is None else bisect.bisect_left(values, low)
+            stop = len(values) if high is None else bisect.bisect_right(values, high)
+            matched = set(order[start:stop])
+            positions = matched if positions is None else positions & matched
+        if orientation:
+            matched = set(self._orientation_index().get(orientation, ()))
+            positions = matched if positions is None else positions & matched
+        entries = self.entries
+        result = [entries[i] for i in sorted(positions)]
+        if media_type in ("image", "video"):
+            result = [m for m in result if m.media_type == media_type]
+        return tuple(result)
+
+    def count(self, media_type):
+        if media_type == "image":
+            return self.image_count
+        if media_type == "video":
+            return self.video_count
+        return self.total_count if media_type == "all" else 0
+
+
+def _matches_metadata(entry, ranges, orientation):
+    for attr, (low, high) in (ranges or {}).items():
+        value = getattr(entry, attr)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return not orientation or entry.orientation == orientation
+
+
+class MediaCatalog:
+    """线程安全媒体目录 - 优化：写时复制快照
+
+    写者（watchdog线程、扫描、清理）持锁修改内部字典并发布新快照；
+    读者（请求处理）直接读取 snapshot 属性，无需加锁，不会读到中间状态
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}  # rel_path -> MediaEntry（保持插入顺序）
+        self._counts = {"image": 0, "video": 0}
+        self._batch_depth = 0
+        self._pending_changes = []
+        self._listeners = []
+        self._tree = DirectoryNode()
+        self._tree_generation = 1  # 当前发布批次（已发布快照持有的节点属于更早批次，不再原地修改）
+        self._log_base = ()  # 增量快照的基准条目元组与其后的变更日志（只追加，重新定基准时换新列表）
+        self._log = []
+        self.snapshot = CatalogSnapshot(0, (), 0, 0, time.strftime("%Y-%m-%d %H:%M:%S"), self._tree)
+
+    @property
+    def revision(self):
+        return self.snapshot.revision
+
+    def add_listener(self, listener):
+        """注册变更监听器：listener(snapshot, changes)
+
+        changes 为 [(旧条目, 新条目), ...]，新增时旧条目为None，删除时新条目为None；
+        全量替换时 changes 为 None
+        """
+        self._listeners.append(listener)
+
+    def get(self, rel_path):
+        """按相对路径查找条目（读取当前快照之外的最新状态）"""
+        return self._entries.get(rel_path)
+
+    @contextlib.contextmanager
+    def batch(self, revision=None):
+        """批量修改：退出时只发布一次快照
+
+        revision: 指定新快照版本号（多进程模式下应用增量时沿用目录所有者进程的版本号）
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._pending_changes:
+                    changes, self._pending_changes = self._pending_changes, []
+                    self._publish(changes, revision)
+
+    def replace_all(self, entries, revision=None):
+        """全量替换（全量扫描完成或加载共享快照后调用）
+
+        revision: 指定新快照版本号（多进程模式下沿用目录所有者进程的版本号）
+        """
+        with self._lock:
+            self._entries = {m.rel_path: m for m in entries}
+            self._counts = {"image": 0, "video": 0}
+            self._tree = DirectoryNode(generation=self._tree_generation)
+            nodes = {}  # rel_dir -> 目录节点（先只汇总直接条目，最后自底向上合并子树）
+            for m in self._entries.values():
+                self._counts[m.media_type] += 1
+                node = nodes.get(m.rel_dir)
+                if node is None:
+                    node = nodes[m.rel_dir] = self._tree_path(m.rel_dir, True)[-1]
+                node.files[m.name] = m
+                node._added(m)
+            self._tree._aggregate()
+            self._pending_changes = []
+            self._publish(None, revision)
+
+    def upsert(self, entry):
+        """新增或更新条目（已存在时保持原位置）"""
+        with self._lock:
+            old = self._entries.get(entry.rel_path)
+            if old is not None:
+                self._counts[old.media_type] -= 1
+                self._tree_remove(old)
+            self._entries[entry.rel_path] = entry
+            self._counts[entry.media_type] += 1
+            self._tree_add(entry)
+            self._changed(old, entry)
+
+    def remove(self, rel_path):
+        """删除条目，返回是否存在"""
+        with self._lock:
+            old = self._entries.pop(rel_path, None)
+            if old is None:
+                return False
+            self._counts[old.media_type] -= 1
+            self._tree_remove(old)
+            self._changed(old, None)
+            return True
+
+    def remove_many(self, rel_paths):
+        """批量删除，返回实际删除数量"""
+        with self.batch():
+            return sum(1 for rel_path in rel_paths if self.remove(rel_path))
+
+    def _tree_path(self, rel_dir, create):
+        """从根到目录节点的可修改节点列表（本批次内首次修改的节点先复制）；目录不存在且不创建时返回None"""
+        generation = self._tree_generation
+        if self._tree.generation != generation:
+            self._tree = self._tree.copy(generation)
+        path = [self._tree]
+        for part in rel_dir.split("/") if rel_dir else ():
+            parent = path[-1]
+            node = parent.children.get(part)
+            if node is None:
+                if not create:
+                    return None
+                node = parent.children[part] = DirectoryNode(part, generation)
+            elif node.generation != generation:
+                node = parent.children[part] = node.copy(generation)
+            path.append(node)
+        return path
+
+    def _tree_add(self, entry):
+        path = self._tree_path(entry.rel_dir, True)
+        path[-1].files[entry.name] = entry
+        for node in path:
+            node._added(entry)
+
+    def _tree_remove(self, entry):
+        path = self._tree_path(entry.rel_dir, False)
+        if path is None or path[-1].files.pop(entry.name, None) is None:
+            return
+        for node in reversed(path):
+            node._removed(entry)
+        # 清理已空的目录节点
+        for parent, node in zip(reversed(path[:-1]), reversed(path[1:])):
+            if node.total_count:
+                break
+            del parent.children[node.name]
+
+    def _changed(self, old, new):
+        self._pending_changes.append((old, new))
+        if self._batch_depth == 0:
+            changes, self._pending_changes = self._pending_changes, []
+            self._publish(changes)
+
+    def _publish(self, changes, revision=None):
+        """构建并原子替换快照，然后通知监听器
+
+        增量变更只追加到变更日志（O(变更数)）；上一快照的条目已生成时以其为新基准，
+        日志超过目录的1/8时直接生成条目元组，重放开销按变更数分摊
+        """
+        previous = self.snapshot
+        entries = None
+        if changes is None:
+            entries = tuple(self._entries.values())
+        else:
+            if previous.materialized:
+                self._log_base, self._log = previous.entries, []
+            self._log.extend(changes)
+            if len(self._log) > max(LOG_MIN, len(self._entries) // 8):
+                entries = tuple(self._entries.values())
+        if entries is not None:
+            self._log_base, self._log = entries, []
+        snapshot = CatalogSnapshot(
+            previous.revision + 1 if revision is None else revision,
+            entries,
+            self._counts["image"],
+            self._counts["video"],
+            time.strftime("%Y-%m-%d %H:%M:%S"),
+            self._tree,
+            base=self._log_base,
+            log=self._log
+        )
+        self._tree_generation += 1
+        self.snapshot = snapshot
+        for listener in self._listeners:
+            try:
+                listener(snapshot, changes)
+            except Exception as e:
+                logging.error(f"目录监听器错误: {str(e)}")
+
+
+# ---------------------------------------------------------------------------
+# 二进制列式目录导出（/media.bin）
+#
+# 格式（小端序）：
+#   头部: magic "STMB" | version u16 | flags u16 | revision u64 | count u32
+#   之后依次为若干段，每段以 u32 字节长度为前缀：
+#     root      根目录（UTF-8）
+#     dirs      目录字符串表
+#     exts      扩展名字符串表
+#     dir_idx   u32[count]  目录表索引
+#     ext_idx   u16[count]  扩展名表索引
+#     type      u8[count]   0=image 1=video
+#     size      u64[count]
+#     mtime     f64[count]
+#     stems     文件名（不含扩展名）字符串表，顺序与条目一致
+#   版本2追加元数据段：
+#     width     u32[count]  0=未知
+#     height    u32[count]  0=未知
+#     duration  f64[count]  NaN=未知
+#     codecs    编码格式字符串表（第0项为空串）
+#     codec_idx u16[count]  编码格式表索引，0=未知
+#   字符串表: count u32 | offsets u32[count+1] | UTF-8 数据
+# ---------------------------------------------------------------------------
+
+CATALOG_BIN_MAGIC = b"STMB"
+CATALOG_BIN_VERSION = 2
+_BIN_READABLE_VERSIONS = (1, 2)
+_BIN_HEADER = struct.Struct("<4sHHQI")
+_BIN_SECTION = struct.Struct("<I")
+_TYPE_CODES = {"image": 0, "video": 1}
+_TYPE_NAMES = ("image", "video")
+
+
+def _array_bytes(arr):
+    """array转小端字节串"""
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _encode_string_table(strings):
+    offsets = array("I", [0])
+    blob = bytearray()
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return _BIN_SECTION.pack(len(strings)) + _array_bytes(offsets) + bytes(blob)
+
+
+def _decode_string_table(data):
+    (count,) = _BIN_SECTION.unpack_from(data, 0)
+    offsets = _read_array("I", data[4:4 + 4 * (count + 1)])
+    blob = data[4 + 4 * (count + 1):]
+    return [str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in range(count)]
+
+
+def _read_array(typecode, data):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+class CatalogExporter:
+    """二进制列式目录导出器 - 优化：目录/扩展名字符串表增量维护
+
+    目录与扩展名编号只追加不重排，每个版本只需单次遍历条目生成列
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """扫描目录变更时重置字符串表"""
+        with self._lock:
+            self.dir_ids = {}
+            self.ext_ids = {}
+            self.codec_ids = {"": 0}
+
+    def _intern(self, table, value):
+        index = table.get(value)
+        if index is None:
+            index = table[value] = len(table)
+        return index
+
+    def encode(self, entries, revision, root=""):
+        """编码条目序列为二进制列式格式"""
+        with self._lock:
+            return self._encode(entries, revision, root)
+
+    def _encode(self, entries, revision, root):
+        dir_idx = array("I")
+        ext_idx = array("H")
+        types = array("B")
+        sizes = array("Q")
+        mtimes = array("d")
+        stems = []
+        widths = array("I")
+        heights = array("I")
+        durations = array("d")
+        codec_idx = array("H")
+
+        for entry in entries:
+            stem, dot, ext = entry.name.rpartition(".")
+            if not dot:
+                stem, ext = ext, ""
+            dir_idx.append(self._intern(self.dir_ids, entry.rel_dir))
+            ext_idx.append(self._intern(self.ext_ids, dot + ext))
+            types.append(_TYPE_CODES[entry.media_type])
+            sizes.append(entry.size)
+            mtimes.append(entry.last_modified)
+            stems.append(stem)
+            widths.append(entry.width or 0)
+            heights.append(entry.height or 0)
+            durations.append(math.nan if entry.duration is None else entry.duration)
+            codec_idx.append(self._intern(self.codec_ids, entry.codec or ""))
+
+        sections = [
+            root.encode("utf-8"),
+            _encode_string_table(list(self.dir_ids)),
+            _encode_string_table(list(self.ext_ids)),
+            _array_bytes(dir_idx),
+            _array_bytes(ext_idx),
+            _array_bytes(types),
+            _array_bytes(sizes),
+            _array_bytes(mtimes),
+            _encode_string_table(stems),
+            _array_bytes(widths),
+            _array_bytes(heights),
+            _array_bytes(durations),
+            _encode_string_table(list(self.codec_ids)),
+            _array_bytes(codec_idx),
+        ]
+        parts = [_BIN_HEADER.pack(CATALOG_BIN_MAGIC, CATALOG_BIN_VERSION, 0, revision, len(stems))]
+        for section in sections:
+            parts.append(_BIN_SECTION.pack(len(section)))
+            parts.append(section)
+        return b"".join(parts)
+
+
+def _iter_catalog_bin(data):
+    """解析二进制目录，返回 (revision, root, 行迭代器)
+
+    行为 (rel_path, name, size, media_type, mtime, width, height, duration, codec)，版本1数据的元数据均为None
+    """
+    magic, version, _, revision, count = _BIN_HEADER.unpack_from(data, 0)
+    if magic != CATALOG_BIN_MAGIC or version not in _BIN_READABLE_VERSIONS:
+        raise ValueError("不支持的目录二进制格式")
+
+    sections = []
+    offset = _BIN_HEADER.size
+    while offset < len(data):
+        (length,) = _BIN_SECTION.unpack_from(data, offset)
+        offset += _BIN_SECTION.size
+        sections.append(data[offset:offset + length])
+        offset += length
+
+    root = str(sections[0], "utf-8")
+    dirs = _decode_string_table(sections[1])
+    exts = _decode_string_table(sections[2])
+    dir_idx = _read_array("I", sections[3])
+    ext_idx = _read_array("H", sections[4])
+    types = _read_array("B", sections[5])
+    sizes = _read_array("Q", sections[6])
+    mtimes = _read_array("d", sections[7])
+    stems = _decode_string_table(sections[8])
+    if version >= 2:
+        widths = _read_array("I", sections[9])
+        heights = _read_array("I", sections[10])
+        durations = _read_array("d", sections[11])
+        codecs = _decode_string_table(sections[12])
+        codec_idx = _read_array("H", sections[13])
+
+    def rows():
+        for i in range(count):
+            rel_dir = dirs[dir_idx[i]]
+            name = stems[i] + exts[ext_idx[i]]
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if version >= 2:
+                duration = durations[i]
+                metadata = (widths[i] or None, heights[i] or None,
+                            None if math.isnan(duration) else duration, codecs[codec_idx[i]] or None)
+            else:
+                metadata = (None, None, None, None)
+            yield (rel_path, name, sizes[i], _TYPE_NAMES[types[i]], mtimes[i], *metadata)
+
+    return revision, root, rows()
+
+
+def read_catalog_bin_revision(data):
+    """只读取头部版本号（用于判断快照文件是否更新）"""
+    magic, version, _, revision, _ = _BIN_HEADER.unpack_from(data, 0)
+    if magic != CATALOG_BIN_MAGIC or version not in _BIN_READABLE_VERSIONS:
+        raise ValueError("不支持的目录二进制格式")
+    return revision
+
+
+def decode_catalog_bin(data):
+    """解码 /media.bin 数据，返回 (revision, 条目字典列表)"""
+    revision, root, rows = _iter_catalog_bin(data)
+    media = []
+    for rel_path, name, size, media_type, mtime, width, height, duration, codec in rows:
+        media.append({
+            "path": os.path.join(root, rel_path.replace("/", os.sep)) if root else rel_path,
+            "rel_path": rel_path,
+            "name": name,
+            "size": size,
+            "media_type": media_type,
+            "last_modified": mtime,
+            "width": width,
+            "height": height,
+            "duration": duration,
+            "codec": codec
+        })
+    return revision, media
+
+
+def load_catalog_entries(data, root=None):
+    """从二进制目录（如内存映射的快照文件）重建 MediaEntry，返回 (revision, root, 条目列表)
+
+    root: 指定条目的根目录（不采用数据中记录的根目录）
+    """
+    revision, data_root, rows = _iter_catalog_bin(data)
+    root = data_root if root is None else root
+    entries = [MediaEntry(root, rel_path, size, media_type, mtime, *metadata)
+               for rel_path, _, size, media_type, mtime, *metadata in rows]
+    return revision, root, entries
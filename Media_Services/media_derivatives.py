@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频派生文件（封面帧 / 低码率预览片段）
+调用本地 ffmpeg 提取，结果存入派生缓存目录，以 (相对路径, 修改时间, 大小) 为键；
+未安装 ffmpeg 时全部跳过。提取并发数有上限，同一文件的重复请求合并为一次提取
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# 派生文件类型 -> (扩展名, MIME类型)
+DERIVATIVE_KINDS = {
+    "poster": (".jpg", "image/jpeg"),
+    "preview": (".mp4", "video/mp4"),
+}
+
+# 单次 ffmpeg 调用的超时（秒）
+EXTRACT_TIMEOUT = 120
+# 超出预算时淘汰到预算的该比例（留出余量，不必每写入一个文件就清理一次）
+PRUNE_TARGET = 0.9
+# 记录的提取失败输出路径数上限（超出时淘汰最久未命中的，被淘汰的键下次请求时重试一次）
+FAILED_MAX = 10000
+
+
+def find_ffmpeg(configured=None):
+    """查找ffmpeg可执行文件：优先使用配置的路径，其次PATH"""
+    if configured:
+        return configured if os.path.isfile(configured) else None
+    return shutil.which("ffmpeg")
+
+
+class DerivativeCache:
+    """派生文件缓存目录（文件名由键的哈希生成，源文件变化后自然失效）
+
+    总大小在首次 prune 时统计，之后每写入一个文件累加；超出预算时在写入线程中淘汰
+    """
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self._total = None  # 已知总字节数（首次 prune 前未知）
+        self._total_lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+
+    def path_for(self, kind, key):
+        rel_path, mtime, size = key
+        digest = hashlib.sha1(f"{rel_path}|{mtime!r}|{size}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{kind}{DERIVATIVE_KINDS[kind][0]}")
+
+    def move(self, old_key, new_key):
+        """源文件改名/移动后把已生成的派生文件改到新键下（不重新提取），返回移动数量"""
+        moved = 0
+        for kind in DERIVATIVE_KINDS:
+            old_path = self.path_for(kind, old_key)
+            if not os.path.exists(old_path):
+                continue
+            new_path = self.path_for(kind, new_key)
+            try:
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                os.replace(old_path, new_path)
+                moved += 1
+            except OSError as e:
+                logging.warning(f"派生文件改键失败: {old_path} - {str(e)}")
+        return moved
+
+    def added(self, path):
+        """记录新写入的派生文件；累计超出预算时淘汰最旧的文件（已有清理在进行时跳过）"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._total_lock:
+            if self._total is None:
+                return  # 启动时的 prune 尚未完成，由其统计
+            self._total += size
+            over = self._total > self.max_bytes
+        if over and not self._prune_lock.locked():
+            self.prune(int(self.max_bytes * PRUNE_TARGET))
+
+    def prune(self, target=None):
+        """按修改时间淘汰最旧的派生文件，使总大小不超过 target（默认为预算）"""
+        target = self.max_bytes if target is None else target
+        with self._prune_lock:
+            return self._prune(target)
+
+    def _prune(self, target):
+        if not os.path.isdir(self.cache_dir):
+            with self._total_lock:
+                self._total = 0
+            return 0
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        with self._total_lock:
+            self._total = total
+        if removed:
+            logging.info(f"派生缓存清理: 删除{removed}个文件")
+        return removed
+
+
+class DerivativeExtractor:
+    """有并发上限的ffmpeg提取池"""
+
+    def __init__(self, ffmpeg, cache, workers=2):
+        self.ffmpeg = ffmpeg
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ffmpeg")
+        self._pending = {}   # 输出路径 -> Future
+        # 提取失败的输出路径（源文件变化后键不同，自然重试；按最近命中排序，数量有上限）
+        self._failed = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"extracted": 0, "failed": 0, "cache_hits": 0}
+
+    @property
+    def available(self):
+        return self.ffmpeg is not None
+
+    def lookup(self, kind, key):
+        """返回已存在的派生文件路径，否则None"""
+        path = self.cache.path_for(kind, key)
+        if os.path.exists(path):
+            with self._lock:
+                self.metrics["cache_hits"] += 1
+            return path
+        return None
+
+    def submit(self, kind, key, source_path):
+        """提交提取任务，返回Future（结果为输出路径或None）；不可用或已失败时返回None"""
+        if not self.available:
+            return None
+        out_path = self.cache.path_for(kind, key)
+        with self._lock:
+            if out_path in self._failed:
+                self._failed.move_to_end(out_path)
+                return None
+            future = self._pending.get(out_path)
+            if future is None:
+                future = self._executor.submit(self._extract, kind, source_path, out_path)
+                self._pending[out_path] = future
+            return future
+
+    def get_metrics(self):
+        with self._lock:
+            return {"available": self.available, "pending": len(self._pending),
+                    "failed_keys": len(self._failed), **self.metrics}
+
+    def _extract(self, kind, source_path, out_path):
+        try:
+            if os.path.exists(out_path):
+                return out_path
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            tmp_path = f"{out_path}.{threading.get_ident()}.tmp{DERIVATIVE_KINDS[kind][0]}"
+            try:
+                ok = self._run_ffmpeg(kind, source_path, tmp_path)
+                if ok:
+                    os.replace(tmp_path, out_path)
+                    self.cache.added(out_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            with self._lock:
+                if ok:
+                    self.metrics["extracted"] += 1
+                else:
+                    self._record_failure(out_path)
+            return out_path if ok else None
+        except Exception as e:
+            logging.error(f"派生文件提取错误: {source_path} - {str(e)}")
+            with self._lock:
+                self._record_failure(out_path)
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(out_path, None)
+
+    def _record_failure(self, out_path):
+        """记录失败的输出路径（调用方持有 _lock）"""
+        self.metrics["failed"] += 1
+        self._failed[out_path] = True
+        self._failed.move_to_end(out_path)
+        while len(self._failed) > FAILED_MAX:
+            self._failed.popitem(last=False)
+
+    def _run_ffmpeg(self, kind, source_path, out_path):
+        if kind == "poster":
+            # 优先取第1秒的画面（跳过片头黑场），过短的视频退回第一帧
+            attempts = [["-ss", "1"], []]
+            output_args = ["-frames:v", "1", "-vf", "scale='min(640,iw)':-2", "-q:v", "4"]
+        else:
+            attempts = [[]]
+            output_args = ["-t", "4", "-an", "-vf", "scale=-2:'min(240,ih)'",
+                           "-c:v", "libx264", "-preset", "veryfast", "-crf", "32",
+                           "-maxrate", "300k", "-bufsize", "600k", "-movflags", "+faststart"]
+        for seek_args in attempts:
+            cmd = [self.ffmpeg, "-nostdin", "-v", "error", "-y", *seek_args, "-i", source_path,
+                   *output_args, out_path]
+            try:
+                result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                        timeout=EXTRACT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logging.warning(f"ffmpeg超时: {os.path.basename(source_path)} ({kind})")
+                return False
+            if result.returncode == 0 and os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+                return True
+        logging.warning(f"ffmpeg提取失败: {os.path.basename(source_path)} ({kind}) "
+                        f"{result.stderr.decode('utf-8', 'replace').strip()[-200:]}")
+        return False
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+小文件热缓存
+缓存小图片的内容与预计算响应头（MIME / ETag / Last-Modified），
+命中时 /file 请求无需任何文件系统调用；由文件监控事件与目录变更失效
+"""
+
+import threading
+import collections
+from werkzeug.http import http_date
+
+
+def file_etag(mtime, size):
+    """由修改时间与大小生成ETag（热缓存与目录索引路径共用）"""
+    return f"{int(mtime * 1_000_000):x}-{size:x}"
+
+
+class CachedFile:
+    """缓存的文件内容与响应头"""
+    __slots__ = ("content", "mime_type", "etag", "last_modified")
+
+    def __init__(self, content, mime_type, mtime, size):
+        self.content = content
+        self.mime_type = mime_type
+        self.etag = file_etag(mtime, size)
+        self.last_modified = http_date(mtime)
+
+
+class HotFileCache:
+    """按字节预算的LRU文件缓存（线程安全：watchdog线程失效，请求协程读取）"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_file_size=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self._entries = collections.OrderedDict()  # rel_path -> CachedFile
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def accepts(self, mime_type, size):
+        """是否缓存该文件：仅缓存不超过阈值的图片"""
+        return self.max_bytes > 0 and size <= self.max_file_size and mime_type.startswith("image/")
+
+    def get(self, rel_path):
+        with self._lock:
+            cached = self._entries.get(rel_path)
+            if cached is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(rel_path)
+            self.stats["hits"] += 1
+            return cached
+
+    def put(self, rel_path, cached):
+        size = len(cached.content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(rel_path, None)
+            if old is not None:
+                self._bytes -= len(old.content)
+            self._entries[rel_path] = cached
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.content)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, rel_path):
+        with self._lock:
+            old = self._entries.pop(rel_path, None)
+            if old is not None:
+                self._bytes -= len(old.content)
+                self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self.stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_metrics(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, **self.stats}
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步日志管线
+请求处理与watchdog线程中的日志调用只做一次入队（QueueHandler），格式化与写盘由后台线程（QueueListener）完成：
+- 日志文件按大小轮转（RotatingFileHandler）
+- 按调用位置限速（也可用 extra={"log_key": ...} 指定键）：每个键每秒最多N条，超出部分每M条采样放行一条，
+  放行的记录附带此前被抑制的条数，客户端刷出的大量404/403不会拖慢请求，也不会刷爆日志；
+  ERROR及以上级别不限速（重复出现的真实故障必须完整记录）
+- 日志文件可选JSON行格式（每行一个对象），控制台始终为文本格式
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# 限速默认值：每个键每秒放行条数、超出后的采样间隔
+DEFAULT_RATE = 5
+DEFAULT_SAMPLE_EVERY = 100
+# 限速键数量上限（键按调用位置生成，正常不会达到；达到时清空重新计数）
+MAX_RATE_KEYS = 10000
+
+# LogRecord 的标准属性，其余属性视为 extra 字段写入JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class RateLimitFilter(logging.Filter):
+    """按键限速 + 采样（计数不加锁，并发时偏差几条可以接受）"""
+
+    def __init__(self, per_second=DEFAULT_RATE, sample_every=DEFAULT_SAMPLE_EVERY, exempt_level=logging.ERROR):
+        super().__init__()
+        self.per_second = per_second
+        self.sample_every = sample_every
+        self.exempt_level = exempt_level
+        self._windows = {}  # key -> [窗口开始时间, 窗口内条数, 未放行条数]
+        self.suppressed_total = 0
+
+    def filter(self, record):
+        if self.per_second <= 0 or record.levelno >= self.exempt_level:
+            return True
+        key = getattr(record, "log_key", None) or (record.pathname, record.lineno)
+        now = time.monotonic()
+        state = self._windows.get(key)
+        if state is None or now - state[0] >= 1.0:
+            if state is not None and state[2]:
+                record.suppressed = state[2]
+            elif state is None and len(self._windows) >= MAX_RATE_KEYS:
+                self._windows.clear()
+            self._windows[key] = [now, 1, 0]
+            return True
+        state[1] += 1
+        if state[1] <= self.per_second:
+            return True
+        state[2] += 1
+        if self.sample_every and state[2] >= self.sample_every:
+            record.suppressed = state[2] - 1
+            state[2] = 0
+            return True
+        self.suppressed_total += 1
+        return False
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text}（此前已抑制{suppressed}条同类日志）" if suppressed else text
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行JSON：时间、级别、消息、位置、线程，以及 extra 字段"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "process": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """同进程队列：记录不需要可序列化，入队前只合并消息参数，格式化留给后台线程"""
+
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+_queue = None
+_queue_handler = None
+_rate_filter = None
+_listener = None
+_config = None
+_owner_pid = None
+
+
+def configure_logging(log_file="image_service.log", level=None, max_bytes=10 * 1024 * 1024, backup_count=5,
+                      json_format=False, rate_per_second=DEFAULT_RATE, sample_every=DEFAULT_SAMPLE_EVERY,
+                      console=True):
+    """（重新）配置根日志器：替换上一次配置的队列管线，其他处理器不受影响
+
+    level 为None时保持根日志器当前级别。fork出的子进程不轮转日志文件（轮转只由首次配置的进程进行）
+    """
+    global _queue, _queue_handler, _rate_filter, _listener, _config, _owner_pid
+    _config = {
+        "log_file": log_file, "level": level, "max_bytes": max_bytes, "backup_count": backup_count,
+        "json_format": json_format, "rate_per_second": rate_per_second, "sample_every": sample_every,
+        "console": console,
+    }
+    if _owner_pid is None:
+        _owner_pid = os.getpid()
+    _shutdown()
+
+    handlers = []
+    if console:
+        stream = logging.StreamHandler()
+        stream.setFormatter(TextFormatter(TEXT_FORMAT))
+        handlers.append(stream)
+    if log_file:
+        rotate_bytes = max_bytes if os.getpid() == _owner_pid else 0
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=rotate_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        file_handler.setFormatter(JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+
+    _queue = queue.SimpleQueue()
+    _queue_handler = _InProcessQueueHandler(_queue)
+    _rate_filter = RateLimitFilter(rate_per_second, sample_every)
+    _queue_handler.addFilter(_rate_filter)
+    _listener = logging.handlers.QueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    if level is not None:
+        root.setLevel(level)
+
+
+def configure_stdio():
+    """控制台输出与文件系统编码统一为UTF-8（由启动入口调用，导入服务模块时不修改进程状态）"""
+    for stream in (sys.stdout, sys.stderr):
+        if stream is not None and hasattr(stream, "reconfigure"):
+            stream.reconfigure(encoding="utf-8")
+    sys.getfilesystemencoding = lambda: "utf-8"
+
+
+def _shutdown():
+    """停止当前管线并写完队列中的日志"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def _reinit_after_fork():
+    """fork出的子进程中没有后台写日志线程：丢弃继承的管线，重新建立"""
+    global _listener, _queue_handler
+    if _config is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = _queue_handler = None
+    configure_logging(**_config)
+
+
+def get_logging_stats():
+    return {
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "suppressed": _rate_filter.suppressed_total if _rate_filter is not None else 0,
+        "json": bool(_config and _config["json_format"]),
+    }
+
+
+atexit.register(_shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
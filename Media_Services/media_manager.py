@@ -8,13 +8,86 @@
 import os
 import json
 import time
+import gzip
+import errno
+import zlib
 import shutil
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import sqlite3
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Iterator, Iterable
 import hashlib
 
+# 观看历史导出/导入（NDJSON，每行一条记录）：字段顺序、每批读写行数
+HISTORY_FIELDS = ('file_hash', 'file_path', 'watch_count', 'first_watch', 'last_watch',
+                  'is_favorite', 'is_marked_for_deletion', 'user_rating')
+HISTORY_BATCH_SIZE = 5000
+GZIP_MAGIC = b'\x1f\x8b'
+_history_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+# 导入合并：同一文件取两边较大的观看次数/较早的首次观看/较晚的最后观看，收藏与删除标记任一方为真即为真，
+# 评分以导入方非0值为准；本地已有哈希时保留本地哈希。重复导入同一份文件结果不变
+HISTORY_UPSERT_SQL = """
+    INSERT INTO watch_history
+    (file_path, file_hash, watch_count, first_watch, last_watch, is_favorite, is_marked_for_deletion, user_rating)
+    VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET
+        file_hash = CASE WHEN file_hash IS NULL OR file_hash = '' THEN excluded.file_hash ELSE file_hash END,
+        watch_count = MAX(watch_count, excluded.watch_count),
+        first_watch = MIN(first_watch, excluded.first_watch),
+        last_watch = MAX(last_watch, excluded.last_watch),
+        is_favorite = MAX(is_favorite, excluded.is_favorite),
+        is_marked_for_deletion = MAX(is_marked_for_deletion, excluded.is_marked_for_deletion),
+        user_rating = CASE WHEN excluded.user_rating != 0 THEN excluded.user_rating ELSE user_rating END
+"""
+
+
+def normalize_timestamp(value):
+    """导入的时间统一为 CURRENT_TIMESTAMP 的格式（UTC，'YYYY-MM-DD HH:MM:SS'），保证按字符串比较/排序正确
+
+    带时区的ISO时间换算为UTC，不带时区的视为UTC；数字视为Unix时间戳；空值返回None（由数据库取当前时间）
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        parsed = datetime.fromtimestamp(value, timezone.utc)
+    else:
+        parsed = datetime.fromisoformat(str(value).strip())
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def move_to_backup(file_path, backup_dir) -> Path:
+    """把文件移入备份目录：同一文件系统内直接改名（不复制数据），跨文件系统时才复制后删除"""
+    file_path = Path(file_path)
+    backup_dir = Path(backup_dir)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    stamp = int(time.time())
+    target = backup_dir / f"{stamp}_{file_path.name}"
+    index = 1
+    while target.exists():
+        target = backup_dir / f"{stamp}_{index}_{file_path.name}"
+        index += 1
+    try:
+        os.rename(file_path, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(file_path), str(target))
+    return target
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """逐块gzip压缩（流式输出，不缓存整个文件）"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 class MediaFileManager:
     """媒体文件管理器"""
     
@@ -54,6 +127,11 @@ class MediaFileManager:
             )
         """)
         
+        # 按文件哈希匹配观看历史（导入时文件已改名也能对应上）
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_watch_history_hash ON watch_history(file_hash)")
+        # 保留策略按最后观看时间从旧到新遍历
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_watch_history_last_watch ON watch_history(last_watch)")
+        
         conn.commit()
         conn.close()
     
@@ -224,13 +302,11 @@ class MediaFileManager:
                 file_hash = self.calculate_file_hash(full_path)
                 file_size = full_path.stat().st_size
                 
-                # 备份文件
+                # 备份即删除：移入备份目录（同一文件系统内为改名，不复制）
                 if backup and backup_dir:
-                    backup_path = backup_dir / f"{int(time.time())}_{full_path.name}"
-                    shutil.copy2(full_path, backup_path)
-                
-                # 删除文件
-                full_path.unlink()
+                    move_to_backup(full_path, backup_dir)
+                else:
+                    full_path.unlink()
                 
                 # 记录删除日志
                 cursor.execute("""
@@ -252,6 +328,49 @@ class MediaFileManager:
         
         return results
     
+    def iter_retention_candidates(self, min_watch_count: int = 1, protect_favorites: bool = True,
+                                  batch_size: int = 500) -> Iterator[List[tuple]]:
+        """按最后观看时间从旧到新逐批返回可删除的记录 [(file_path, file_hash, watch_count, last_watch), ...]
+        
+        每批单独查询（按 (last_watch, id) 翻页），批次之间不持有数据库读锁，不阻塞观看记录的写入
+        """
+        query = ("SELECT id, file_path, file_hash, watch_count, last_watch FROM watch_history "
+                 "WHERE watch_count >= ? AND last_watch IS NOT NULL AND (last_watch, id) > (?, ?)")
+        if protect_favorites:
+            query += " AND is_favorite = 0"
+        query += " ORDER BY last_watch, id LIMIT ?"
+        conn = sqlite3.connect(self.db_path)
+        try:
+            last_key = ("", 0)
+            while True:
+                rows = conn.execute(query, (min_watch_count, *last_key, batch_size)).fetchall()
+                if not rows:
+                    break
+                last_key = (rows[-1][4], rows[-1][0])
+                yield [row[1:] for row in rows]
+        finally:
+            conn.close()
+    
+    def utc_cutoff(self, days: float) -> str:
+        """days天前的UTC时间（与 CURRENT_TIMESTAMP 写入的 last_watch 格式相同，可直接比较）"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("SELECT datetime('now', ?)", (f"-{days} days",)).fetchone()[0]
+        finally:
+            conn.close()
+    
+    def log_deletions(self, rows: List[tuple]) -> int:
+        """在一个事务中写入删除日志，rows: [(file_path, file_hash, reason), ...]"""
+        if not rows:
+            return 0
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany("INSERT INTO deletion_log (file_path, file_hash, reason) VALUES (?, ?, ?)", rows)
+        finally:
+            conn.close()
+        return len(rows)
+    
     def auto_cleanup(self, criteria: Dict) -> Dict:
         """自动清理文件"""
         files_to_delete = self.find_files_for_deletion(criteria)
@@ -273,36 +392,136 @@ class MediaFileManager:
             'details': results
         }
     
-    def export_watch_history(self, output_file: str) -> bool:
-        """导出观看历史到JSON文件"""
+    def move_history(self, moves: List[tuple]) -> int:
+        """文件改名/移动后迁移观看历史，moves: [(旧路径, 新路径), ...]；新路径已有记录时按导入规则合并，返回迁移数量"""
+        moved = 0
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT file_path, watch_count, first_watch, last_watch, is_favorite
-            FROM watch_history
-            ORDER BY last_watch DESC
-        """)
-        
-        history = []
-        for row in cursor.fetchall():
-            history.append({
-                'file_path': row[0],
-                'watch_count': row[1],
-                'first_watch': row[2],
-                'last_watch': row[3],
-                'is_favorite': bool(row[4])
-            })
-        
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, indent=2, ensure_ascii=False)
+            with conn:
+                for old_path, new_path in moves:
+                    row = conn.execute(f"SELECT {', '.join(HISTORY_FIELDS)} FROM watch_history WHERE file_path = ?",
+                                       (old_path,)).fetchone()
+                    if row is None:
+                        continue
+                    record = dict(zip(HISTORY_FIELDS, row))
+                    record['file_path'] = new_path
+                    conn.execute("DELETE FROM watch_history WHERE file_path = ?", (old_path,))
+                    conn.execute(HISTORY_UPSERT_SQL, self._history_row(record))
+                    moved += 1
+        finally:
+            conn.close()
+        return moved
+    
+    def iter_watch_history(self, batch_size: int = HISTORY_BATCH_SIZE) -> Iterator[bytes]:
+        """逐批读取观看历史，生成UTF-8编码的NDJSON块（每批一块，内存占用与总行数无关）"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(HISTORY_FIELDS)} FROM watch_history ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                lines = []
+                for row in rows:
+                    record = dict(zip(HISTORY_FIELDS, row))
+                    record['is_favorite'] = bool(record['is_favorite'])
+                    record['is_marked_for_deletion'] = bool(record['is_marked_for_deletion'])
+                    lines.append(_history_encoder.encode(record))
+                yield ("\n".join(lines) + "\n").encode('utf-8')
+        finally:
+            conn.close()
+    
+    def export_watch_history(self, output_file: str, compress: bool = None) -> bool:
+        """导出观看历史到NDJSON文件（compress为None时按 .gz 后缀决定是否gzip压缩）"""
+        if compress is None:
+            compress = str(output_file).endswith('.gz')
+        chunks = self.iter_watch_history()
+        if compress:
+            chunks = gzip_stream(chunks)
+        try:
+            with open(output_file, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
             return True
         except Exception as e:
             print(f"导出失败: {e}")
             return False
+    
+    def import_watch_history(self, source, compress: bool = None, batch_size: int = HISTORY_BATCH_SIZE) -> Dict:
+        """从NDJSON导入观看历史并与本地合并（source为文件路径或二进制文件对象）
+        
+        记录按文件哈希对应：本地已有相同哈希的文件时合并到本地路径（文件改名/换目录后历史仍保留），
+        否则按文件路径合并或新增。compress为None时文件路径按内容判断是否gzip，文件对象视为未压缩。
+        整个导入在一个事务中完成，无法解析的行跳过并计数
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                if compress is None:
+                    compress = f.read(2) == GZIP_MAGIC
+                    f.seek(0)
+                return self.import_watch_history(f, compress, batch_size)
+        
+        stream = gzip.GzipFile(fileobj=source, mode='rb') if compress else source
+        results = {'imported': 0, 'renamed': 0, 'skipped': 0}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                batch = []
+                for line in stream:
+                    if not line.strip():
+                        continue
+                    try:
+                        batch.append(self._history_row(json.loads(line)))
+                    except (ValueError, TypeError, KeyError, AttributeError, OverflowError, OSError):
+                        # 时间戳超出范围（如 1e400、Infinity）时 datetime 抛出 OverflowError/OSError，同样只跳过该条
+                        results['skipped'] += 1
+                        continue
+                    if len(batch) >= batch_size:
+                        self._upsert_history(conn, batch, results)
+                        batch = []
+                if batch:
+                    self._upsert_history(conn, batch, results)
         finally:
             conn.close()
+        return results
+    
+    @staticmethod
+    def _history_row(record: Dict) -> tuple:
+        """导入记录 -> 按 HISTORY_UPSERT_SQL 参数顺序排列的元组"""
+        file_path = str(record['file_path'])
+        if not file_path:
+            raise ValueError("file_path为空")
+        return (
+            file_path,
+            str(record.get('file_hash') or ''),
+            int(record.get('watch_count', 1)),
+            normalize_timestamp(record.get('first_watch')),
+            normalize_timestamp(record.get('last_watch')),
+            1 if record.get('is_favorite') else 0,
+            1 if record.get('is_marked_for_deletion') else 0,
+            int(record.get('user_rating') or 0)
+        )
+    
+    def _upsert_history(self, conn: sqlite3.Connection, rows: List[tuple], results: Dict):
+        """批量合并：先按哈希查出本地路径，再一次 executemany 写入"""
+        hashes = list({row[1] for row in rows if row[1]})
+        local_paths = {}
+        for i in range(0, len(hashes), 500):  # 每条语句的参数数量有上限
+            chunk = hashes[i:i + 500]
+            for file_hash, file_path in conn.execute(
+                    f"SELECT file_hash, file_path FROM watch_history WHERE file_hash IN ({','.join('?' * len(chunk))})",
+                    chunk):
+                local_paths.setdefault(file_hash, file_path)
+        
+        merged = []
+        for row in rows:
+            local_path = local_paths.get(row[1]) if row[1] else None
+            if local_path is not None and local_path != row[0]:
+                row = (local_path,) + row[1:]
+                results['renamed'] += 1
+            merged.append(row)
+        conn.executemany(HISTORY_UPSERT_SQL, merged)
+        results['imported'] += len(merged)
 
 def main():
     """主函数 - 命令行界面"""
@@ -329,9 +548,10 @@ def main():
         print("4. 执行文件删除")
         print("5. 自动清理")
         print("6. 导出观看历史")
+        print("7. 导入观看历史")
         print("0. 退出")
         
-        choice = input("请选择功能 (0-6): ").strip()
+        choice = input("请选择功能 (0-7): ").strip()
         
         if choice == "1":
             stats = manager.get_watch_statistics()
@@ -411,15 +631,29 @@ def main():
             print(f"   释放空间: {result.get('freed_space', 0) // (1024*1024)} MB")
         
         elif choice == "6":
-            output_file = input("请输入导出文件名 (默认: watch_history.json): ").strip()
+            output_file = input("请输入导出文件名 (默认: watch_history.ndjson，以.gz结尾则压缩): ").strip()
             if not output_file:
-                output_file = "watch_history.json"
+                output_file = "watch_history.ndjson"
             
             if manager.export_watch_history(output_file):
                 print(f"✓ 观看历史已导出到 {output_file}")
             else:
                 print("✗ 导出失败")
         
+        elif choice == "7":
+            input_file = input("请输入导入文件名 (默认: watch_history.ndjson): ").strip()
+            if not input_file:
+                input_file = "watch_history.ndjson"
+            
+            try:
+                result = manager.import_watch_history(input_file)
+                print(f"\n导入完成:")
+                print(f"   导入记录: {result['imported']}")
+                print(f"   按哈希匹配到改名文件: {result['renamed']}")
+                print(f"   跳过无效行: {result['skipped']}")
+            except Exception as e:
+                print(f"✗ 导入失败: {e}")
+        
         elif choice == "0":
             print("感谢使用!")
             break
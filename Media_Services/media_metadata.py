@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体元数据提取（尺寸、时长、编码格式）
+图片用 Pillow 只读取文件头（不解码像素），视频用 ffprobe 读取容器头；
+在线程池中于文件入库后进行，结果以 (路径, 大小, 修改时间) 为键持久化到SQLite，不会重复提取
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import logging
+import threading
+import subprocess
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+# 可选依赖：Pillow（读取图片尺寸）；启动时只检查是否安装，首次提取时才导入
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+_Image = None
+
+
+def _pillow():
+    global _Image
+    if _Image is None:
+        from PIL import Image
+        _Image = Image
+    return _Image
+
+# 单次 ffprobe 调用的超时（秒）
+PROBE_TIMEOUT = 30
+
+# EXIF方向为5~8时图片需旋转90°显示，宽高互换
+_EXIF_ORIENTATION = 0x0112
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+# 元数据未知时的占位（已提取过但无法识别，同样持久化以免重复提取）
+EMPTY_METADATA = (None, None, None, None)
+
+
+def find_ffprobe(ffmpeg=None):
+    """查找ffprobe：优先与ffmpeg同目录，其次PATH"""
+    if ffmpeg:
+        directory, name = os.path.split(ffmpeg)
+        candidate = os.path.join(directory, name.replace("ffmpeg", "ffprobe"))
+        if candidate != ffmpeg and os.path.isfile(candidate):
+            return candidate
+    return shutil.which("ffprobe")
+
+
+def read_image_metadata(path):
+    """读取图片尺寸（只解析文件头），返回 (width, height, None, format)"""
+    with _pillow().open(path) as img:
+        width, height = img.size
+        try:
+            if img.getexif().get(_EXIF_ORIENTATION) in _ROTATED_ORIENTATIONS:
+                width, height = height, width
+        except Exception:
+            pass
+        return width, height, None, (img.format or "").lower() or None
+
+
+def probe_video_metadata(ffprobe, path):
+    """读取视频容器头，返回 (width, height, duration, codec)"""
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=width,height,codec_name:format=duration", "-of", "json", path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=PROBE_TIMEOUT)
+    if result.returncode != 0:
+        return EMPTY_METADATA
+    info = json.loads(result.stdout or b"{}")
+    stream = (info.get("streams") or [{}])[0]
+    duration = info.get("format", {}).get("duration")
+    return (
+        stream.get("width") or None,
+        stream.get("height") or None,
+        round(float(duration), 3) if duration not in (None, "N/A") else None,
+        stream.get("codec_name") or None
+    )
+
+
+class MetadataStore:
+    """元数据持久化（SQLite），启动时整体载入内存，查询无需访问数据库"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._cache = None  # path -> (size, mtime, metadata)
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS media_metadata (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    duration REAL,
+                    codec TEXT
+                )
+            """)
+            self._cache = {
+                path: (size, mtime, (width, height, duration, codec))
+                for path, size, mtime, width, height, duration, codec
+                in self._conn.execute("SELECT path, size, mtime, width, height, duration, codec FROM media_metadata")
+            }
+        return self._conn
+
+    def lookup(self, path, size, mtime):
+        """返回已持久化的元数据；键不匹配（文件已变化）或从未提取时返回None"""
+        with self._lock:
+            self._open()
+            row = self._cache.get(os.path.normpath(path))
+        if row is not None and row[0] == size and row[1] == mtime:
+            return row[2]
+        return None
+
+    def save_many(self, rows):
+        """rows: [(path, size, mtime, (width, height, duration, codec)), ...]"""
+        with self._lock:
+            conn = self._open()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO media_metadata (path, size, mtime, width, height, duration, codec) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(os.path.normpath(path), size, mtime, *metadata) for path, size, mtime, metadata in rows]
+                )
+            for path, size, mtime, metadata in rows:
+                self._cache[os.path.normpath(path)] = (size, mtime, metadata)
+
+    def move_many(self, moves):
+        """文件改名/移动后把已持久化的元数据改到新路径下，moves: [(旧路径, 新路径), ...]，返回改键数量"""
+        with self._lock:
+            conn = self._open()
+            rows = [(os.path.normpath(new), os.path.normpath(old)) for old, new in moves
+                    if os.path.normpath(old) in self._cache]
+            if not rows:
+                return 0
+            with conn:
+                conn.executemany("DELETE FROM media_metadata WHERE path = ?", [(new,) for new, _ in rows])
+                conn.executemany("UPDATE media_metadata SET path = ? WHERE path = ?", rows)
+            for new, old in rows:
+                self._cache[new] = self._cache.pop(old)
+            return len(rows)
+
+
+class MetadataPipeline:
+    """元数据提取流水线：线程池提取 → 批量持久化 → 回调写回目录"""
+
+    def __init__(self, store, ffprobe=None, workers=2, on_results=None, flush_interval=0.5):
+        self.store = store
+        self.ffprobe = ffprobe
+        self.on_results = on_results  # on_results([(entry, metadata), ...])
+        self.flush_interval = flush_interval
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="metadata")
+        self._results = []
+        self._flush_timer = None
+        self._lock = threading.Lock()
+        self.metrics = {"queued": 0, "extracted": 0, "failed": 0}
+
+    def supports(self, media_type):
+        if media_type == "image":
+            return PILLOW_AVAILABLE
+        return self.ffprobe is not None
+
+    def lookup(self, path, size, mtime):
+        """已持久化的元数据（未提取过返回None）"""
+        return self.store.lookup(path, size, mtime)
+
+    def submit_missing(self, entries):
+        """将尚未提取过元数据的条目加入提取队列（条目入库后调用，结果才能写回目录）"""
+        for entry in entries:
+            if not self.supports(entry.media_type) \
+                    or self.store.lookup(entry.path, entry.size, entry.last_modified) is not None:
+                continue
+            with self._lock:
+                self.metrics["queued"] += 1
+            self._executor.submit(self._extract, entry)
+
+    def get_metrics(self):
+        with self._lock:
+            return {"pillow": PILLOW_AVAILABLE, "ffprobe": self.ffprobe is not None, **self.metrics}
+
+    def _extract(self, entry):
+        try:
+            if entry.media_type == "image":
+                metadata = read_image_metadata(entry.path)
+            else:
+                metadata = probe_video_metadata(self.ffprobe, entry.path)
+            key = "extracted"
+        except FileNotFoundError:
+            return  # 文件已删除
+        except Exception as e:
+            logging.debug(f"元数据提取失败: {entry.rel_path} - {str(e)}")
+            metadata, key = EMPTY_METADATA, "failed"
+        with self._lock:
+            self.metrics[key] += 1
+            self._results.append((entry, metadata))
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self._flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush(self):
+        with self._lock:
+            results, self._results = self._results, []
+            self._flush_timer = None
+        if not results:
+            return
+        try:
+            self.store.save_many([(entry.path, entry.size, entry.last_modified, metadata)
+                                  for entry, metadata in results])
+        except Exception as e:
+            logging.error(f"元数据保存失败: {str(e)}")
+        if self.on_results is not None:
+            try:
+                self.on_results(results)
+            except Exception as e:
+                logging.error(f"元数据写回目录失败: {str(e)}")
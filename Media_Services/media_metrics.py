@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轻量指标采集（Prometheus文本格式导出）
+计数器 / 仪表 / 直方图，支持标签；带标签的子指标取一次后可重复使用。
+
+热路径开销（每次计时/计数 < 1µs）：更新不加锁，依赖GIL；多个OS线程恰好同时更新同一指标时
+极少数增量可能丢失，对监控用途可以接受（协程之间不会发生）。最省的计时方式：
+    start = time.perf_counter(); ...; histogram.observe_since(start)
+"""
+
+import threading
+from time import perf_counter
+from bisect import bisect_left
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class _Timer:
+    """计时上下文：创建时开始计时，退出时把耗时（秒）记入直方图（内联累加以减少调用开销）"""
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start = perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        value = perf_counter() - self._start
+        histogram = self._histogram
+        histogram.counts[bisect_left(histogram.bounds, value)] += 1
+        histogram.sum += value
+        return False
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def observe_since(self, start):
+        """记录自 start（time.perf_counter()）以来的耗时"""
+        value = perf_counter() - start
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        """with histogram.time(): ... —— 记录代码块耗时"""
+        return _Timer(self)
+
+    def snapshot(self):
+        return list(self.counts), self.sum
+
+
+class _Metric:
+    """指标族：无标签时直接调用 inc/observe 等；有标签时先 labels(...) 取得子指标
+
+    子指标为 value_class 的实例（需要构造参数的指标族覆盖 _new_child）；value_class 为None时没有子指标
+    """
+    kind = None
+    value_class = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._default = None if self.label_names else self._new_child()
+
+    def _new_child(self):
+        return self.value_class() if self.value_class is not None else None
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name}: 标签数量应为{len(self.label_names)}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        if self._default is not None:
+            return [((), self._default)]
+        return sorted(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+    value_class = _CounterValue
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    value_class = _GaugeValue
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def observe_since(self, start):
+        self._default.observe_since(start)
+
+    def time(self):
+        return self._default.time()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, values, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class FunctionMetric(_Metric):
+    """采集时调用函数取值的指标（目录大小、队列深度等已有状态）
+
+    函数返回单个数值，或 {标签值元组: 数值}；返回None时不输出
+    """
+
+    def __init__(self, name, documentation, function, label_names=(), kind="gauge"):
+        self.function = function
+        self.kind = kind
+        super().__init__(name, documentation, label_names)
+
+    def render(self):
+        value = self.function()
+        if value is None:
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, v in sorted(items):
+            values = values if isinstance(values, tuple) else (values,)
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(v)}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次，render() 输出Prometheus文本格式"""
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标类型冲突: {name}")
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def function(self, name, documentation, function, labels=(), kind="gauge"):
+        return self._register(FunctionMetric, name, documentation, function, labels, kind=kind)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} 采集失败: {_escape(e)}")
+        return "\n".join(lines) + "\n"
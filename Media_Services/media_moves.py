@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+改名/移动配对
+文件监控漏报移动（轮询检测、跨监控目录的移动、先复制后删除的工具）时，移动表现为一次删除加一次新建。
+窗口期内 (大小, 修改时间, 媒体类型) 相同的删除与新建视为同一文件：改名与同文件系统内移动都保留修改时间，
+而删除的文件已无法读取内容，目录条目中已有的这两项即是无需读文件的快速指纹。
+同一指纹有多个候选时优先同名文件，否则不配对（宁可按新文件处理，也不把历史迁到错误的文件上）。
+"""
+
+import time
+import threading
+
+# 删除与新建之间允许的最大间隔（秒）
+DEFAULT_WINDOW = 10.0
+
+
+def fingerprint(entry):
+    return entry.size, entry.last_modified, entry.media_type
+
+
+class MoveTracker:
+    """最近删除/新建的条目池：deleted()/created() 记录一侧，并从另一侧取出配对"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._deleted = {}  # 指纹 -> [(记录时间, 条目), ...]
+        self._created = {}
+        self._lock = threading.Lock()
+        self.metrics = {"paired": 0, "expired": 0}
+
+    def deleted(self, entry):
+        """记录已删除的条目；窗口期内有指纹相同的新建条目时取出并返回它（先新建后删除）"""
+        return self._pair(entry, self._created, self._deleted)
+
+    def created(self, entry):
+        """记录新入库的条目；窗口期内有指纹相同的已删除条目时取出并返回它"""
+        return self._pair(entry, self._deleted, self._created)
+
+    def take_deleted(self, size, last_modified, media_type, name):
+        """只查找不记录：新文件入库前先确认是否为刚删除文件的移动（是则不必等待写入完成）"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._take(self._deleted, (size, last_modified, media_type), name)
+
+    def get_metrics(self):
+        with self._lock:
+            return {"pending_deleted": sum(map(len, self._deleted.values())),
+                    "pending_created": sum(map(len, self._created.values())), **self.metrics}
+
+    def _pair(self, entry, others, own):
+        now = time.monotonic()
+        key = fingerprint(entry)
+        with self._lock:
+            self._expire(now)
+            match = self._take(others, key, entry.name)
+            if match is None:
+                own.setdefault(key, []).append((now, entry))
+            return match
+
+    def _take(self, pool, key, name):
+        candidates = pool.get(key)
+        if not candidates:
+            return None
+        same_name = [i for i, (_, entry) in enumerate(candidates) if entry.name == name]
+        if same_name:
+            index = same_name[0]
+        elif len(candidates) == 1:
+            index = 0
+        else:
+            return None
+        _, entry = candidates.pop(index)
+        if not candidates:
+            del pool[key]
+        self.metrics["paired"] += 1
+        return entry
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        for pool in (self._deleted, self._created):
+            for key in [key for key, items in pool.items() if items[0][0] < cutoff]:
+                items = [item for item in pool[key] if item[0] >= cutoff]
+                self.metrics["expired"] += len(pool[key]) - len(items)
+                if items:
+                    pool[key] = items
+                else:
+                    del pool[key]
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端播放列表（随机/顺序，按类型与子目录筛选）
+客户端不再下载整个列表并自行记录已播放序号，只通过游标取上一个/下一个。
+条目按编号存储：编号在目录条目首次出现时分配（目录顺序），每个播放列表只保存编号数组 array('I') 与游标；
+随机模式每次从未播放部分均匀抽取一个（逐步进行的 Fisher-Yates 洗牌），每次 O(1)，不预先打乱整个列表。
+目录增量变更通过监听器应用：新文件追加到未播放部分，删除的文件留作失效编号，取到时跳过，积累较多时压缩
+"""
+
+import uuid
+import time
+import random
+import logging
+import threading
+import collections
+from array import array
+
+PLAYLIST_MODES = ("random", "sequential")
+# 播放列表数量上限（超出时淘汰最久未使用的）与闲置过期时间（秒）
+MAX_PLAYLISTS = 64
+IDLE_SECONDS = 24 * 3600
+# 失效编号超过该数量且超过列表长度的1/4时压缩
+COMPACT_MIN = 1024
+# 编号表中已删除的条目超过该数量且超过存活条目数时重新编号
+REINDEX_MIN = 100000
+
+
+def _matches(entry, media_type, folder):
+    if media_type in ("image", "video") and entry.media_type != media_type:
+        return False
+    return not folder or entry.rel_dir == folder or entry.rel_dir.startswith(folder + "/")
+
+
+class Playlist:
+    """单个播放列表的游标状态（非线程安全，由 PlaylistManager 加锁使用）
+
+    order[:drawn] 为已抽取（已播放）的顺序，order[drawn:] 为未播放部分；
+    pos 为当前位置（当前条目为 order[pos-1]），后退后再前进时沿已播放的顺序重放，到达 drawn 后才抽取新条目
+    """
+
+    def __init__(self, playlist_id, mode, media_type, folder, ids, seed=None):
+        self.id = playlist_id
+        self.mode = mode
+        self.media_type = media_type
+        self.folder = folder
+        self.order = array("I", ids)
+        self.pos = 0
+        self.drawn = 0
+        self.cycle = 0
+        self.dead = 0  # order 中已删除的条目数（压缩前的估计）
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self._rng = random.Random(self.seed)
+        self.last_access = time.monotonic()
+
+    def matches(self, entry):
+        return _matches(entry, self.media_type, self.folder)
+
+    def step(self, direction, alive):
+        """按方向移动游标，返回当前条目编号；列表中没有存活条目时返回None
+
+        alive(编号) 判断条目是否仍在目录中
+        """
+        if direction == "prev":
+            return self._prev(alive)
+        if direction == "current":
+            while self.pos > 0:
+                if alive(self.order[self.pos - 1]):
+                    return self.order[self.pos - 1]
+                self.pos -= 1
+        return self._next(alive)
+
+    def _prev(self, alive):
+        order = self.order
+        for pos in range(self.pos - 1, 0, -1):
+            if alive(order[pos - 1]):
+                self.pos = pos
+                return order[pos - 1]
+        # 已在最前：停留在当前条目
+        return self.step("current", alive)
+
+    def _next(self, alive):
+        order = self.order
+        while self.pos < self.drawn:
+            self.pos += 1
+            if alive(order[self.pos - 1]):
+                return order[self.pos - 1]
+        last = None
+        while True:
+            if self.drawn >= len(order):
+                # 全部播放过：压缩后开始新一轮
+                last = order[self.pos - 1] if self.pos else None
+                self.compact(alive)
+                order = self.order
+                if not order:
+                    return None
+                self.pos = self.drawn = 0
+                self.cycle += 1
+            index = self.drawn
+            if self.mode == "random":
+                index = self._rng.randrange(self.drawn, len(order))
+                if order[index] == last and len(order) - self.drawn > 1:
+                    # 新一轮的第一个不与上一轮最后一个重复
+                    index = index + 1 if index + 1 < len(order) else self.drawn
+                order[self.drawn], order[index] = order[index], order[self.drawn]
+            self.drawn += 1
+            self.pos = self.drawn
+            last = None
+            if alive(order[self.pos - 1]):
+                return order[self.pos - 1]
+
+    def compact(self, alive):
+        """去除失效编号（保持顺序与游标位置）"""
+        order = self.order
+        self.pos = sum(1 for item in order[:self.pos] if alive(item))
+        self.drawn = sum(1 for item in order[:self.drawn] if alive(item))
+        self.order = array("I", (item for item in order if alive(item)))
+        self.dead = 0
+
+    def set_mode(self, mode):
+        if mode == self.mode:
+            return
+        self.mode = mode
+        if mode == "sequential":
+            # 编号按目录顺序分配：未播放部分按编号排序即恢复目录顺序
+            self.order[self.drawn:] = array("I", sorted(self.order[self.drawn:]))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "type": self.media_type,
+            "folder": self.folder,
+            "seed": self.seed,
+            "total": len(self.order) - self.dead,
+            "position": self.pos,
+            "played": self.drawn,
+            "remaining": len(self.order) - self.drawn,
+            "cycle": self.cycle
+        }
+
+
+class PlaylistManager:
+    """播放列表集合与条目编号表（on_catalog_changed 注册为目录监听器）
+
+    编号表在创建第一个播放列表时才按当前快照建立，此前监听器不做任何事
+    """
+
+    def __init__(self, catalog, max_playlists=MAX_PLAYLISTS, idle_seconds=IDLE_SECONDS):
+        self.catalog = catalog
+        self.max_playlists = max(1, max_playlists)
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._playlists = collections.OrderedDict()  # 编号 -> Playlist（按最近使用排序）
+        self._entries = None  # 编号 -> MediaEntry（已删除为None）
+        self._id_of = {}      # MediaEntry -> 编号
+        self._removed = 0
+        self.metrics = {"created": 0, "evicted": 0, "steps": 0, "compactions": 0}
+
+    def _alive(self, item):
+        return self._entries[item] is not None
+
+    # ---- 编号表维护 ----
+
+    def _ensure_index(self):
+        if self._entries is None:
+            self._entries = list(self.catalog.snapshot.entries)
+            self._id_of = {entry: i for i, entry in enumerate(self._entries)}
+            self._removed = 0
+
+    def on_catalog_changed(self, snapshot, changes):
+        with self._lock:
+            if self._entries is None:
+                return
+            try:
+                if changes is None:
+                    self._reindex(snapshot.entries)
+                else:
+                    self._apply(changes)
+                self._maybe_compact()
+            except Exception as e:
+                logging.error(f"播放列表更新失败: {str(e)}")
+
+    def _apply(self, changes):
+        """增量变更（可重复应用：建立编号表时已包含的变更会被跳过）"""
+        entries, id_of = self._entries, self._id_of
+        for old, new in changes:
+            item = id_of.pop(old, None) if old is not None else None
+            if new is not None:
+                if new in id_of:
+                    continue
+                if item is not None:
+                    # 同一路径的更新（元数据等）：沿用编号
+                    entries[item] = new
+                    id_of[new] = item
+                    continue
+                item = len(entries)
+                entries.append(new)
+                id_of[new] = item
+                for playlist in self._playlists.values():
+                    if playlist.matches(new):
+                        playlist.order.append(item)
+            elif item is not None:
+                entries[item] = None
+                self._removed += 1
+                for playlist in self._playlists.values():
+                    if playlist.matches(old):
+                        playlist.dead += 1
+
+    def _reindex(self, snapshot_entries):
+        """全量替换：按相对路径沿用原编号，新路径分配新编号并加入各播放列表的未播放部分"""
+        by_path = {entry.rel_path: item for entry, item in self._id_of.items()}
+        entries = [None] * len(self._entries)
+        id_of = {}
+        added = []
+        for entry in snapshot_entries:
+            item = by_path.get(entry.rel_path)
+            if item is None:
+                item = len(entries)
+                entries.append(entry)
+                added.append(item)
+            else:
+                entries[item] = entry
+            id_of[entry] = item
+        self._entries, self._id_of = entries, id_of
+        self._removed = len(entries) - len(id_of)
+        for playlist in self._playlists.values():
+            playlist.compact(self._alive)
+            playlist.order.extend(item for item in added if playlist.matches(entries[item]))
+
+    def _maybe_compact(self):
+        for playlist in self._playlists.values():
+            if playlist.dead > COMPACT_MIN and playlist.dead * 4 > len(playlist.order):
+                playlist.compact(self._alive)
+                self.metrics["compactions"] += 1
+        if self._removed > REINDEX_MIN and self._removed > len(self._id_of):
+            self._renumber()
+
+    def _renumber(self):
+        """去除编号表中已删除的条目，各播放列表的编号随之映射"""
+        mapping = {}
+        entries = []
+        for item, entry in enumerate(self._entries):
+            if entry is not None:
+                mapping[item] = len(entries)
+                entries.append(entry)
+        for playlist in self._playlists.values():
+            playlist.compact(self._alive)
+            playlist.order = array("I", (mapping[item] for item in playlist.order))
+        self._entries = entries
+        self._id_of = {entry: item for item, entry in enumerate(entries)}
+        self._removed = 0
+        self.metrics["compactions"] += 1
+
+    # ---- 播放列表 ----
+
+    def _candidates(self, media_type, folder):
+        return [item for item, entry in enumerate(self._entries)
+                if entry is not None and _matches(entry, media_type, folder)]
+
+    def _evict(self):
+        now = time.monotonic()
+        for playlist_id in [pid for pid, p in self._playlists.items() if now - p.last_access > self.idle_seconds]:
+            del self._playlists[playlist_id]
+            self.metrics["evicted"] += 1
+        while len(self._playlists) >= self.max_playlists:
+            self._playlists.popitem(last=False)
+            self.metrics["evicted"] += 1
+
+    def _touch(self, playlist_id):
+        playlist = self._playlists.get(playlist_id)
+        if playlist is not None:
+            playlist.last_access = time.monotonic()
+            self._playlists.move_to_end(playlist_id)
+        return playlist
+
+    def create(self, mode="random", media_type="all", folder="", seed=None):
+        """创建播放列表，返回其状态字典"""
+        with self._lock:
+            self._ensure_index()
+            self._evict()
+            playlist = Playlist(uuid.uuid4().hex, mode, media_type, folder,
+                                self._candidates(media_type, folder), seed)
+            self._playlists[playlist.id] = playlist
+            self.metrics["created"] += 1
+            return playlist.to_dict()
+
+    def get(self, playlist_id):
+        """播放列表状态字典，不存在时返回None"""
+        with self._lock:
+            playlist = self._touch(playlist_id)
+            return playlist.to_dict() if playlist is not None else None
+
+    def update(self, playlist_id, mode=None, media_type=None, folder=None):
+        """修改播放模式或筛选条件；筛选条件改变时保留仍符合条件的已播放记录，其余符合条件的条目为未播放"""
+        with self._lock:
+            playlist = self._touch(playlist_id)
+            if playlist is None:
+                return None
+            media_type = playlist.media_type if media_type is None else media_type
+            folder = playlist.folder if folder is None else folder
+            if (media_type, folder) != (playlist.media_type, playlist.folder):
+                self._refilter(playlist, media_type, folder)
+            if mode is not None:
+                playlist.set_mode(mode)
+            return playlist.to_dict()
+
+    def _refilter(self, playlist, media_type, folder):
+        entries = self._entries
+
+        def keep(item):
+            return entries[item] is not None and _matches(entries[item], media_type, folder)
+
+        order = playlist.order
+        pos = sum(1 for item in order[:playlist.pos] if keep(item))
+        played = [item for item in order[:playlist.drawn] if keep(item)]
+        played_set = set(played)
+        unplayed = [item for item in self._candidates(media_type, folder) if item not in played_set]
+        playlist.media_type, playlist.folder = media_type, folder
+        playlist.order = array("I", played + unplayed)
+        playlist.pos, playlist.drawn, playlist.dead = pos, len(played), 0
+
+    def step(self, playlist_id, direction):
+        """移动游标：返回 (条目, 状态字典)；播放列表不存在时返回None，列表为空时条目为None"""
+        with self._lock:
+            playlist = self._touch(playlist_id)
+            if playlist is None:
+                return None
+            item = playlist.step(direction, self._alive)
+            self.metrics["steps"] += 1
+            return (self._entries[item] if item is not None else None), playlist.to_dict()
+
+    def delete(self, playlist_id):
+        with self._lock:
+            return self._playlists.pop(playlist_id, None) is not None
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                "playlists": len(self._playlists),
+                "indexed": len(self._id_of) if self._entries is not None else 0,
+                **self.metrics
+            }
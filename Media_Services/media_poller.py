@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轮询式文件变化检测（不依赖inotify等系统事件，用于网络共享、部分Docker绑定挂载）
+每个目录保存签名 (mtime_ns, 媒体文件数, 文件名集合哈希)：每轮只stat目录本身，
+目录mtime变化（或上次列举时mtime过新、无法排除同一时间粒度内的后续变化）时才重新列举该目录。
+原地修改不会改变目录mtime，由每轮轮换复查一批文件的 (大小, 修改时间) 发现。
+新出现/被修改的文件在两轮之间大小与修改时间不变（写入完成）后才上报。
+轮询间隔随变化自适应：有变化时回到最小间隔，无变化时逐步放大到最大间隔。
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+# 目录mtime距列举时刻小于该值时，下一轮仍重新列举（粗粒度时间戳的文件系统上同一秒内的后续变化不会改变mtime）
+COARSE_MTIME_NS = 2_000_000_000
+
+# 无inotify（或事件不可靠）的文件系统类型
+POLLING_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "drvfs", "v9fs", "virtiofs",
+    "fuse.sshfs", "fuse.rclone", "fuse.gcsfuse", "fuse.s3fs", "fuse.grpcfuse", "grpcfuse", "fakeowner", "osxfs",
+}
+
+
+def filesystem_type(path):
+    """返回路径所在文件系统的类型（Linux读取/proc/mounts，Windows区分网络驱动器），未知时返回None"""
+    path = os.path.realpath(path)
+    if os.name == "nt":
+        if path.startswith("\\\\"):
+            return "remote"
+        try:
+            import ctypes
+            drive = os.path.splitdrive(path)[0] + "\\"
+            return "remote" if ctypes.windll.kernel32.GetDriveTypeW(drive) == 4 else None  # DRIVE_REMOTE
+        except Exception:
+            return None
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f if line.strip()]
+    except OSError:
+        return None
+    best, fstype = "", None
+    for mount_point, kind in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, fstype = mount_point, kind
+    return fstype
+
+
+def needs_polling(path):
+    """已知不会产生文件系统事件的挂载类型"""
+    fstype = filesystem_type(path)
+    return fstype == "remote" or fstype in POLLING_FILESYSTEMS
+
+
+def _join(rel_dir, name):
+    return f"{rel_dir}/{name}" if rel_dir else name
+
+
+class _DirState:
+    __slots__ = ("mtime_ns", "count", "name_hash", "files", "subdirs", "ambiguous")
+
+    def __init__(self, mtime_ns, files, subdirs, listed_ns):
+        self.mtime_ns = mtime_ns
+        self.files = files          # 文件名 -> (大小, 修改时间)
+        self.subdirs = subdirs      # 子目录名集合
+        self.count = len(files)
+        self.name_hash = hash(frozenset(files))
+        self.ambiguous = listed_ns - mtime_ns < COARSE_MTIME_NS
+
+
+class DirectoryPoller:
+    """轮询检测器：on_changes(created, modified, deleted) 在轮询线程中调用，参数为绝对路径列表"""
+
+    def __init__(self, root, extensions, on_changes, interval_min=2.0, interval_max=30.0, verify_batch=2000,
+                 known=None):
+        self.root = os.path.abspath(root)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.on_changes = on_changes
+        self.interval_min = interval_min
+        self.interval_max = max(interval_min, interval_max)
+        self.verify_batch = verify_batch
+        self.known = known          # 可选：返回 {相对路径: (大小, 修改时间)}，建立基线时免去逐个stat
+        self.interval = interval_min
+        self._dirs = {}             # 相对目录（""为根） -> _DirState
+        self._pending = {}          # 相对路径 -> (大小, 修改时间, 是否为已知文件)：等待写入完成
+        self._verify = deque()
+        self._stop = threading.Event()
+        self._thread = None
+        self.metrics = {"cycles": 0, "dirs": 0, "files": 0, "relisted": 0, "verified": 0,
+                        "last_cycle_ms": 0.0, "last_cycle_cpu_ms": 0.0, "baseline_ms": 0.0,
+                        "created": 0, "modified": 0, "deleted": 0}
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="media-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        try:
+            self.build_baseline()
+        except Exception as e:
+            logging.error(f"轮询基线建立失败: {str(e)}")
+            return
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"轮询检测错误: {str(e)}")
+
+    def get_metrics(self):
+        return {"interval": round(self.interval, 2), "pending": len(self._pending), **self.metrics}
+
+    # ---- 目录列举 ----
+
+    def _abs(self, rel_path):
+        return os.path.join(self.root, rel_path) if rel_path else self.root
+
+    def _list(self, rel_dir, known=None):
+        """列举目录：返回 (目录mtime_ns, {文件名: (大小, 修改时间)}, 子目录名集合)；目录不存在时抛出OSError"""
+        path = self._abs(rel_dir)
+        mtime_ns = os.stat(path).st_mtime_ns  # 先取mtime：列举期间的变化会在下一轮被发现
+        files, subdirs = {}, set()
+        prefix = rel_dir + "/" if rel_dir else ""
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(entry.name)
+                    elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                        stat = known.get(prefix + entry.name) if known else None
+                        if stat is None:
+                            st = entry.stat()
+                            stat = (st.st_size, st.st_mtime)
+                        files[entry.name] = stat
+                except OSError:
+                    continue
+        return mtime_ns, files, subdirs
+
+    def build_baseline(self):
+        """建立初始状态（不上报变化）"""
+        start = time.perf_counter()
+        known = self.known() if self.known is not None else None
+        self._dirs.clear()
+        self._pending.clear()
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                mtime_ns, files, subdirs = self._list(rel_dir, known)
+            except OSError:
+                continue
+            self._dirs[rel_dir] = _DirState(mtime_ns, files, subdirs, time.time_ns())
+            stack.extend(_join(rel_dir, name) for name in subdirs)
+        self._update_counts()
+        self.metrics["baseline_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        logging.info(f"轮询检测基线: {self.metrics['dirs']}个目录 | {self.metrics['files']}个文件"
+                     f"（{self.metrics['baseline_ms']:.0f}ms）")
+
+    def _update_counts(self):
+        self.metrics["dirs"] = len(self._dirs)
+        self.metrics["files"] = sum(state.count for state in self._dirs.values())
+
+    # ---- 轮询 ----
+
+    def poll(self):
+        """执行一轮检测，返回 (created, modified, deleted) 相对路径列表"""
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        created, modified, deleted = [], [], []
+        relisted = 0
+
+        # 先确认上一轮发现的文件（至少间隔一轮，才能判断写入是否完成），再检查目录
+        self._check_pending(created, modified, deleted)
+        for rel_dir in list(self._dirs):
+            state = self._dirs.get(rel_dir)
+            if state is None:
+                continue  # 已随父目录删除
+            try:
+                mtime_ns = os.stat(self._abs(rel_dir)).st_mtime_ns
+            except FileNotFoundError:
+                self._drop_tree(rel_dir, deleted)
+                continue
+            except OSError:
+                continue
+            if mtime_ns != state.mtime_ns or state.ambiguous:
+                relisted += 1
+                self._relist(rel_dir, state, deleted)
+
+        verified = self._verify_some()
+
+        if created or modified or deleted or relisted:
+            self._update_counts()
+        self.metrics["cycles"] += 1
+        self.metrics["relisted"] = relisted
+        self.metrics["verified"] = verified
+        self.metrics["created"] += len(created)
+        self.metrics["modified"] += len(modified)
+        self.metrics["deleted"] += len(deleted)
+        self.metrics["last_cycle_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        self.metrics["last_cycle_cpu_ms"] = round((time.thread_time() - cpu_start) * 1000, 2)
+
+        # 自适应间隔：有变化（或有等待写入完成的文件）时尽快再查，否则逐步放慢
+        if created or modified or deleted or self._pending:
+            self.interval = self.interval_min
+        else:
+            self.interval = min(self.interval_max, self.interval * 1.5)
+
+        if created or modified or deleted:
+            try:
+                self.on_changes([self._abs(p) for p in created], [self._abs(p) for p in modified],
+                                [self._abs(p) for p in deleted])
+            except Exception as e:
+                logging.error(f"轮询变化处理失败: {str(e)}")
+        return created, modified, deleted
+
+    def _relist(self, rel_dir, state, deleted):
+        try:
+            mtime_ns, files, subdirs = self._list(rel_dir)
+        except FileNotFoundError:
+            self._drop_tree(rel_dir, deleted)
+            return
+        except OSError:
+            return
+        prefix = rel_dir + "/" if rel_dir else ""
+        # 已知文件在同一轮内被原地改写时，进入待确认队列按修改上报（目录状态保留旧值，直到确认写入完成）
+        for name, stat in files.items():
+            known = state.files.get(name)
+            if known is not None and known != stat:
+                self._pending.setdefault(prefix + name, (*stat, True))
+        if len(files) != state.count or hash(frozenset(files)) != state.name_hash:
+            for name in state.files.keys() - files.keys():
+                self._pending.pop(prefix + name, None)
+                deleted.append(prefix + name)
+            for name in files.keys() - state.files.keys():
+                self._pending.setdefault(prefix + name, (*files[name], False))
+            # 新文件写入完成前不记入目录状态，由 _check_pending 确认后加入
+            files = {name: state.files[name] for name in files if name in state.files}
+        else:
+            files = state.files
+        for name in state.subdirs - subdirs:
+            self._drop_tree(prefix + name, deleted)
+        for name in subdirs - state.subdirs:
+            self._add_tree(prefix + name)
+        self._dirs[rel_dir] = _DirState(mtime_ns, files, subdirs, time.time_ns())
+
+    def _add_tree(self, rel_dir):
+        """新出现的子目录：整棵子树的文件进入待确认队列"""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            if current in self._dirs:
+                continue
+            try:
+                mtime_ns, files, subdirs = self._list(current)
+            except OSError:
+                continue
+            for name, stat in files.items():
+                self._pending.setdefault(_join(current, name), (*stat, False))
+            self._dirs[current] = _DirState(mtime_ns, {}, subdirs, time.time_ns())
+            stack.extend(_join(current, name) for name in subdirs)
+
+    def _drop_tree(self, rel_dir, deleted):
+        """目录已删除：其下所有已知文件记为删除"""
+        prefix = rel_dir + "/" if rel_dir else ""
+        for current in [d for d in self._dirs if d == rel_dir or d.startswith(prefix)]:
+            state = self._dirs.pop(current)
+            deleted.extend(_join(current, name) for name in state.files)
+        for rel_path in [p for p in self._pending if p.startswith(prefix)]:
+            del self._pending[rel_path]
+
+    def _check_pending(self, created, modified, deleted):
+        """大小与修改时间在两轮之间保持不变的文件视为写入完成，记入目录状态并上报"""
+        for rel_path, (size, mtime, existed) in list(self._pending.items()):
+            rel_dir, _, name = rel_path.rpartition("/")
+            state = self._dirs.get(rel_dir)
+            try:
+                st = os.stat(self._abs(rel_path))
+            except OSError:
+                del self._pending[rel_path]
+                if existed and state is not None and state.files.pop(name, None) is not None:
+                    deleted.append(rel_path)
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                self._pending[rel_path] = (st.st_size, st.st_mtime, existed)
+                continue
+            del self._pending[rel_path]
+            if state is None:
+                continue
+            state.files[name] = (size, mtime)
+            state.count = len(state.files)
+            state.name_hash = hash(frozenset(state.files))
+            (modified if existed else created).append(rel_path)
+
+    def _verify_some(self):
+        """轮换复查一批已知文件，发现原地修改（目录mtime不会因此变化）"""
+        if not self._verify:
+            self._verify.extend(_join(rel_dir, name) for rel_dir, state in self._dirs.items() for name in state.files)
+        verified = 0
+        while self._verify and verified < self.verify_batch:
+            rel_path = self._verify.popleft()
+            rel_dir, _, name = rel_path.rpartition("/")
+            state = self._dirs.get(rel_dir)
+            known = state.files.get(name) if state is not None else None
+            if known is None or rel_path in self._pending:
+                continue
+            verified += 1
+            try:
+                st = os.stat(self._abs(rel_path))
+            except OSError:
+                continue  # 删除由目录重新列举发现
+            if (st.st_size, st.st_mtime) != known:
+                self._pending[rel_path] = (st.st_size, st.st_mtime, True)
+        return verified
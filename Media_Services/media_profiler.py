@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行时诊断：采样分析器 + 请求分阶段计时
+SamplingProfiler 在独立OS线程上按固定间隔读取所有线程的调用栈（sys._current_frames），
+输出 flamegraph.pl / speedscope 可直接读取的折叠栈格式（"线程;函数;函数 次数"）。
+gevent协程都运行在主线程上，采样到的主线程栈即当时占用事件循环的协程，能看出阻塞来自扫描、广播还是磁盘I/O。
+
+RequestTrace 记录单个请求各阶段（路径解析、stat、读取、序列化等）的耗时，供慢请求日志使用；
+StartupReport 记录服务启动各阶段（导入、初始化、绑定端口、后台扫描等）的起止时间。
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import contextlib
+from collections import Counter
+from time import perf_counter
+
+# 采样线程间隔与单次采样窗口上限（秒）
+DEFAULT_INTERVAL = 0.01
+MAX_DURATION = 300
+
+# 叶子帧落在这些位置的栈视为空闲等待（锁/队列/select/事件循环空转），默认不计入
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),                    # concurrent.futures 空闲工作线程
+    ("_threading.py", "acquire_with_timeout"),   # gevent线程池空闲工作线程
+    ("inotify_c.py", "do_poll"),                 # watchdog 等待文件系统事件
+    ("hub.py", "run"),                           # gevent事件循环空转
+}
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """定时栈采样分析器（同一时刻只运行一个采样窗口）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started = None
+        self._finished = None
+        self._params = {}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration, interval=DEFAULT_INTERVAL, include_idle=False):
+        """开始一个采样窗口；已有窗口在运行时返回False"""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._stacks = Counter()
+            self._samples = 0
+            self._started = time.time()
+            self._finished = None
+            self._params = {"duration": duration, "interval": interval, "include_idle": include_idle}
+            self._thread = threading.Thread(target=self._run, args=(min(duration, MAX_DURATION), interval,
+                                                                    include_idle),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self, duration, interval, include_idle):
+        own_id = threading.get_ident()
+        deadline = perf_counter() + duration
+        stacks = self._stacks
+        while not self._stop.wait(interval) and perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, f"thread-{thread_id}").replace(";", "_"))
+                stacks[";".join(reversed(labels))] += 1
+            self._samples += 1
+        self._finished = time.time()
+
+    def collapsed(self):
+        """折叠栈文本（按次数降序）"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def get_status(self):
+        return {
+            "running": self.running,
+            "started": self._started,
+            "finished": self._finished,
+            "samples": self._samples,
+            "stacks": len(self._stacks),
+            **self._params
+        }
+
+
+class RequestTrace:
+    """单个请求的分阶段计时：mark(阶段名) 记录自上一个标记以来的耗时"""
+    __slots__ = ("start", "_last", "phases")
+
+    def __init__(self):
+        self.start = self._last = perf_counter()
+        self.phases = []
+
+    def mark(self, name):
+        now = perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def summary(self, end=None):
+        """返回 (总耗时ms, [(阶段, ms), ...])，最后一个标记之后的剩余时间记为 other"""
+        end = perf_counter() if end is None else end
+        phases = [(name, round(seconds * 1000, 3)) for name, seconds in self.phases]
+        rest = end - self._last
+        if rest > 0.0001:
+            phases.append(("other", round(rest * 1000, 3)))
+        return round((end - self.start) * 1000, 3), phases
+
+
+class StartupReport:
+    """启动阶段计时：各阶段记录相对起点的开始时间与耗时（后台阶段与主线程阶段可以重叠）"""
+
+    def __init__(self, origin=None):
+        self.origin = perf_counter() if origin is None else origin
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            end = perf_counter()
+            with self._lock:
+                self.phases.append({
+                    "phase": name,
+                    "start_ms": round((start - self.origin) * 1000, 1),
+                    "duration_ms": round((end - start) * 1000, 1),
+                    "thread": threading.current_thread().name
+                })
+
+    def mark(self, name):
+        """记录一个时间点（耗时为0的阶段，如"开始监听"）"""
+        with self.phase(name):
+            pass
+
+    def to_dict(self):
+        with self._lock:
+            phases = list(self.phases)
+        return {
+            "elapsed_ms": round((perf_counter() - self.origin) * 1000, 1),
+            "phases": phases
+        }
+
+    def log(self):
+        with self._lock:
+            phases = list(self.phases)
+        # 整个报告作为一条日志输出（逐行输出会被按调用位置的日志限速截断）
+        lines = ["启动耗时:"]
+        for item in phases:
+            lines.append(f"  {item['phase']:<16} 开始 {item['start_ms']:>9.1f}ms | 耗时 {item['duration_ms']:>9.1f}ms"
+                         f" | {item['thread']}")
+        logging.info("\n".join(lines))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+保留策略（服务内定时清理已观看的媒体）
+策略是声明式的：最后观看超过N天、媒体总大小上限、最少观看次数、保护收藏。
+候选按最后观看时间从旧到新遍历观看历史，只处理目录中存在的文件（大小取自目录条目，不逐个stat/哈希）；
+删除分成小时间片进行，每片之间让出CPU，不影响请求处理。
+删除前移入备份目录（同一文件系统内为改名，不复制数据），每轮的删除日志在一个事务中写入 deletion_log。
+"""
+
+import os
+import time
+import logging
+import threading
+from time import perf_counter
+
+from media_manager import MediaFileManager, move_to_backup
+
+# 每个时间片的耗时上限与片间暂停（秒）
+SLICE_SECONDS = 0.05
+SLICE_PAUSE = 0.2
+# 服务启动后首轮清理的延迟上限（秒，等待目录加载与元数据提取平稳）
+FIRST_RUN_DELAY = 60
+# 最近一轮的删除明细最多保留条数（/admin/retention）
+MAX_REPORTED = 200
+
+
+class RetentionPolicy:
+    """保留策略：max_age_days / max_total_bytes 为0表示不限，两者都为0时不删除任何文件"""
+
+    def __init__(self, max_age_days=0, max_total_bytes=0, min_watch_count=1, protect_favorites=True):
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self.min_watch_count = min_watch_count
+        self.protect_favorites = protect_favorites
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_age_days=config["retention_max_age_days"],
+            max_total_bytes=int(config["retention_max_total_gb"] * 1024 * 1024 * 1024),
+            min_watch_count=config["retention_min_watch_count"],
+            protect_favorites=config["retention_protect_favorites"]
+        )
+
+    @property
+    def active(self):
+        return bool(self.max_age_days or self.max_total_bytes)
+
+    def to_dict(self):
+        return {
+            "max_age_days": self.max_age_days,
+            "max_total_bytes": self.max_total_bytes,
+            "min_watch_count": self.min_watch_count,
+            "protect_favorites": self.protect_favorites
+        }
+
+
+class RetentionEngine:
+    """定时按策略删除文件
+
+    catalog 提供候选文件的路径与大小及媒体总大小；on_removed(rel_paths) 在每个时间片删除文件后调用，
+    由服务把条目移出目录并通知客户端
+    """
+
+    def __init__(self, catalog, history_db, policy, root, backup_dir=None, interval=3600, batch_size=20,
+                 on_removed=None):
+        self.catalog = catalog
+        self.history_db = history_db
+        self.policy = policy
+        self.root = root
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.on_removed = on_removed
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.last_run = None
+        self.metrics = {"runs": 0, "deleted": 0, "deleted_bytes": 0, "failed": 0}
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="media-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _loop(self):
+        delay = min(self.interval, FIRST_RUN_DELAY)
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"保留策略执行失败: {str(e)}")
+            delay = self.interval
+
+    def get_status(self):
+        return {
+            "running": self._run_lock.locked(),
+            "scheduled": self.is_alive(),
+            "interval_seconds": self.interval,
+            "policy": self.policy.to_dict(),
+            "backup_dir": self.backup_dir,
+            "last_run": self.last_run,
+            **self.metrics
+        }
+
+    # ---- 执行 ----
+
+    def run_once(self, dry_run=False):
+        """执行一轮：dry_run 时只列出将被删除的文件。已有一轮在进行时返回None"""
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            return self._run(dry_run)
+        finally:
+            self._run_lock.release()
+
+    def _run(self, dry_run):
+        policy = self.policy
+        started = time.time()
+        report = {"started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)), "dry_run": dry_run,
+                  "deleted": 0, "deleted_bytes": 0, "failed": 0, "files": []}
+        if not policy.active or not self.history_db or not os.path.exists(self.history_db):
+            report["skipped"] = "未设置保留策略" if not policy.active else "观看历史数据库不存在"
+            self.last_run = report
+            return report
+
+        manager = MediaFileManager(self.root, self.history_db)
+        cutoff = manager.utc_cutoff(policy.max_age_days) if policy.max_age_days else None
+        excess = self.catalog.snapshot.tree.total_bytes - policy.max_total_bytes if policy.max_total_bytes else 0
+        log_rows = []
+        removed = []
+        slice_start, slice_count = perf_counter(), 0
+
+        candidates = manager.iter_retention_candidates(policy.min_watch_count, policy.protect_favorites)
+        for rows in candidates:
+            done = False
+            for file_path, file_hash, watch_count, last_watch in rows:
+                if self._stop.is_set():
+                    done = True
+                    break
+                expired = cutoff is not None and last_watch is not None and last_watch <= cutoff
+                if not expired and excess <= 0:
+                    done = True  # 候选按最后观看时间排序，之后的记录都不会过期
+                    break
+                entry = self.catalog.get(str(file_path).replace("\\", "/"))
+                if entry is None:
+                    continue  # 文件已不在目录中（已删除、超大小或不在当前扫描目录下）
+                reason = f"保留策略: 超过{policy.max_age_days}天未观看" if expired else "保留策略: 超出总容量上限"
+                if len(report["files"]) < MAX_REPORTED:
+                    report["files"].append({"file": entry.rel_path, "size": entry.size, "last_watch": last_watch,
+                                            "watch_count": watch_count, "reason": reason})
+                if dry_run:
+                    report["deleted"] += 1
+                    report["deleted_bytes"] += entry.size
+                    excess -= entry.size
+                    continue
+
+                if self._remove(entry):
+                    log_rows.append((entry.rel_path, file_hash or "", reason))
+                    removed.append(entry.rel_path)
+                    report["deleted"] += 1
+                    report["deleted_bytes"] += entry.size
+                    excess -= entry.size
+                else:
+                    report["failed"] += 1
+                slice_count += 1
+                # 时间片用完：通知目录更新，暂停后继续
+                if slice_count >= self.batch_size or perf_counter() - slice_start >= SLICE_SECONDS:
+                    self._flush(removed)
+                    removed = []
+                    self._stop.wait(SLICE_PAUSE)
+                    slice_start, slice_count = perf_counter(), 0
+            if done:
+                break
+        candidates.close()
+
+        self._flush(removed)
+        if log_rows:
+            manager.log_deletions(log_rows)
+        if excess > 0 and policy.max_total_bytes:
+            report["capacity_unmet_bytes"] = excess  # 可删除的候选不足以降到上限（未观看/收藏的文件不删除）
+        report["elapsed_ms"] = round((time.time() - started) * 1000, 1)
+        if not dry_run:
+            self.metrics["runs"] += 1
+            self.metrics["deleted"] += report["deleted"]
+            self.metrics["deleted_bytes"] += report["deleted_bytes"]
+            self.metrics["failed"] += report["failed"]
+            if report["deleted"] or report["failed"]:
+                logging.info(f"保留策略: 删除{report['deleted']}个文件（{report['deleted_bytes'] / 1024 / 1024:.1f}MB）"
+                             f"，失败{report['failed']}个，耗时{report['elapsed_ms']:.0f}ms")
+        self.last_run = report
+        return report
+
+    def _remove(self, entry):
+        """删除（或移入备份目录）单个文件；文件在入库后被修改过时跳过"""
+        path = entry.path
+        try:
+            st = os.stat(path)
+            if (st.st_size, st.st_mtime) != (entry.size, entry.last_modified):
+                return False
+            if self.backup_dir:
+                move_to_backup(path, self.backup_dir)
+            else:
+                os.remove(path)
+            return True
+        except OSError as e:
+            logging.warning(f"保留策略删除失败: {entry.rel_path} - {str(e)}")
+            return False
+
+    def _flush(self, removed):
+        if removed and self.on_removed is not None:
+            try:
+                self.on_removed(removed)
+            except Exception as e:
+                logging.error(f"保留策略更新目录失败: {str(e)}")
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名搜索索引
+文件名与目录名切分为词（字母/汉字连续段、数字连续段），建立 词 -> 条目 的倒排索引；
+查询词先在词表上匹配（前缀 / 词内子串 / 模糊），从最有选择性的查询词出发合并倒排表，其余查询词逐条校验。
+单个宽泛查询词（匹配条目过多）时按相关度顺序扫描取页并估算总数，不展开全部结果。
+目录变更通过监听器增量送入后台线程更新索引，全量替换时在后台重建后整体切换
+"""
+
+import re
+import queue
+import heapq
+import bisect
+import difflib
+import logging
+import threading
+from array import array
+from collections import Counter
+
+# 模糊匹配：词表上按三元组命中数取前若干个候选词，相似度（difflib比率）不低于阈值才算匹配
+FUZZY_CANDIDATES = 200
+FUZZY_MIN_SIMILARITY = 0.75
+# 匹配结果不超过该数量时逐条计算相关度排序，否则按匹配词的相关度顺序取页
+SCORE_ALL_LIMIT = 300
+# 单个查询词匹配条目数上限：不超过时精确计算结果集，超过时扫描取页并估算总数
+EXACT_LIMIT = 20000
+# 扫描取页时最多检查的条目数（类型过滤后过于稀疏），仍未取满一页则退回精确计算
+SCAN_LIMIT = 5000
+# 数字查询词不少于该位数时按前缀匹配（年份、日期、编号前缀），更短的数字（序号）只做完全匹配，
+# 查询的最后一个词除外（边输入边搜索）
+NUMBER_PREFIX_MIN = 4
+# 逐条校验一个条目与展开一个倒排项的耗时比，用于选择逐条校验还是集合交集
+VERIFY_COST = 50
+# 墓碑（已删除条目）超过存活条目的该比例时压缩重建
+COMPACT_RATIO = 0.5
+# 增量变更每次持锁应用的条数（批次之间释放锁，查询最多等待一片）
+APPLY_SLICE = 1000
+
+# 词的相关度：与查询词完全相同 > 以查询词开头 > 包含查询词 > 模糊匹配（10×相似度）；仅目录匹配时计固定低分
+WORD_EXACT, WORD_PREFIX, WORD_SUBSTRING, DIR_MATCH = 100, 50, 20, 5
+
+_TOKEN = re.compile(r"[^\W\d_]+|\d+")
+_TYPE_CODES = {"image": 0, "video": 1}
+
+
+def tokenize(text):
+    """切分为小写词：字母/汉字连续段与数字连续段分开（IMG20230115 -> img, 20230115）"""
+    return _TOKEN.findall(text.lower())
+
+
+def _trigrams(word):
+    padded = f"\x02{word}\x03"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _word_score(term, word):
+    if word == term:
+        return WORD_EXACT
+    return WORD_PREFIX if word.startswith(term) else WORD_SUBSTRING
+
+
+class SearchIndex:
+    """词级倒排索引（非线程安全，由 CatalogSearch 加锁使用）
+
+    条目编号只增不复用，删除只留墓碑；倒排表为按编号递增的 array('I')，
+    文件名中的词与目录名中的词分别建表（目录匹配的相关度较低）
+    """
+
+    def __init__(self, entries=()):
+        self._docs = []            # 编号 -> MediaEntry（已删除为None）
+        self._types = bytearray()  # 编号 -> 类型代码
+        self._doc_of = {}          # MediaEntry -> 编号
+        self._dead = set()         # 已删除的编号
+        self._name_postings = {}   # 词 -> array('I') 文件名包含该词的条目
+        self._dir_postings = {}    # 词 -> array('I') 目录名包含该词的条目
+        self._dir_words = {}       # rel_dir -> 目录名中的词
+        self._words = set()        # 词表
+        self._vocabulary = []      # 有序词表（前缀匹配）
+        self._word_grams = {}      # 三元组 -> 非数字词集合（子串与模糊匹配）
+        for entry in entries:
+            self.add(entry)
+
+    @property
+    def live(self):
+        return len(self._doc_of)
+
+    def needs_compaction(self):
+        return len(self._dead) > 10000 and len(self._dead) > self.live * COMPACT_RATIO
+
+    # ---- 维护 ----
+
+    def _add_word(self, word):
+        if word in self._words:
+            return
+        self._words.add(word)
+        bisect.insort(self._vocabulary, word)
+        if word.isdigit():
+            return
+        for gram in _trigrams(word):
+            words = self._word_grams.get(gram)
+            if words is None:
+                words = self._word_grams[gram] = set()
+            words.add(word)
+
+    def _post(self, postings, words, doc):
+        for word in words:
+            posting = postings.get(word)
+            if posting is None:
+                posting = postings[word] = array("I")
+                self._add_word(word)
+            posting.append(doc)
+
+    def add(self, entry):
+        if entry in self._doc_of:
+            return
+        doc = len(self._docs)
+        self._docs.append(entry)
+        self._types.append(_TYPE_CODES[entry.media_type])
+        self._doc_of[entry] = doc
+        dir_words = self._dir_words.get(entry.rel_dir)
+        if dir_words is None:
+            dir_words = self._dir_words[entry.rel_dir] = frozenset(tokenize(entry.rel_dir))
+        self._post(self._name_postings, set(tokenize(entry.name)), doc)
+        self._post(self._dir_postings, dir_words, doc)
+
+    def remove(self, entry):
+        doc = self._doc_of.pop(entry, None)
+        if doc is not None:
+            self._docs[doc] = None
+            self._dead.add(doc)
+
+    def replace(self, old, new):
+        """同一路径的条目更新：文件名未变时直接替换引用，无需改动倒排表"""
+        doc = self._doc_of.get(old)
+        if doc is not None and old.name == new.name and old.rel_dir == new.rel_dir \
+                and old.media_type == new.media_type and new not in self._doc_of:
+            del self._doc_of[old]
+            self._docs[doc] = new
+            self._doc_of[new] = doc
+            return
+        self.remove(old)
+        self.add(new)
+
+    # ---- 查询 ----
+
+    def _match_words(self, term, last=False):
+        """词表中与查询词匹配的词 -> 相关度（数字与不足3字的查询词按前缀，其余按词内子串）"""
+        if term.isdigit() and len(term) < NUMBER_PREFIX_MIN and not last:
+            candidates = [term] if term in self._words else []
+        elif term.isdigit() or len(term) < 3:
+            start = bisect.bisect_left(self._vocabulary, term)
+            stop = bisect.bisect_left(self._vocabulary, term + "\U0010ffff", start)
+            candidates = self._vocabulary[start:stop]
+        else:
+            sets = sorted((self._word_grams.get(term[i:i + 3], set()) for i in range(len(term) - 2)), key=len)
+            candidates = [w for w in sets[0].intersection(*sets[1:]) if term in w]
+        return {word: _word_score(term, word) for word in candidates}
+
+    def _fuzzy_words(self, term):
+        """与查询词相似（容忍错字）的词 -> 相关度"""
+        if len(term) < 4 or term.isdigit():
+            return {}
+        hits = Counter()
+        for gram in _trigrams(term):
+            hits.update(self._word_grams.get(gram, ()))
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(term)
+        words = {}
+        for word, _ in hits.most_common(FUZZY_CANDIDATES):
+            matcher.set_seq1(word)
+            if matcher.real_quick_ratio() >= FUZZY_MIN_SIMILARITY and matcher.quick_ratio() >= FUZZY_MIN_SIMILARITY:
+                ratio = matcher.ratio()
+                if ratio >= FUZZY_MIN_SIMILARITY:
+                    words[word] = 10 * ratio
+        return words
+
+    def _estimate(self, words):
+        """匹配词对应条目数的上界（不展开倒排表）"""
+        name_postings, dir_postings = self._name_postings, self._dir_postings
+        return sum(len(name_postings.get(word, ())) + len(dir_postings.get(word, ())) for word in words)
+
+    def _docs_for(self, words):
+        """匹配词对应的存活条目集合（文件名或目录名包含这些词）"""
+        result = set()
+        for postings in (self._name_postings, self._dir_postings):
+            for word in words:
+                posting = postings.get(word)
+                if posting:
+                    result.update(posting)
+        if self._dead:
+            result -= self._dead
+        return result
+
+    def _ordered_docs(self, words):
+        """按相关度顺序依次产生匹配条目（可能重复，含已删除）：先文件名匹配（按匹配词相关度），后目录匹配"""
+        ordered = [word for word, _ in sorted(words.items(), key=lambda item: -item[1])]
+        for postings in (self._name_postings, self._dir_postings):
+            for word in ordered:
+                yield from postings.get(word, ())
+
+    def _doc_matches(self, doc, word_sets):
+        entry = self._docs[doc]
+        tokens = tokenize(entry.name)
+        tokens.extend(self._dir_words[entry.rel_dir])
+        return all(any(token in words for token in tokens) for words in word_sets)
+
+    def _intersect(self, word_sets, type_code):
+        """各查询词匹配条目的交集（word_sets 按选择性排序）
+
+        从最有选择性的查询词出发；其余查询词匹配条目较少时做集合交集，
+        较多（展开倒排表比逐条校验候选更慢）时留待最后逐条校验
+        """
+        result = self._docs_for(word_sets[0])
+        verify = []
+        for words in word_sets[1:]:
+            if self._estimate(words) < len(result) * VERIFY_COST:
+                result &= self._docs_for(words)
+            else:
+                verify.append(words)
+        if verify:
+            result = {doc for doc in result if self._doc_matches(doc, verify)}
+        if type_code is not None:
+            types = self._types
+            result = {doc for doc in result if types[doc] == type_code}
+        return result
+
+    def _rank(self, result, word_sets, count):
+        """按相关度取前count个：结果较少时逐条计算，否则按最有选择性的查询词的匹配词顺序取页"""
+        docs = self._docs
+        if len(result) <= SCORE_ALL_LIMIT:
+            scored = []
+            for doc in result:
+                entry = docs[doc]
+                tokens = set(tokenize(entry.name))
+                score = 0
+                for words in word_sets:
+                    score += max((words.get(token, 0) for token in tokens), default=0) or DIR_MATCH
+                # 同分时文件名较短、编号较小（扫描时较新）的在前
+                scored.append((score - len(entry.name) / 1000, -doc))
+            return [-neg_doc for _, neg_doc in heapq.nlargest(count, scored)]
+
+        ranked, seen = [], set()
+        for doc in self._ordered_docs(word_sets[0]):
+            if doc in result and doc not in seen:
+                seen.add(doc)
+                ranked.append(doc)
+                if len(ranked) >= count:
+                    break
+        return ranked
+
+    def _scan(self, words, type_code, count):
+        """宽泛的单词查询：按相关度顺序扫描取满count个，按命中比例估算总数；扫描过多仍未取满时返回None"""
+        dead, types = self._dead, self._types
+        ranked, seen = [], set()
+        for doc in self._ordered_docs(words):
+            if doc in seen or doc in dead:
+                continue
+            seen.add(doc)
+            if type_code is None or types[doc] == type_code:
+                ranked.append(doc)
+                if len(ranked) >= count:
+                    break
+            if len(seen) > SCAN_LIMIT:
+                return None
+        else:
+            return ranked, len(ranked)
+        return ranked, max(len(ranked), round(self._estimate(words) * len(ranked) / len(seen)))
+
+    def search(self, query, media_type="all", offset=0, limit=50, fuzzy=True):
+        """返回 (匹配总数, 当前页条目列表, 总数是否为估算值)
+
+        查询切分为词，每个词须匹配文件名或目录名中的某个词（前缀或词内子串）；
+        数字不足4位时只做完全匹配（最后一个词除外）；有查询词在词表中无任何匹配时，该词改用模糊匹配（容忍错字）
+        """
+        terms = tokenize(query)
+        if not terms:
+            return 0, [], False
+        type_code = _TYPE_CODES.get(media_type)
+        page_end = offset + limit
+
+        matches = [self._match_words(term, i == len(terms) - 1) for i, term in enumerate(terms)]
+        word_sets = sorted(matches, key=self._estimate)
+        if len(word_sets) == 1 and self._estimate(word_sets[0]) > EXACT_LIMIT:
+            scanned = self._scan(word_sets[0], type_code, page_end)
+            if scanned is not None:
+                ranked, total = scanned
+                return total, [self._docs[doc] for doc in ranked[offset:page_end]], len(ranked) >= page_end
+
+        result = self._intersect(word_sets, type_code)
+        total = len(result)
+        ranked = self._rank(result, word_sets, page_end) if result else []
+
+        if fuzzy and not total and not all(matches):
+            fuzzy_sets = sorted((words or self._fuzzy_words(term) for term, words in zip(terms, matches)),
+                                key=self._estimate)
+            if all(fuzzy_sets):
+                result = self._intersect(fuzzy_sets, type_code)
+                total = len(result)
+                ranked = self._rank(result, fuzzy_sets, page_end) if result else []
+        return total, [self._docs[doc] for doc in ranked[offset:page_end]], False
+
+
+class CatalogSearch:
+    """目录搜索服务：监听目录变更（on_catalog_changed 注册为目录监听器），在后台线程增量维护索引"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.index = SearchIndex()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.metrics = {"updates": 0, "rebuilds": 0, "queries": 0}
+        threading.Thread(target=self._run, name="search-index", daemon=True).start()
+
+    def on_catalog_changed(self, snapshot, changes):
+        self._queue.put(changes)
+
+    def _run(self):
+        while True:
+            changes = self._queue.get()
+            try:
+                if changes is None:
+                    self._rebuild()
+                else:
+                    for start in range(0, len(changes), APPLY_SLICE):
+                        with self._lock:
+                            self._apply(changes[start:start + APPLY_SLICE])
+                    if self.index.needs_compaction():
+                        self._rebuild()
+            except Exception as e:
+                logging.error(f"搜索索引更新失败: {str(e)}")
+
+    def _apply(self, changes):
+        index = self.index
+        for old, new in changes:
+            if old is not None and new is not None:
+                index.replace(old, new)
+            elif old is not None:
+                index.remove(old)
+            else:
+                index.add(new)
+        self.metrics["updates"] += len(changes)
+
+    def _rebuild(self):
+        """在锁外按最新快照构建新索引，完成后整体切换（之后排队的增量重复应用是幂等的）"""
+        index = SearchIndex(self.catalog.snapshot.entries)
+        with self._lock:
+            self.index = index
+            self.metrics["rebuilds"] += 1
+
+    def search(self, query, media_type="all", offset=0, limit=50, fuzzy=True):
+        """返回 (匹配总数, 当前页条目列表, 总数是否为估算值)"""
+        with self._lock:
+            self.metrics["queries"] += 1
+            return self.index.search(query, media_type, offset, limit, fuzzy)
+
+    def get_metrics(self):
+        return {"entries": self.index.live, "pending": self._queue.qsize(), **self.metrics}
@@ -2,71 +2,22 @@
 # -*- coding: utf-8 -*-
 """
 媒体文件管理Web服务
-为SillyTavern媒体播放器扩展提供文件删除API
+为SillyTavern媒体播放器扩展提供文件删除、观看历史导出/导入API
 """
 
-import os
-import json
-import time
-import shutil
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 import sqlite3
-from typing import List, Dict, Set
-import hashlib
-from flask import Flask, request, jsonify
+from typing import List, Dict
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import media_manager as history
 
-class MediaFileManager:
-    """媒体文件管理器"""
+class MediaFileManager(history.MediaFileManager):
+    """媒体文件管理器（数据库与观看历史导出/导入沿用 media_manager，删除改为移入回收站）"""
     
     def __init__(self, media_directory: str = "F:\\Download", db_path: str = "media_watch_history.db"):
-        self.media_directory = Path(media_directory)
-        self.db_path = Path(db_path)
-        self._init_database()
-    
-    def _init_database(self):
-        """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 创建观看历史表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS watch_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_path TEXT UNIQUE,
-                file_hash TEXT,
-                watch_count INTEGER DEFAULT 1,
-                first_watch TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_watch TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_favorite BOOLEAN DEFAULT 0,
-                is_marked_for_deletion BOOLEAN DEFAULT 0,
-                user_rating INTEGER DEFAULT 0
-            )
-        """)
-        
-        # 创建删除日志表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS deletion_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_path TEXT,
-                file_hash TEXT,
-                deletion_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                reason TEXT
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
-    
-    def calculate_file_hash(self, file_path: Path) -> str:
-        """计算文件哈希值"""
-        try:
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
-        except Exception as e:
-            print(f"计算文件哈希失败 {file_path}: {e}")
-            return ""
+        super().__init__(media_directory, db_path)
     
     def delete_files(self, file_paths: List[str], backup: bool = True) -> Dict:
         """删除文件并记录日志"""
@@ -135,6 +86,8 @@ def index():
         'version': '1.0.0',
         'endpoints': {
             '/delete_files': 'POST - 批量删除文件',
+            '/watch_history/export': 'GET - 流式导出观看历史（NDJSON，?gzip=1 压缩）',
+            '/watch_history/import': 'POST - 导入观看历史（NDJSON请求体，gzip需设置Content-Encoding）',
             '/health': 'GET - 健康检查'
         }
     })
@@ -181,6 +134,35 @@ def delete_files():
             'status': 'failed'
         }), 500
 
+@app.route('/watch_history/export')
+def export_watch_history():
+    """流式导出观看历史"""
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    chunks = media_manager.iter_watch_history()
+    filename = f"watch_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+    if compress:
+        chunks = history.gzip_stream(chunks)
+        filename += '.gz'
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/watch_history/import', methods=['POST'])
+def import_watch_history():
+    """导入观看历史（请求体逐行读取，不整体载入内存）"""
+    try:
+        compress = request.headers.get('Content-Encoding', '').lower() == 'gzip' \
+            or request.mimetype in ('application/gzip', 'application/x-gzip')
+        results = media_manager.import_watch_history(request.stream, compress=compress)
+        return jsonify({'status': 'completed', **results})
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'status': 'failed'
+        }), 500
+
 if __name__ == '__main__':
     print("=" * 60)
     print("SillyTavern 媒体文件管理Web服务")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大文件流式传输
+磁盘读取交给gevent线程池，等待磁盘时不阻塞hub；按客户端限速，
+每个数据块发送前先让出给API请求（gevent.idle），避免视频流拖慢JSON接口
+"""
+
+import time
+import threading
+
+import gevent
+import gevent.lock
+
+
+def _read_chunk(f, offset, size):
+    """在线程池中执行的读取（seek与read在同一线程内完成）"""
+    f.seek(offset)
+    return f.read(size)
+
+
+class BandwidthLimiter:
+    """按客户端的带宽限制（同一客户端的多个流共享额度）"""
+
+    def __init__(self, rate, burst=0.5):
+        self.rate = rate    # 字节/秒，0为不限速
+        self.burst = burst  # 允许的突发时长（秒）
+        self._next_free = {}  # client -> 额度用尽的时间点
+
+    def acquire(self, client, size):
+        """申请发送size字节的额度，返回等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        if len(self._next_free) > 1024:
+            self._next_free = {k: v for k, v in self._next_free.items() if v > now}
+        next_free = max(self._next_free.get(client, now), now - self.burst) + size / self.rate
+        self._next_free[client] = next_free
+        wait = next_free - now - self.burst
+        if wait > 0:
+            gevent.sleep(wait)
+            return wait
+        return 0.0
+
+
+class FileStream:
+    """可迭代的文件响应体（支持seek，供werkzeug的Range处理使用）"""
+
+    def __init__(self, streamer, f, client):
+        self.streamer = streamer
+        self.file = f
+        self.client = client
+        self.position = 0
+        self.closed = False
+        streamer._stream_opened()
+
+    def seekable(self):
+        return True
+
+    def seek(self, position):
+        self.position = position
+
+    def tell(self):
+        return self.position
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        streamer = self.streamer
+        # API请求优先：hub上没有其他待处理事件时才继续读取下一块
+        gevent.idle()
+        with streamer.read_slots:
+            data = gevent.get_hub().threadpool.apply(
+                _read_chunk, (self.file, self.position, streamer.chunk_size))
+        if not data:
+            self.close()
+            raise StopIteration
+        self.position += len(data)
+        streamer._stream_sent(len(data), streamer.limiter.acquire(self.client, len(data)))
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.file.close()
+            self.streamer._stream_closed()
+
+
+class FileStreamer:
+    """大文件流式传输配置与统计"""
+
+    def __init__(self, min_size=1024 * 1024, chunk_size=256 * 1024, client_rate=0, read_slots=4):
+        self.min_size = min_size
+        self.chunk_size = chunk_size
+        self.limiter = BandwidthLimiter(client_rate)
+        # 限制同时进行的流读取数，为API请求保留线程池容量
+        self.read_slots = gevent.lock.BoundedSemaphore(read_slots)
+        self._lock = threading.Lock()
+        self.metrics = {"active": 0, "streams": 0, "bytes_sent": 0, "throttled_seconds": 0.0}
+
+    def accepts(self, size):
+        return size >= self.min_size
+
+    def open(self, f, client):
+        return FileStream(self, f, client)
+
+    def _stream_opened(self):
+        with self._lock:
+            self.metrics["active"] += 1
+            self.metrics["streams"] += 1
+
+    def _stream_sent(self, size, waited):
+        with self._lock:
+            self.metrics["bytes_sent"] += size
+            self.metrics["throttled_seconds"] += waited
+
+    def _stream_closed(self):
+        with self._lock:
+            self.metrics["active"] -= 1
+
+    def get_metrics(self):
+        with self._lock:
+            return {**self.metrics, "throttled_seconds": round(self.metrics["throttled_seconds"], 3)}
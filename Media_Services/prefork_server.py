@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程服务模式（预派生工作进程）
+目录所有者进程负责扫描与文件监控：全量替换时把目录发布为只读快照文件（/media.bin 二进制格式），
+之后每次发布只通过通道发送自上次发布以来的增量变更；
+N 个工作进程共享同一监听端口处理HTTP请求，收到快照通知时重新内存映射并加载，收到增量时批量应用，并转发WebSocket消息。
+内存映射只是传输方式：快照解码为各工作进程自己的 MediaEntry，每个工作进程都持有一份完整目录（不跨进程共享内存）。
+仅支持提供 os.fork 的平台（Linux/macOS），Windows 下由启动脚本回退为单进程模式
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import random
+import shutil
+import signal
+import socket
+import logging
+import itertools
+import tempfile
+import threading
+
+import gevent
+import gevent.event
+import gevent.lock
+import gevent.socket
+from gevent import pywsgi
+from geventwebsocket.handler import WebSocketHandler
+
+from image_service_optimized import MediaService
+from media_catalog import (
+    LOG_MIN, CatalogExporter, MediaEntry, load_catalog_entries, read_catalog_bin_revision
+)
+
+# 工作进程转发变更命令（/scan、/cleanup）的等待上限（秒）
+COMMAND_TIMEOUT = 600
+
+
+def is_supported():
+    """当前平台是否支持预派生模式"""
+    return hasattr(os, "fork")
+
+
+def _encode_message(msg):
+    return json.dumps(msg, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _change_row(old, new):
+    """增量变更编码：删除为 [rel_path]，新增/更新为 [rel_path, size, media_type, mtime, width, height, duration, codec]"""
+    if new is None:
+        return [old.rel_path]
+    return [new.rel_path, new.size, new.media_type, new.last_modified,
+            new.width, new.height, new.duration, new.codec]
+
+
+# ---------------------------------------------------------------------------
+# 目录所有者进程
+# ---------------------------------------------------------------------------
+
+class SnapshotPublisher:
+    """快照发布器（目录所有者进程）
+
+    全量替换后（或工作进程请求重新同步时）将快照写入临时文件并原子替换共享文件，再通知所有工作进程重新映射；
+    增量变更按版本记录，发布时只发送上次发布以来的变更（变更数超过目录的1/8时改为发布完整快照）；
+    同时替代 WebSocketManager：广播消息在快照发布后按顺序转发给工作进程
+    """
+
+    def __init__(self, service, snapshot_path, channels, min_interval=0.5):
+        self.service = service
+        self.snapshot_path = snapshot_path
+        self.channels = channels
+        self.min_interval = min_interval
+        self.exporter = CatalogExporter()
+        self.published_revision = -1
+        self._pending = []
+        self._deltas = []  # [(版本号, 变更列表或None), ...]，按版本递增
+        self._full = True
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.metrics = {"published": 0, "deltas": 0, "relayed": 0}
+
+    def start(self):
+        threading.Thread(target=self._run, name="snapshot-publisher", daemon=True).start()
+
+    def schedule(self, *_):
+        """请求发布"""
+        self._wakeup.set()
+
+    def on_catalog_changed(self, snapshot, changes):
+        """目录监听器：记录该版本的变更并请求发布"""
+        with self._lock:
+            self._deltas.append((snapshot.revision, changes))
+        self._wakeup.set()
+
+    def request_full(self):
+        """工作进程与增量版本不连续时请求重新同步：下次发布完整快照"""
+        with self._lock:
+            self._full = True
+        self._wakeup.set()
+
+    def broadcast(self, message, key=None):
+        with self._lock:
+            self._pending.append({"type": "broadcast", "message": message, "key": key})
+        self._wakeup.set()
+
+    def get_connection_count(self):
+        return 0
+
+    def get_metrics(self):
+        return {"workers": len(self.channels), "published_revision": self.published_revision, **self.metrics}
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self._publish()
+            except Exception as e:
+                logging.error(f"快照发布失败: {str(e)}")
+            # 限制发布频率：频繁变更合并为一次发布
+            time.sleep(self.min_interval)
+
+    def _publish(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, []
+            full, self._full = self._full, False
+        # 已包含在上次发布中的版本（完整快照读取时已可见）不再发送
+        deltas = [(revision, changes) for revision, changes in deltas if revision > self.published_revision]
+        if deltas:
+            full = (full or deltas[0][0] != self.published_revision + 1
+                    or any(changes is None for _, changes in deltas))
+        if full:
+            self._publish_full()
+        elif deltas:
+            rows = [_change_row(old, new) for _, changes in deltas for old, new in changes]
+            if len(rows) > max(LOG_MIN, self.service.catalog.snapshot.total_count // 8):
+                self._publish_full()
+            else:
+                self._publish_delta(deltas[-1][0], rows)
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for msg in pending:
+            self._send_all(msg)
+            self.metrics["relayed"] += 1
+
+    def _publish_full(self):
+        snapshot = self.service.catalog.snapshot
+        body = self.exporter.encode(snapshot.entries, snapshot.revision, self.service.scan_directory)
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, self.snapshot_path)
+        self.published_revision = snapshot.revision
+        self.metrics["published"] += 1
+        self._send_all({
+            "type": "snapshot",
+            "revision": snapshot.revision,
+            "path": self.snapshot_path,
+            "root": self.service.scan_directory,
+            **self._limits()
+        })
+
+    def _publish_delta(self, revision, rows):
+        base, self.published_revision = self.published_revision, revision
+        self.metrics["deltas"] += 1
+        self._send_all({
+            "type": "delta",
+            "base": base,
+            "revision": revision,
+            "changes": rows,
+            **self._limits()
+        })
+
+    def _limits(self):
+        return {
+            "image_max_size": self.service.media_config["image"]["max_size"],
+            "video_max_size": self.service.media_config["video"]["max_size"]
+        }
+
+    def _send_all(self, msg):
+        for channel in self.channels:
+            channel.send(msg)
+
+
+class OwnerChannel:
+    """目录所有者与单个工作进程之间的通道（换行分隔JSON）"""
+
+    def __init__(self, sock, service, command_lock):
+        self.sock = sock
+        self.service = service
+        self.command_lock = command_lock
+        self.alive = True
+        self.on_resync = None
+        self._send_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._serve, name="worker-channel", daemon=True).start()
+
+    def send(self, msg):
+        if not self.alive:
+            return
+        try:
+            with self._send_lock:
+                self.sock.sendall(_encode_message(msg))
+        except OSError as e:
+            logging.warning(f"工作进程通道已断开: {str(e)}")
+            self.alive = False
+
+    def _serve(self):
+        """处理工作进程转发的变更命令（串行执行）与重新同步请求"""
+        for line in self.sock.makefile("rb"):
+            msg = json.loads(line)
+            if msg.get("type") == "resync":
+                if self.on_resync is not None:
+                    self.on_resync()
+                continue
+            if msg.get("type") != "call":
+                continue
+            try:
+                with self.command_lock:
+                    payload, status = self.service.run_command(msg["method"], msg.get("params", {}))
+            except Exception as e:
+                logging.error(f"命令执行失败: {msg.get('method')} - {str(e)}")
+                payload, status = {"status": "error", "message": str(e)}, 500
+            self.send({"type": "reply", "id": msg["id"], "payload": payload, "status": status})
+        self.alive = False
+
+
+# ---------------------------------------------------------------------------
+# 工作进程
+# ---------------------------------------------------------------------------
+
+class WorkerCatalogLink:
+    """工作进程侧：接收快照通知并重新映射、应用增量变更，转发广播与变更命令"""
+
+    def __init__(self, service, sock, snapshot_path):
+        self.service = service
+        self.sock = sock
+        self.snapshot_path = snapshot_path
+        self._send_lock = gevent.lock.Semaphore()
+        self._calls = {}
+        self._ids = itertools.count(1)
+        self._resyncing = False
+        self.on_owner_lost = None
+
+    def start(self):
+        gevent.spawn(self._read_loop)
+
+    def _set_limits(self, image_max_size, video_max_size):
+        if image_max_size is not None:
+            self.service.media_config["image"]["max_size"] = image_max_size
+        if video_max_size is not None:
+            self.service.media_config["video"]["max_size"] = video_max_size
+
+    def load_snapshot(self, image_max_size=None, video_max_size=None, root=None):
+        """内存映射快照文件，版本号更新时重建本进程目录
+
+        root: 目录所有者经通道告知的扫描目录；快照文件中记录的根目录不被采用，未告知时沿用本进程配置
+        """
+        root = root or self.service.scan_directory
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return  # 快照尚未发布
+        try:
+            revision = read_catalog_bin_revision(mapping)
+            if revision <= self.service.catalog.revision:
+                return
+            # 解码在线程池中进行，避免长时间阻塞hub
+            revision, root, entries = gevent.get_hub().threadpool.apply(load_catalog_entries, (mapping, root))
+        finally:
+            mapping.close()
+
+        self.service.scan_directory = root
+        self._set_limits(image_max_size, video_max_size)
+        self.service.catalog.replace_all(entries, revision)
+        self._resyncing = False
+        logging.info(f"工作进程 {os.getpid()} 加载快照: 版本{revision} | {len(entries)}个条目")
+
+    def apply_delta(self, msg):
+        """在当前版本上批量应用增量变更；版本不连续时请求目录所有者发布完整快照"""
+        catalog = self.service.catalog
+        if msg["revision"] <= catalog.revision:
+            return
+        if msg["base"] != catalog.revision:
+            if not self._resyncing:
+                self._resyncing = True
+                logging.warning(f"工作进程 {os.getpid()} 增量版本不连续（本地{catalog.revision}，增量基于{msg['base']}），请求完整快照")
+                self._send({"type": "resync"})
+            return
+        self._set_limits(msg.get("image_max_size"), msg.get("video_max_size"))
+        root = self.service.scan_directory
+        with catalog.batch(msg["revision"]):
+            for row in msg["changes"]:
+                if len(row) == 1:
+                    catalog.remove(row[0])
+                else:
+                    catalog.upsert(MediaEntry(root, *row))
+
+    def forward(self, method, params):
+        """转发变更命令给目录所有者进程并等待结果"""
+        call_id = next(self._ids)
+        result = gevent.event.AsyncResult()
+        self._calls[call_id] = result
+        try:
+            self._send({"type": "call", "id": call_id, "method": method, "params": params})
+            reply = result.get(timeout=COMMAND_TIMEOUT)
+        except gevent.Timeout:
+            return {"status": "error", "message": "目录所有者进程无响应"}, 504
+        finally:
+            self._calls.pop(call_id, None)
+        return reply["payload"], reply["status"]
+
+    def _send(self, msg):
+        with self._send_lock:
+            self.sock.sendall(_encode_message(msg))
+
+    def _read_loop(self):
+        for line in self.sock.makefile("rb"):
+            try:
+                msg = json.loads(line)
+                msg_type = msg.get("type")
+                if msg_type == "snapshot":
+                    self.load_snapshot(msg.get("image_max_size"), msg.get("video_max_size"), msg.get("root"))
+                elif msg_type == "delta":
+                    self.apply_delta(msg)
+                elif msg_type == "broadcast":
+                    self.service.ws_manager.broadcast(msg["message"], key=msg.get("key"))
+                elif msg_type == "reply":
+                    result = self._calls.get(msg["id"])
+                    if result is not None:
+                        result.set(msg)
+            except Exception as e:
+                logging.error(f"工作进程通道消息处理失败: {str(e)}")
+        logging.error("目录所有者进程已退出，工作进程停止")
+        if self.on_owner_lost is not None:
+            self.on_owner_lost()
+
+
+def _worker_main(listener, channel_sock, snapshot_path):
+    """工作进程入口（fork之后执行）"""
+    gevent.reinit()
+    random.seed()
+
+    service = MediaService()
+    service.read_only = True
+    link = WorkerCatalogLink(
+        service,
+        gevent.socket.socket(channel_sock.family, channel_sock.type, fileno=channel_sock.detach()),
+        snapshot_path
+    )
+    service.command_forwarder = link.forward
+    link.load_snapshot()
+    link.start()
+
+    server = pywsgi.WSGIServer(listener, service.app, handler_class=WebSocketHandler)
+    link.on_owner_lost = server.stop
+    logging.info(f"工作进程 {os.getpid()} 就绪")
+    server.serve_forever()
+
+
+def run_prefork(workers, host="127.0.0.1", port=9000):
+    """启动预派生模式：绑定端口 → 派生工作进程 → 本进程作为目录所有者"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+    listener.setblocking(False)
+
+    # 快照文件放在仅本用户可访问（0700）的私有临时目录中，其他本地用户无法预先创建或替换
+    snapshot_dir = tempfile.mkdtemp(prefix=f"st_media_{port}_")
+    snapshot_path = os.path.join(snapshot_dir, "catalog.bin")
+
+    # 在启动任何线程之前派生工作进程
+    owner_socks = []
+    pids = []
+    for _ in range(workers):
+        owner_sock, worker_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            owner_sock.close()
+            for sock in owner_socks:
+                sock.close()
+            try:
+                _worker_main(listener, worker_sock, snapshot_path)
+            finally:
+                os._exit(0)
+        worker_sock.close()
+        owner_socks.append(owner_sock)
+        pids.append(pid)
+    listener.close()
+
+    def shutdown(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # 目录所有者：扫描、文件监控、快照发布、命令执行
+    service = MediaService()
+    command_lock = threading.Lock()
+    channels = [OwnerChannel(sock, service, command_lock) for sock in owner_socks]
+    publisher = SnapshotPublisher(service, snapshot_path, channels)
+    service.ws_manager = publisher
+    service.catalog.add_listener(publisher.on_catalog_changed)
+    for channel in channels:
+        channel.on_resync = publisher.request_full
+        channel.start()
+    publisher.start()
+
+    logging.info(f"预派生模式: {workers}个工作进程 | 监听 {host}:{port} | 快照 {snapshot_path}")
+    service.init_service()
+    publisher.schedule()
+
+    # 等待工作进程退出
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid in pids:
+            pids.remove(pid)
+            logging.warning(f"工作进程退出: pid={pid} status={status}")
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return 0
@@ -5,28 +5,73 @@
 包含所有优化功能：内存优化、配置管理、增量扫描、缓存、WebSocket管理等
 """
 
+import time
+_STARTED = time.perf_counter()  # 启动计时起点（解释器自身的启动不计入）
+
 import os
 import sys
+import json
 import signal
-import time
+import argparse
+import importlib
+import importlib.util
 from pathlib import Path
 
+# 启动时只检查是否安装，不导入（导入由服务模块按需完成）
+REQUIRED_MODULES = ("flask", "flask_cors", "gevent", "geventwebsocket", "watchdog")
+
+
+class WarmupApp:
+    """服务模块加载完成前的最小WSGI应用：端口绑定后立即可用，/status 报告 warming，其余请求返回503
+
+    服务创建完成后设置 app，之后所有请求转交给服务的Flask应用
+    """
+
+    def __init__(self, startup):
+        self.startup = startup
+        self.app = None
+
+    def __call__(self, environ, start_response):
+        app = self.app
+        if app is not None:
+            return app(environ, start_response)
+        if environ.get("PATH_INFO") == "/status":
+            status = "200 OK"
+            payload = {"active": True, "warming": True, "startup": self.startup.to_dict()}
+        else:
+            status = "503 Service Unavailable"
+            payload = {"status": "error", "message": "服务启动中，请稍后重试"}
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        start_response(status, [
+            ("Content-Type", "application/json; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+            ("Access-Control-Allow-Origin", "*"),
+            ("Retry-After", "1")
+        ])
+        return [body]
+
 def main():
     """主启动函数"""
+    parser = argparse.ArgumentParser(description="优化版本地媒体服务")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="工作进程数（>1 时启用预派生多进程模式，仅Linux/macOS）")
+    args = parser.parse_args()
+    
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from media_logging import configure_stdio
+    configure_stdio()
+    
     print("=" * 80)
     print("优化版本地媒体服务启动器")
     print("=" * 80)
     
     # 检查依赖
-    try:
-        import flask
-        import gevent
-        import watchdog
-        print("✓ 依赖检查通过")
-    except ImportError as e:
-        print(f"✗ 依赖缺失: {e}")
+    missing = [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"✗ 依赖缺失: {', '.join(missing)}")
         print("请运行: pip install -r requirements.txt")
         return 1
+    print("✓ 依赖检查通过")
     
     # 检查优化版本文件
     if not os.path.exists("image_service_optimized.py"):
@@ -34,32 +79,55 @@ def main():
         print("请确保 image_service_optimized.py 文件存在")
         return 1
     
-    # 导入优化版本
-    try:
-        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-        from image_service_optimized import MediaService, pywsgi, WebSocketHandler
-        print("✓ 优化版本加载成功")
-    except Exception as e:
-        print(f"✗ 优化版本加载失败: {e}")
-        return 1
+    from media_profiler import StartupReport
+    startup = StartupReport(origin=_STARTED)
     
     # 信号处理函数
     def signal_handler(signum, frame):
         print("\n接收到终止信号，正在优雅关闭服务...")
         sys.exit(0)
     
+    # 多进程模式：目录所有者进程 + N个工作进程
+    if args.workers > 1:
+        from prefork_server import is_supported, run_prefork
+        if is_supported():
+            print(f"✓ 预派生多进程模式: {args.workers}个工作进程")
+            print("服务地址: http://127.0.0.1:9000")
+            return run_prefork(args.workers)
+        print("✗ 当前平台不支持多进程模式，使用单进程模式")
+    
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
     try:
-        # 创建并启动服务
-        print("正在初始化优化版服务...")
-        media_service = MediaService()
-        media_service.init_service()
+        # 先绑定端口（只导入gevent），服务模块（flask、watchdog等）加载与目录扫描期间 /status 报告 warming
+        with startup.phase("bind"):
+            import gevent
+            from gevent import pywsgi
+            warmup = WarmupApp(startup)
+            server = pywsgi.WSGIServer(('127.0.0.1', 9000), warmup)
+            server.start()
+        startup.mark("listening")
+        print(f"✓ 端口已绑定（{(time.perf_counter() - _STARTED) * 1000:.0f}ms），正在加载服务模块...")
+        
+        # 服务模块在线程池中导入，hub 继续响应 /status
+        try:
+            with startup.phase("imports"):
+                service_module = gevent.get_hub().threadpool.apply(
+                    importlib.import_module, ("image_service_optimized",))
+            print("✓ 优化版本加载成功")
+        except Exception as e:
+            print(f"✗ 优化版本加载失败: {e}")
+            server.stop()
+            return 1
         
-        # 启动服务器
-        server = pywsgi.WSGIServer(('127.0.0.1', 9000), media_service.app, handler_class=WebSocketHandler)
-        print("✓ 服务器启动成功")
+        # 创建服务（目录扫描与文件监控在后台进行）后接管请求
+        with startup.phase("service_init"):
+            media_service = service_module.MediaService(startup=startup)
+        media_service.init_service(background=True)
+        server.handler_class = service_module.WebSocketHandler
+        warmup.app = media_service.app
+        print(f"✓ 服务器启动成功（{(time.perf_counter() - _STARTED) * 1000:.0f}ms，媒体目录后台加载中）")
         print("服务地址: http://127.0.0.1:9000")
         print("按 Ctrl+C 停止服务")
         print("-" * 80)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志限速与启动报告
+同一调用位置每秒超过限速条数的日志会被抑制；ERROR及以上级别与启动报告的各阶段不能因此丢失
+"""
+
+import logging
+
+import pytest
+
+from media_logging import DEFAULT_RATE, RateLimitFilter
+from media_profiler import StartupReport
+
+
+class _Collector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def collector():
+    """根日志器上挂载带限速过滤器（与 configure_logging 的队列处理器相同）的收集器，结束后恢复级别与处理器"""
+    root = logging.getLogger()
+    level, handlers = root.level, root.handlers[:]
+    handler = _Collector()
+    handler.addFilter(RateLimitFilter())
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+    try:
+        yield handler
+    finally:
+        root.handlers = handlers
+        root.setLevel(level)
+
+
+def test_same_call_site_is_rate_limited(collector):
+    for i in range(DEFAULT_RATE * 3):
+        logging.info(f"line {i}")
+    assert collector.messages == [f"line {i}" for i in range(DEFAULT_RATE)]
+
+
+def test_errors_are_not_rate_limited(collector):
+    for i in range(DEFAULT_RATE * 3):
+        logging.error(f"failure {i}")
+    assert collector.messages == [f"failure {i}" for i in range(DEFAULT_RATE * 3)]
+
+
+def test_startup_report_survives_rate_limit(collector):
+    report = StartupReport()
+    names = [f"phase_{i}" for i in range(DEFAULT_RATE * 2)] + ["file_watcher", "ready"]
+    for name in names:
+        report.mark(name)
+
+    report.log()
+
+    logged = "\n".join(collector.messages)
+    assert logged.startswith("启动耗时:")
+    for name in names:
+        assert f"  {name} " in logged
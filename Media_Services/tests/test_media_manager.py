@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+观看历史导入
+无法解析或超出范围的记录只跳过并计数，不影响同一次导入中的其他记录
+"""
+
+import io
+
+from media_manager import MediaFileManager
+
+
+def test_out_of_range_timestamps_are_skipped(tmp_path):
+    manager = MediaFileManager(str(tmp_path), str(tmp_path / "history.db"))
+    lines = [
+        '{"file_path": "/a.png", "last_watch": 1e400}',
+        '{"file_path": "/b.png", "last_watch": Infinity}',
+        '{"file_path": "/c.png", "last_watch": -1e18}',
+        '{"file_path": "/ok.png", "last_watch": "2024-01-02T03:04:05+08:00", "watch_count": 2}',
+    ]
+    results = manager.import_watch_history(io.BytesIO("\n".join(lines).encode("utf-8")))
+    assert results["imported"] == 1
+    assert results["skipped"] == 3
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轮询式文件变化检测
+目录重新列举的同一轮内，已知文件的原地改写也必须按修改上报
+"""
+
+import os
+
+from media_poller import DirectoryPoller
+
+
+def _write(path, data, mtime):
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+
+
+def _poll_until_quiet(poller, cycles=4):
+    created, modified, deleted = set(), set(), set()
+    for _ in range(cycles):
+        c, m, d = poller.poll()
+        created.update(c)
+        modified.update(m)
+        deleted.update(d)
+    return created, modified, deleted
+
+
+def test_rewrite_during_create_is_reported(tmp_path):
+    _write(tmp_path / "old.png", b"a" * 10, 1_000_000)
+    poller = DirectoryPoller(str(tmp_path), (".png",), lambda *_: None, verify_batch=0)
+    poller.build_baseline()
+
+    # 同一轮内：新建一个文件，并原地改写另一个已知文件
+    _write(tmp_path / "new.png", b"b" * 20, 1_000_100)
+    _write(tmp_path / "old.png", b"c" * 30, 1_000_200)
+
+    created, modified, deleted = _poll_until_quiet(poller)
+    assert created == {"new.png"}
+    assert modified == {"old.png"}
+    assert not deleted
+    assert poller._dirs[""].files["old.png"] == (30, 1_000_200)
+
+
+def test_rewrite_during_delete_is_reported(tmp_path):
+    _write(tmp_path / "gone.png", b"a" * 10, 1_000_000)
+    _write(tmp_path / "old.png", b"a" * 10, 1_000_000)
+    poller = DirectoryPoller(str(tmp_path), (".png",), lambda *_: None, verify_batch=0)
+    poller.build_baseline()
+
+    os.remove(tmp_path / "gone.png")
+    _write(tmp_path / "old.png", b"c" * 30, 1_000_200)
+
+    created, modified, deleted = _poll_until_quiet(poller)
+    assert not created
+    assert modified == {"old.png"}
+    assert deleted == {"gone.png"}
@@ -142,6 +142,7 @@ const getExtensionSettings = () => {
     },
     progressUpdateInterval: null,
     serviceDirectory: "",
+    mediaFolder: "",
     isMediaLoading: false,
     currentRandomIndex: -1,
     showMediaUpdateToast: false,
@@ -214,6 +215,15 @@ let controlBarDrag = false;
 let controlBarDragData = null;
 let wsReconnectDelay = 10000;
 let wsReconnectTimer = null;
+// 服务端随机播放列表（/playlists）：游标保存在服务端，key 记录创建时的筛选条件
+let serverPlaylist = {
+  id: null,
+  key: "",
+  state: null,
+  prefetched: null,
+  prefetching: null,
+  unsupported: false,
+};
 
 const createMinimalSettingsPanel = () => {
   if ($(`#${SETTINGS_PANEL_ID}-minimal`).length) return;
@@ -352,7 +362,12 @@ const checkServiceStatus = async () => {
 const fetchMediaList = async (filterType = "all") => {
   const settings = getExtensionSettings();
   try {
-    const res = await fetch(`${settings.serviceUrl}/media?type=${filterType}`);
+    const folderParam = settings.mediaFolder
+      ? `&folder=${encodeURIComponent(settings.mediaFolder)}`
+      : "";
+    const res = await fetch(
+      `${settings.serviceUrl}/media?type=${filterType}${folderParam}`
+    );
     if (!res.ok) throw new Error(`HTTP ${res.status}`);
     const data = await res.json();
     return data.media || [];
@@ -1123,6 +1138,7 @@ const setupWindowEvents = () => {
       settings.randomMediaList = [...mediaList];
       settings.randomPlayedIndices = [];
       settings.currentRandomIndex = -1;
+      resetServerPlaylist();
       toastr.info("切换为随机播放模式");
     } else {
       currentMediaIndex = 0;
@@ -1339,6 +1355,7 @@ const setupWindowEvents = () => {
       currentMediaIndex = 0;
       settings.randomPlayedIndices = [];
       settings.currentRandomIndex = -1;
+      resetServerPlaylist();
       showMedia("current");
       panel.find("#player-media-filter").val(filterType);
       menuBtn
@@ -1456,9 +1473,10 @@ const getRandomMediaIndex = () => {
     toastr.info("随机播放列表已循环，重新开始");
   }
 
+  const played = new Set(settings.randomPlayedIndices);
   let availableIndices = list
     .map((_, i) => i)
-    .filter((i) => !settings.randomPlayedIndices.includes(i));
+    .filter((i) => !played.has(i));
 
   if (availableIndices.length === 0) {
     settings.randomPlayedIndices = [];
@@ -1472,6 +1490,124 @@ const getRandomMediaIndex = () => {
   return randomIndex;
 };
 
+const getServerPlaylistKey = () => {
+  const settings = getExtensionSettings();
+  return `${settings.serviceUrl}|${settings.mediaFilter}|${settings.mediaFolder || ""}`;
+};
+
+// 创建（或复用）服务端随机播放列表；服务端不支持时返回 false，调用方退回本地随机
+const ensureServerPlaylist = async () => {
+  if (serverPlaylist.unsupported) return false;
+  const key = getServerPlaylistKey();
+  if (serverPlaylist.id && serverPlaylist.key === key) return true;
+  if (serverPlaylist.id) resetServerPlaylist();
+
+  const settings = getExtensionSettings();
+  const res = await fetch(`${settings.serviceUrl}/playlists`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      mode: "random",
+      type: settings.mediaFilter,
+      folder: settings.mediaFolder || "",
+    }),
+  });
+  if (res.status === 404 || res.status === 405) {
+    serverPlaylist.unsupported = true;
+    return false;
+  }
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  const data = await res.json();
+  serverPlaylist.id = data.playlist.id;
+  serverPlaylist.key = key;
+  serverPlaylist.state = data.playlist;
+  serverPlaylist.prefetched = null;
+  return true;
+};
+
+const requestServerPlaylistStep = async (direction, retried = false) => {
+  const settings = getExtensionSettings();
+  const res = await fetch(
+    `${settings.serviceUrl}/playlists/${encodeURIComponent(
+      serverPlaylist.id
+    )}/${direction}`,
+    { method: "POST" }
+  );
+  const data = await res.json().catch(() => ({}));
+  if (res.status === 404 && data.playlist) throw new Error("无可用媒体");
+  if (res.status === 404 && !retried) {
+    // 播放列表被服务端淘汰或服务已重启：重建一次
+    serverPlaylist.id = null;
+    if (!(await ensureServerPlaylist())) return null;
+    return requestServerPlaylistStep(direction, true);
+  }
+  if (!res.ok) throw new Error(data.message || `HTTP ${res.status}`);
+  return data;
+};
+
+// 在服务端播放列表上前进/后退，返回 { media, playlist }；不可用时返回 null
+const stepServerPlaylist = async (direction) => {
+  if (serverPlaylist.prefetching) await serverPlaylist.prefetching;
+  if (!(await ensureServerPlaylist())) return null;
+
+  let data = null;
+  if (serverPlaylist.prefetched) {
+    const prefetched = serverPlaylist.prefetched;
+    serverPlaylist.prefetched = null;
+    if (direction === "next") {
+      data = prefetched;
+    } else {
+      // 预取已把服务端游标推进了一步，先退回再执行本次操作
+      await requestServerPlaylistStep("prev");
+    }
+  }
+  if (!data) data = await requestServerPlaylistStep(direction);
+  if (!data) return null;
+  serverPlaylist.state = data.playlist;
+  return data;
+};
+
+// 预取服务端播放列表的下一项，供预加载使用；下一次 "next" 直接取用
+const prefetchServerPlaylist = () => {
+  if (!serverPlaylist.id || serverPlaylist.prefetched) {
+    return Promise.resolve(serverPlaylist.prefetched);
+  }
+  const state = serverPlaylist.state;
+  if (state && state.remaining === 0 && state.position >= state.played) {
+    // 本轮已播完：预取会开始新一轮，服务端无法再退回上一轮，此时不预取
+    return Promise.resolve(null);
+  }
+  const id = serverPlaylist.id;
+  serverPlaylist.prefetching = requestServerPlaylistStep("next")
+    .then((data) => {
+      if (data && serverPlaylist.id === id) serverPlaylist.prefetched = data;
+      return data;
+    })
+    .catch(() => null)
+    .finally(() => {
+      serverPlaylist.prefetching = null;
+    });
+  return serverPlaylist.prefetching;
+};
+
+const resetServerPlaylist = () => {
+  const settings = getExtensionSettings();
+  if (serverPlaylist.id) {
+    fetch(
+      `${settings.serviceUrl}/playlists/${encodeURIComponent(serverPlaylist.id)}`,
+      { method: "DELETE" }
+    ).catch(() => {});
+  }
+  serverPlaylist = {
+    id: null,
+    key: "",
+    state: null,
+    prefetched: null,
+    prefetching: null,
+    unsupported: false,
+  };
+};
+
 const preloadMediaItem = async (url, type) => {
   const settings = getExtensionSettings();
   if (
@@ -1630,20 +1766,37 @@ const showMedia = async (direction) => {
     const status = await checkServiceStatus();
     if (!status.active) throw new Error("媒体服务未连接");
 
-    let mediaUrl, mediaName, mediaType;
+    let mediaUrl, mediaName, mediaType, mediaRelPath;
     const filterType = settings.mediaFilter;
 
+    let serverStep = null;
     if (settings.playMode === "random") {
+      serverStep = await stepServerPlaylist(direction).catch((e) => {
+        if (e.message.includes("无可用媒体")) throw e;
+        console.warn(`[${EXTENSION_ID}] 服务端播放列表不可用，使用本地随机`, e);
+        return null;
+      });
+    }
+
+    if (serverStep) {
+      const media = serverStep.media;
+      mediaUrl = `${settings.serviceUrl}/file/${encodeURIComponent(
+        media.rel_path
+      )}`;
+      mediaName = media.name;
+      mediaType = media.media_type;
+      mediaRelPath = media.rel_path;
+    } else if (settings.playMode === "random") {
       if (settings.randomMediaList.length === 0) {
         settings.randomMediaList = await fetchMediaList(filterType);
         settings.randomPlayedIndices = [];
         settings.currentRandomIndex = -1;
       }
+      if (settings.randomMediaList.length === 0) throw new Error("无可用媒体");
 
       let randomIndex = -1;
       if (direction === "next") {
         randomIndex = getRandomMediaIndex();
-        settings.randomPlayedIndices.push(randomIndex);
       } else if (direction === "prev") {
         if (settings.randomPlayedIndices.length > 1) {
           settings.randomPlayedIndices.pop();
@@ -1671,6 +1824,7 @@ const showMedia = async (direction) => {
       )}`;
       mediaName = media.name;
       mediaType = media.media_type;
+      mediaRelPath = media.rel_path;
     } else {
       if (mediaList.length === 0) {
         mediaList = await fetchMediaList(filterType);
@@ -1695,6 +1849,7 @@ const showMedia = async (direction) => {
       )}`;
       mediaName = media.name;
       mediaType = media.media_type;
+      mediaRelPath = media.rel_path;
     }
 
     currentMediaType = mediaType;
@@ -1764,6 +1919,11 @@ const showMedia = async (direction) => {
         display: "block"
       });
       
+      // 服务端提取的封面帧，避免解码前显示黑屏（无ffmpeg时请求失败，不影响播放）
+      $(videoElement).attr(
+        "poster",
+        `${settings.serviceUrl}/poster/${encodeURIComponent(mediaRelPath)}`
+      );
       $(videoElement).attr("src", mediaUrl);
 
       await new Promise((resolve, reject) => {
@@ -1801,12 +1961,14 @@ const showMedia = async (direction) => {
       $(infoElement).hide();
     }
 
-    const totalCount =
-      settings.playMode === "random"
+    const totalCount = serverStep
+      ? serverStep.playlist.total
+      : settings.playMode === "random"
         ? settings.randomMediaList.length
         : mediaList.length;
-    const currentCount =
-      settings.playMode === "random"
+    const currentCount = serverStep
+      ? serverStep.playlist.position
+      : settings.playMode === "random"
         ? settings.randomPlayedIndices.length
         : currentMediaIndex + 1;
     win
@@ -1841,7 +2003,23 @@ const showMedia = async (direction) => {
     const preloadUrls = [];
     const preloadTypes = [];
     
-    if (mediaType === "image") {
+    if (serverStep) {
+      // 服务端播放列表：预取下一项并预加载，下一次切换直接使用预取结果
+      setTimeout(() => {
+        prefetchServerPlaylist().then((next) => {
+          if (next && next.media.media_type === mediaType) {
+            preloadMediaItem(
+              `${settings.serviceUrl}/file/${encodeURIComponent(
+                next.media.rel_path
+              )}`,
+              mediaType
+            ).then((result) => {
+              preloadedMedia = result;
+            });
+          }
+        });
+      }, 100);
+    } else if (mediaType === "image") {
       for (let i = 1; i <= 2; i++) {
         if (settings.playMode === "random") {
           const nextIndex = getRandomMediaIndex();
@@ -2110,6 +2288,12 @@ const createSettingsPanel = async () => {
                             <button id="update-directory" class="menu-button">更新目录</button>
                         </div>
                         
+                        <div class="settings-row">
+                            <label><i class="fa-solid fa-folder-tree"></i>播放子目录</label>
+                            <input type="text" id="player-media-folder" value="${settings.mediaFolder || ""
+    }" placeholder="相对媒体目录，留空播放全部" />
+                        </div>
+                        
                         <!-- 媒体大小限制 -->
                         <div class="settings-group">
                             <h4 style="margin-top:0;color:#e0e0e0;border-bottom:1px solid #444;padding-bottom:5px;">
@@ -2467,6 +2651,9 @@ const setupSettingsEvents = () => {
       .find("#player-scan-directory")
       .val()
       .trim();
+    const mediaFolder = panel.find("#player-media-folder").val().trim();
+    const folderChanged = mediaFolder !== (settings.mediaFolder || "");
+    settings.mediaFolder = mediaFolder;
     settings.playMode = panel.find("#player-play-mode").val();
     settings.mediaFilter = panel.find("#player-media-filter").val();
 
@@ -2521,6 +2708,7 @@ const setupSettingsEvents = () => {
       startPollingService();
       initWebSocket();
       if (settings.isWindowVisible) $(`#${PLAYER_WINDOW_ID}`).show();
+      if (folderChanged) refreshMediaList();
     }
 
     $(`#${PLAYER_WINDOW_ID}`).toggleClass("no-border", settings.hideBorder);
@@ -2543,6 +2731,7 @@ const setupSettingsEvents = () => {
   panel.find("#clear-random-history").on("click", () => {
     settings.randomPlayedIndices = [];
     settings.currentRandomIndex = -1;
+    resetServerPlaylist();
     saveSafeSettings();
     toastr.success("随机播放记录已清理");
     showMedia("current");
@@ -2572,6 +2761,7 @@ const setupSettingsEvents = () => {
       currentMediaIndex = 0;
       settings.randomPlayedIndices = [];
       settings.currentRandomIndex = -1;
+      resetServerPlaylist();
       panel.find("#player-scan-directory").val(newPath);
       showMedia("current");
     }
@@ -2671,6 +2861,7 @@ const setupSettingsEvents = () => {
       settings.randomMediaList = [...mediaList];
       settings.randomPlayedIndices = [];
       settings.currentRandomIndex = -1;
+      resetServerPlaylist();
     } else {
       currentMediaIndex = 0;
     }
@@ -2691,6 +2882,7 @@ const setupSettingsEvents = () => {
       currentMediaIndex = 0;
       settings.randomPlayedIndices = [];
       settings.currentRandomIndex = -1;
+      resetServerPlaylist();
       showMedia("current");
       win.find(".media-filter-btn").removeClass("active");
       win
@@ -3587,15 +3779,66 @@ const showTransitionEffectPanel = () => {
 
 // ==================== 观看记录功能 ====================
 
+// 单次 /files/stat 请求的路径数上限（与服务端 FILES_STAT_MAX 一致）
+const FILES_STAT_BATCH = 5000;
+
+/**
+ * 从媒体URL（http://localhost:9000/file/相对路径）中提取相对路径，不是媒体URL时返回null
+ */
+const relPathFromMediaUrl = (url) => {
+  const parts = String(url).split('/file/');
+  if (parts.length < 2) return null;
+  try {
+    return decodeURIComponent(parts.slice(1).join('/file/').split('?')[0]);
+  } catch (error) {
+    return null;
+  }
+};
+
+/**
+ * 批量查询文件元数据（POST /files/stat），返回 { 相对路径: {exists, size, last_modified, ...} }；
+ * 服务端不支持或请求失败时返回null，由调用方退回旧的逐个检查方式
+ */
+const statMediaFiles = async (relPaths) => {
+  const settings = getExtensionSettings();
+  const files = {};
+  try {
+    for (let i = 0; i < relPaths.length; i += FILES_STAT_BATCH) {
+      const res = await fetch(`${settings.serviceUrl}/files/stat`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ paths: relPaths.slice(i, i + FILES_STAT_BATCH) }),
+      });
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      Object.assign(files, (await res.json()).files || {});
+    }
+    return files;
+  } catch (error) {
+    console.warn('批量查询文件信息失败:', error);
+    return null;
+  }
+};
+
 /**
  * 计算文件的哈希值（用于唯一标识文件）
  */
 const calculateFileHash = async (filePath) => {
   try {
-    // 使用文件路径和大小作为哈希基础
-    const response = await fetch(filePath, { method: 'HEAD' });
-    const size = response.headers.get('content-length');
-    const lastModified = response.headers.get('last-modified');
+    // 使用文件路径、大小和修改时间作为哈希基础
+    let size, lastModified;
+    const relPath = relPathFromMediaUrl(filePath);
+    const stat = relPath === null ? null : await statMediaFiles([relPath]);
+    if (stat) {
+      const info = stat[relPath];
+      if (!info || !info.exists) throw new Error('文件不存在');
+      // 与HEAD响应头格式一致（Content-Length / Last-Modified），保证已有记录的哈希不变
+      size = String(info.size);
+      lastModified = new Date(info.last_modified * 1000).toUTCString();
+    } else {
+      const response = await fetch(filePath, { method: 'HEAD' });
+      size = response.headers.get('content-length');
+      lastModified = response.headers.get('last-modified');
+    }
     
     // 简单的哈希计算
     const hashString = `${filePath}_${size}_${lastModified}`;
@@ -3607,7 +3850,7 @@ const calculateFileHash = async (filePath) => {
     }
     return Math.abs(hash).toString(16);
   } catch (error) {
-    // 如果HEAD请求失败，使用文件路径作为备用哈希
+    // 如果获取文件信息失败，使用文件路径作为备用哈希
     let hash = 0;
     for (let i = 0; i < filePath.length; i++) {
       const char = filePath.charCodeAt(i);
@@ -3745,9 +3988,18 @@ const batchDeleteWatchedFiles = async (criteria = {}) => {
       return match;
     });
     
-    // 检查文件存在性
+    // 检查文件存在性：一次 /files/stat 批量查询，跳过服务端确认已不存在的文件
+    const relPaths = filteredFiles.map(item => relPathFromMediaUrl(item.filePath));
+    const statResult = await statMediaFiles(
+      [...new Set(relPaths.filter(relPath => relPath !== null))]
+    );
     const filesToDelete = [];
-    for (const item of filteredFiles) {
+    for (const [index, item] of filteredFiles.entries()) {
+      const relPath = relPaths[index];
+      if (statResult && relPath !== null && statResult[relPath] && !statResult[relPath].exists) {
+        console.log(`文件已不存在，跳过删除: ${item.filePath}`);
+        continue;
+      }
       try {
         // 转换文件路径为绝对路径
         let filePath = item.filePath;
@@ -3766,7 +4018,7 @@ const batchDeleteWatchedFiles = async (criteria = {}) => {
           filePath = `F:\\Download\\${filePath}`;
         }
         
-        // 简化文件存在性检查 - 直接尝试删除，让后端处理文件不存在的情况
+        // 无法批量确认的文件（非媒体URL或服务端不支持）直接尝试删除，让后端处理文件不存在的情况
         console.log(`准备删除文件: ${filePath}`);
         filesToDelete.push(item);
       } catch (error) {